@@ -1,13 +1,34 @@
 import streamlit as st
 import json
 import pandas as pd
+import numpy as np
 import gspread
+import requests
 from google.oauth2.service_account import Credentials
 from datetime import datetime
 import time
 import re
 import random
 import smtplib
+import sqlite3
+import base64
+import mimetypes
+from email.message import EmailMessage, MIMEPart
+from email.policy import SMTP as SMTP_POLICY
+from email.utils import formatdate, make_msgid, getaddresses
+import hashlib
+import os
+import threading
+import weakref
+import tracemalloc
+import logging
+from logging.handlers import RotatingFileHandler
+import queue
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import math
+import bisect
+from collections import OrderedDict, deque
 
 # ------------------------------
 # 🔧 PAGE CONFIGURATION
@@ -232,6 +253,22 @@ CUSTOM_CSS = """
         font-size: 16px;
     }
 
+    /* Search hit snippet */
+    .search-snippet {
+        background: #fffbeb;
+        border-left: 6px solid #f59e0b;
+        padding: 12px 18px;
+        margin: 10px 0 18px 20px;
+        border-radius: 10px;
+        font-size: 14px;
+        color: #1e293b;
+    }
+    .search-snippet mark {
+        background: #fde68a;
+        padding: 0 2px;
+        border-radius: 3px;
+    }
+
     /* DRAFT / SENT CARD */
     .draft-card {
         background: linear-gradient(135deg, #fefce8 0%, #fef9c3 100%);
@@ -332,251 +369,2448 @@ SHEET_ID = "1DhqfIYM92gTdQ3yku233tLlkfIZsgcI9MVS_MvNg_Cc"
 # Optional Gmail config via .streamlit/secrets.toml
 GMAIL_EMAIL = st.secrets.gmail.email if "gmail" in st.secrets else None
 GMAIL_PASSWORD = st.secrets.gmail.password if "gmail" in st.secrets else None
+SMTP_SERVER = st.secrets.gmail.get("smtp_server", "smtp.gmail.com") if "gmail" in st.secrets else "smtp.gmail.com"
+SMTP_PORT = int(st.secrets.gmail.get("port", 465)) if "gmail" in st.secrets else 465
 
-def send_mail_smtp(to_address, subject, body):
-    if not GMAIL_EMAIL or not GMAIL_PASSWORD:
-        st.warning("Gmail credentials not configured in secrets.toml.")
-        return False
-    msg = f"From: {GMAIL_EMAIL}\nTo: {to_address}\nSubject: {subject}\n\n{body}"
+SHEETS_SETTINGS = st.secrets.get("sheets", {})
+# e.g. "http://127.0.0.1:8012" to run against benchmarks/sheets_server.py instead of Google.
+SHEETS_API_BASE_URL = SHEETS_SETTINGS.get("api_base_url")
+
+SHEETS_SCOPES = [
+    "https://spreadsheets.google.com/feeds",
+    "https://www.googleapis.com/auth/drive"
+]
+
+def credentials_key(credentials_dict):
+    """Stable hash of a service-account JSON, used to key the shared client pool."""
+    payload = json.dumps(credentials_dict, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+class SheetsAPISession(requests.Session):
+    """Unauthenticated session that sends gspread's Sheets and Drive API calls to base_url instead of Google."""
+    GOOGLE_APIS = ("https://sheets.googleapis.com", "https://www.googleapis.com")
+    
+    def __init__(self, base_url):
+        super().__init__()
+        self.base_url = base_url.rstrip("/")
+    
+    def request(self, method, url, *args, **kwargs):
+        for google_api in self.GOOGLE_APIS:
+            if url.startswith(google_api):
+                url = self.base_url + url[len(google_api):]
+                break
+        return super().request(method, url, *args, **kwargs)
+
+@st.cache_resource(show_spinner=False)
+def _authorized_client(creds_key, _credentials_dict):
+    if SHEETS_API_BASE_URL:
+        return gspread.Client(None, session=SheetsAPISession(SHEETS_API_BASE_URL))
+    # One authorized session per service account, shared by every rerun and
+    # browser session. google-auth refreshes the token on the session only
+    # when it has expired, so no OAuth exchange happens on a warm client.
+    credentials = Credentials.from_service_account_info(_credentials_dict, scopes=SHEETS_SCOPES)
+    return gspread.authorize(credentials)
+
+@st.cache_resource(show_spinner=False)
+def _open_worksheet(creds_key, sheet_id, _client):
+    return _client.open_by_key(sheet_id).sheet1
+
+def get_worksheet(credentials_dict, sheet_id=SHEET_ID):
+    """Pooled handle for the inbox worksheet; skips auth and metadata round trips when warm."""
+    creds_key = credentials_key(credentials_dict)
+    client = _authorized_client(creds_key, credentials_dict)
+    return _open_worksheet(creds_key, sheet_id, client)
+
+def reset_worksheet_pool():
+    # Drop cached worksheet handles so the next call reopens the sheet;
+    # authorized clients stay pooled since google-auth recovers their tokens.
+    _open_worksheet.clear()
+
+SHEET_COLUMN_ALIASES = {
+    'sendername': 'sender name',
+    'senderemail': 'sender email',
+    'ai_reply': 'aireply',
+    'airply': 'aireply'
+}
+
+def normalized_column_name(col):
+    col = str(col).lower().replace(' ', '')
+    return SHEET_COLUMN_ALIASES.get(col, col)
+
+def normalize_sheet_columns(df):
+    df.columns = [normalized_column_name(col) for col in df.columns]
+    
+    if 'priority' not in df.columns:
+        df['priority'] = ''
+    if 'aireply' not in df.columns:
+        df['aireply'] = ''
+    if 'department' not in df.columns:
+        df['department'] = ''
+    if 'attachment' not in df.columns:
+        df['attachment'] = 'No'
+    return classify_emails(df)
+
+def row_fingerprint(values):
+    joined = "\x1f".join(str(v) for v in values)
+    return hashlib.blake2b(joined.encode("utf-8"), digest_size=8).hexdigest()
+
+def sheet_identity_positions(header):
+    """Columns that identify an email row: all but the ones the app writes back."""
+    return [j for j, name in enumerate(header) if normalized_column_name(name) not in SHEET_WRITE_COLUMNS]
+
+def sheet_row_identities(header, columns):
+    positions = sheet_identity_positions(header)
+    return [row_fingerprint(values) for values in zip(*(columns[j] for j in positions))]
+
+def _sheet_row(raw, width):
+    """A values-API row padded/cut to width and numericised as get_all_records would."""
+    row = list(raw[:width])
+    row += [''] * (width - len(row))
+    return gspread.utils.numericise_all(row)
+
+# Rows per ranged read, and how many reads are in flight at once.
+SHEET_FETCH_CHUNK_ROWS = int(SHEETS_SETTINGS.get("fetch_chunk_rows", 20_000))
+SHEET_FETCH_WORKERS = int(SHEETS_SETTINGS.get("fetch_workers", 4))
+
+def _fetch_sheet_chunk(worksheet, a1, width):
+    """One ranged read as a (rows, width) object array of numericised cells, plus per-row fingerprints."""
+    values = worksheet.batch_get([a1])[0]
+    # gspread returns [[]] for a range the API answered with no values.
+    if len(values) == 1 and not values[0]:
+        values = []
+    cells = np.empty((len(values), width), dtype=object)
+    fingerprints = []
+    for i, raw in enumerate(values):
+        row = _sheet_row(raw, width)
+        cells[i] = row
+        fingerprints.append(row_fingerprint(row))
+    return cells, fingerprints
+
+def sheet_grid_rows(worksheet):
+    """Current grid row count of worksheet, fetched from the spreadsheet metadata."""
+    metadata = worksheet.spreadsheet.fetch_sheet_metadata()
+    for sheet in metadata.get('sheets', []):
+        if sheet['properties']['sheetId'] == worksheet.id:
+            return sheet['properties']['gridProperties']['rowCount']
+    return worksheet.row_count
+
+def fetch_sheet_values(worksheet, chunk_rows=SHEET_FETCH_CHUNK_ROWS, max_workers=SHEET_FETCH_WORKERS):
+    """Read the sheet as parallel row ranges; returns (header, columns, fingerprints), one object array per column."""
+    header = worksheet.row_values(1)
+    if not header:
+        return [], [], []
+    width = len(header)
+    last_col = gspread.utils.rowcol_to_a1(1, width).rstrip('1')
+    
+    # row_count is the grid size when the handle was opened, so read the live
+    # one; the API rejects ranges that extend past the grid.
+    rows = sheet_grid_rows(worksheet)
+    ranges = [(s, min(s + chunk_rows - 1, rows)) for s in range(2, rows + 1, chunk_rows)]
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="sheet-fetch") as pool:
+        fetched = list(zip(ranges, pool.map(
+            lambda r: _fetch_sheet_chunk(worksheet, f"A{r[0]}:{last_col}{r[1]}", width), ranges
+        )))
+    
+    # The API drops trailing blank rows from each range; blank rows before the
+    # last row with data are real (empty) records, as in get_all_records.
+    last_data = max((i for i, (_, chunk) in enumerate(fetched) if len(chunk[0])), default=-1)
+    blank = gspread.utils.numericise_all([''] * width)
+    chunks = []
+    for i, ((first, last), (cells, fingerprints)) in enumerate(fetched[:last_data + 1]):
+        missing = (last - first + 1) - len(cells)
+        if i < last_data and missing:
+            filler = np.empty((missing, width), dtype=object)
+            filler[:] = blank
+            cells = np.concatenate([cells, filler])
+            fingerprints = fingerprints + [row_fingerprint(blank)] * missing
+        chunks.append((cells, fingerprints))
+    
+    columns = [np.concatenate([chunk[0][:, j] for chunk in chunks]) if chunks else np.empty(0, dtype=object)
+               for j in range(width)]
+    fingerprints = [fp for chunk in chunks for fp in chunk[1]]
+    return header, columns, fingerprints
+
+def sheet_modified_time(worksheet):
+    """Drive's modifiedTime of the worksheet's spreadsheet, or None when Drive metadata can't be read."""
     try:
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
-            server.login(GMAIL_EMAIL, GMAIL_PASSWORD)
-            server.sendmail(GMAIL_EMAIL, [to_address], msg)
-        return True
-    except Exception as e:
-        st.error(f"Error sending email: {e}")
-        return False
+        return worksheet.spreadsheet.get_lastUpdateTime()
+    except Exception:
+        return None
+
+def sheet_dataset(header, columns, fingerprints, modified):
+    """Enriched inbox frame plus its sync state, built from values fetch_sheet_values already read."""
+    df = pd.DataFrame(dict(enumerate(columns)))
+    df.columns = header
+    # Match the dtypes pd.DataFrame(records) would have inferred, e.g. all-number columns.
+    df = df.infer_objects()
+    
+    # Remember what we loaded so later syncs only merge what moved, and write-backs
+    # can tell whether a sheet row still holds the email it was loaded from.
+    sync_state = {'header': header, 'fingerprints': fingerprints,
+                  'identities': sheet_row_identities(header, columns), 'modified': modified}
+    return enrich_emails(normalize_sheet_columns(df)), sync_state
 
-def load_data_from_gsheet(credentials_dict):
+def fetch_sheet_dataset(worksheet):
+    """Enriched inbox frame plus its sync state; makes no Streamlit calls, so it can run off the script thread."""
+    # Taken before the read, so an edit landing mid-read still looks newer later.
+    modified = sheet_modified_time(worksheet)
+    return sheet_dataset(*fetch_sheet_values(worksheet), modified)
+
+def load_data_from_gsheet(credentials_dict, worksheet=None):
+    # worksheet lets callers load from an already-open sheet, e.g. a local stand-in.
     try:
-        scope = [
-            "https://spreadsheets.google.com/feeds",
-            "https://www.googleapis.com/auth/drive"
-        ]
-        credentials = Credentials.from_service_account_info(credentials_dict, scopes=scope)
-        gc = gspread.authorize(credentials)
-        worksheet = gc.open_by_key(SHEET_ID).sheet1
-        
-        data = worksheet.get_all_records()
-        df = pd.DataFrame(data)
-        
-        df.columns = [col.lower().replace(' ', '') for col in df.columns]
-        
-        column_mapping = {
-            'sendername': 'sender name',
-            'senderemail': 'sender email',
-            'ai_reply': 'aireply',
-            'airply': 'aireply'
-        }
-        
-        for old_col, new_col in column_mapping.items():
-            if old_col in df.columns:
-                df.rename(columns={old_col: new_col}, inplace=True)
-        
-        if 'priority' not in df.columns:
-            df['priority'] = 'medium'
-        if 'aireply' not in df.columns:
-            df['aireply'] = ''
-        if 'department' not in df.columns:
-            df['department'] = 'General'
-        if 'attachment' not in df.columns:
-            df['attachment'] = 'No'
+        worksheet = worksheet if worksheet is not None else get_worksheet(credentials_dict)
+        df, st.session_state['sheet_sync'] = fetch_sheet_dataset(worksheet)
         
         st.success(f"✅ Loaded {len(df)} emails from Google Sheet (Sheet ID: {SHEET_ID})")
         return df
         
     except Exception as e:
+        reset_worksheet_pool()
+        st.session_state.pop('sheet_sync', None)
         st.error(f"Error loading data from Google Sheet: {e}")
         st.warning("Using mock data as fallback...")
         return generate_mock_data(num_emails=25)
 
-def save_draft(email_data, body, credentials_dict):
+def _contiguous_ranges(positions):
+    ranges = []
+    for pos in positions:
+        if ranges and pos == ranges[-1][1] + 1:
+            ranges[-1][1] = pos
+        else:
+            ranges.append([pos, pos])
+    return ranges
+
+def sync_data_from_gsheet(credentials_dict, df, worksheet=None):
+    """Merge appended and edited sheet rows into df, skipping the read while Drive's modifiedTime is unchanged.
+    
+    Returns (df, stats); stats has 'reloaded' when the sheet had to be taken as a
+    whole, and is None after an error, with df returned as it was.
+    """
+    sync_state = st.session_state.get('sheet_sync') or {}
     try:
-        scope = [
-            "https://spreadsheets.google.com/feeds",
-            "https://www.googleapis.com/auth/drive"
-        ]
-        credentials = Credentials.from_service_account_info(credentials_dict, scopes=scope)
-        gc = gspread.authorize(credentials)
-        worksheet = gc.open_by_key(SHEET_ID).sheet1
+        worksheet = worksheet if worksheet is not None else get_worksheet(credentials_dict)
+        modified = sheet_modified_time(worksheet)
+        if modified is not None and modified == sync_state.get('modified'):
+            return df, {'appended': 0, 'changed': 0, 'unmodified': True}
         
-        if 'drafts' not in st.session_state:
-            st.session_state['drafts'] = []
+        # The sheet carries no per-row change marker, so once modifiedTime moves
+        # (our own write-backs move it too) every row is read and diffed; only
+        # the changed and appended rows are re-enriched.
+        header, columns, fingerprints = fetch_sheet_values(worksheet)
+        known = sync_state.get('fingerprints', [])
+        if not header or header != sync_state.get('header') or len(fingerprints) < len(known):
+            # Removed rows or a new header can't be merged by position; take this read as a full load.
+            df, st.session_state['sheet_sync'] = sheet_dataset(header, columns, fingerprints, modified)
+            return df, {'appended': 0, 'changed': 0, 'reloaded': len(df)}
         
-        draft = {
-            'original_email': email_data,
-            'body': body,
-            'timestamp': datetime.now().isoformat(),
-            'subject': f"Re: {email_data.get('subject', '')}"
-        }
-        st.session_state['drafts'].append(draft)
+        positions = np.array([i for i, fp in enumerate(fingerprints) if i >= len(known) or fp != known[i]], dtype=np.int64)
+        sync_state.update(fingerprints=fingerprints, identities=sheet_row_identities(header, columns),
+                          modified=modified)
+        if not len(positions):
+            return df, {'appended': 0, 'changed': 0}
         
-        st.toast("Draft saved to session state (Google Sheet update skipped in mock-up).", icon="📋")
+        fetched = pd.DataFrame(dict(enumerate(col[positions] for col in columns)), index=positions)
+        fetched.columns = header
+        fetched = enrich_emails(normalize_sheet_columns(fetched.infer_objects()))
+        fetched = fetched.reindex(columns=df.columns, fill_value='')
+        updates = fetched[fetched.index < len(df)]
+        additions = fetched[fetched.index >= len(df)]
         
+        # Fetched rows can carry values the coded columns have no category for yet;
+        # set_dataset re-applies the schema to the merged frame.
+        merged = df.astype({col: object for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype)})
+        if len(updates):
+            for col in merged.columns:
+                merged.loc[updates.index, col] = updates[col]
+        if len(additions):
+            merged = pd.concat([merged, additions])
+        
+        return merged, {'appended': len(additions), 'changed': len(updates)}
+    
     except Exception as e:
-        st.error(f"Error saving draft to Google Sheet: {e}")
+        reset_worksheet_pool()
+        st.error(f"Error syncing Google Sheet: {e}")
+        return df, None
 
 # ------------------------------
-# 📝 MOCK DATA GENERATION
+# ✍️ SHEET WRITE-BACK
 # ------------------------------
-def get_initials(name):
-    if not name or name == "Unknown Sender":
-        return "?"
-    parts = name.strip().split()
-    if len(parts) >= 2:
-        return f"{parts[0][0]}{parts[-1][0]}".upper()
-    return name[0].upper() if name else "?"
-
-def generate_mock_data(num_emails=25):
-    mock_senders = [
-        ("Custom All Stars", "customallstars@gmail.com", "Community"),
-        ("Blogz Team", "info@blogz.life", "Community"),
-        ("John Smith", "john.s@sales.com", "Sales"),
-        ("Sarah Johnson", "sarah.j@marketing.com", "Marketing"),
-        ("Mike Chen", "m.chen@tech.io", "IT"),
-        ("Lisa Rodriguez", "lisa.r@hr.company.com", "HR"),
-        ("David Wilson", "d.wilson@finance.com", "Finance"),
-        ("Emily Brown", "emily.b@support.com", "Support"),
-        ("Alex Green", "alex.g@product.com", "Product"),
-        ("Jessica Lee", "jessica.l@legal.com", "Legal"),
-        ("Robert Taylor", "robert.t@operations.com", "Operations"),
-        ("Maria Garcia", "maria.g@research.com", "Research"),
-        ("James Anderson", "james.a@design.com", "Design"),
-        ("Linda Martinez", "linda.m@qa.com", "Quality Assurance"),
-        ("William Thomas", "william.t@security.com", "Security"),
-    ]
+SHEET_FLUSH_INTERVAL = 10.0
+SHEET_FLUSH_MAX_CELLS = 500
+SHEET_FLUSH_BACKOFF_MAX = 300.0
+# Dropped (sheet row, field) conflicts kept for the sidebar warning.
+SHEET_DROPPED_KEEP = 100
+# Header written when a field has no column in the sheet yet.
+SHEET_WRITE_COLUMNS = {'aireply': 'AI Reply', 'draft': 'Draft', 'archived': 'Archived'}
+
+def sheet_row_ref(row_id):
+    """(sheet row number, row identity) for a loaded row id, or None without a sheet load."""
+    sync_state = st.session_state.get('sheet_sync')
+    if not sync_state or row_id is None or not 0 <= int(row_id) < len(sync_state['identities']):
+        return None
+    # Row ids are 0-based data positions at load time; the header is sheet row 1.
+    return int(row_id) + 2, sync_state['identities'][int(row_id)]
+
+class SheetWriteBuffer:
+    """Write-behind buffer of cell updates for one worksheet, coalesced per (sheet row, field)."""
     
-    example_emails = [
-        {
-            "sender name": "Custom All Stars",
-            "sender email": "customallstars@gmail.com",
-            "subject": "ai_systems_checklist",
-            "summary": "Mock summary for AI systems checklist.",
-            "date": "2025-10-09",
-            "attachment": "No",
-            "aireply": "hey there",
-            "department": "Community",
-            "priority": "high"
-        },
+    def __init__(self, open_worksheet, interval=SHEET_FLUSH_INTERVAL, max_cells=SHEET_FLUSH_MAX_CELLS):
+        self.open_worksheet = open_worksheet
+        self.interval = interval
+        self.max_cells = max_cells
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.pending = {}
+        self.header = []
+        self.worksheet = None
+        self.cells_written = 0
+        self.flushes = 0
+        self.conflicts = 0
+        self.dropped = deque(maxlen=SHEET_DROPPED_KEEP)
+        self.last_error = None
+        self.thread = None
+    
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="sheet-writer", daemon=True)
+            self.thread.start()
+        return self
+    
+    def stage(self, header, updates):
+        """Queue (sheet_row, identity, field, value) updates against the given sheet header."""
+        with self.lock:
+            # Keep columns this buffer appended; the caller's header predates them.
+            if list(header) != self.header[:len(header)]:
+                self.header = list(header)
+            for sheet_row, identity, field, value in updates:
+                self.pending[(sheet_row, field)] = (identity, value)
+            full = len(self.pending) >= self.max_cells
+        if full:
+            self.wakeup.set()
+    
+    def pending_count(self):
+        with self.lock:
+            return len(self.pending)
+    
+    def clear_conflicts(self):
+        with self.lock:
+            self.conflicts = 0
+            self.dropped.clear()
+    
+    def _requeue(self, batch):
+        with self.lock:
+            for cell, update in batch.items():
+                self.pending.setdefault(cell, update)
+    
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                batch, self.pending = self.pending, {}
+                header = list(self.header)
+            if not batch:
+                return 0
+            try:
+                written = self._write(batch, header)
+            except Exception as e:
+                self.worksheet = None
+                self.last_error = str(e)
+                self._requeue(batch)
+                raise
+            self.last_error = None
+            return written
+    
+    def _locate(self, worksheet, header, refs):
+        """Map each (sheet_row, identity) to the row now holding that identity, or None."""
+        positions = sheet_identity_positions(header)
+        last_col = gspread.utils.rowcol_to_a1(1, len(header)).rstrip('1')
+        grid_rows = sheet_grid_rows(worksheet)
+        ranges = _contiguous_ranges(sorted({row for row, _ in refs if row <= grid_rows}))
+        live = {}
+        if ranges:
+            value_ranges = worksheet.batch_get([f"A{start}:{last_col}{end}" for start, end in ranges])
+            for (start, end), values in zip(ranges, value_ranges):
+                for offset in range(end - start + 1):
+                    row = _sheet_row(values[offset] if offset < len(values) else [], len(header))
+                    live[start + offset] = row_fingerprint(row[j] for j in positions)
+        located = {ref: ref[0] for ref in refs if live.get(ref[0]) == ref[1]}
+        
+        moved = [ref for ref in refs if ref not in located]
+        if moved:
+            # Rows were inserted, deleted or sorted since the load: one full read to find them.
+            _, columns, _ = fetch_sheet_values(worksheet)
+            identity_rows = {}
+            if len(columns) >= len(header):
+                for i, identity in enumerate(sheet_row_identities(header, columns[:len(header)])):
+                    identity_rows.setdefault(identity, []).append(i + 2)
+            for ref in moved:
+                matches = identity_rows.get(ref[1], [])
+                located[ref] = matches[0] if len(matches) == 1 else None
+        return located
+    
+    def _write(self, batch, header):
+        if self.worksheet is None:
+            self.worksheet = self.open_worksheet()
+        worksheet = self.worksheet
+        located = self._locate(worksheet, header, {(sheet_row, identity) for (sheet_row, _), (identity, _) in batch.items()})
+        
+        columns = {normalized_column_name(name): i for i, name in enumerate(header)}
+        added_headers = {}
+        cells = {}
+        dropped = []
+        for (sheet_row, field), (identity, value) in batch.items():
+            target = located[(sheet_row, identity)]
+            if target is None:
+                dropped.append((sheet_row, field))
+                continue
+            if field not in columns:
+                columns[field] = len(header) + len(added_headers)
+                added_headers[columns[field]] = SHEET_WRITE_COLUMNS.get(field, field)
+            cells[(columns[field], target)] = value
+        if dropped:
+            with self.lock:
+                self.conflicts += len(dropped)
+                self.dropped.extend(dropped)
+        
+        data = [{'range': gspread.utils.rowcol_to_a1(1, col + 1), 'values': [[name]]} for col, name in added_headers.items()]
+        for col, sheet_row in sorted(cells):
+            letter = gspread.utils.rowcol_to_a1(1, col + 1).rstrip('1')
+            value = cells[(col, sheet_row)]
+            last = data[-1] if data else None
+            if last is not None and last.get('col') == col and last['end'] == sheet_row - 1:
+                last['values'].append([value])
+                last['end'] = sheet_row
+                last['range'] = f"{letter}{last['start']}:{letter}{sheet_row}"
+            else:
+                data.append({'range': f"{letter}{sheet_row}", 'values': [[value]], 'col': col, 'start': sheet_row, 'end': sheet_row})
+        
+        if data:
+            # Writes outside the grid are rejected, so widen it before adding columns.
+            needed = len(header) + len(added_headers)
+            if needed > worksheet.col_count:
+                worksheet.add_cols(needed - worksheet.col_count)
+            worksheet.batch_update([{'range': d['range'], 'values': d['values']} for d in data])
+            if added_headers:
+                with self.lock:
+                    if self.header == header:
+                        self.header = header + list(added_headers.values())
+        self.flushes += 1
+        self.cells_written += len(cells)
+        return len(cells)
+    
+    def _run(self):
+        delay = self.interval
+        while True:
+            self.wakeup.wait(delay)
+            self.wakeup.clear()
+            try:
+                self.flush()
+                delay = self.interval
+            except Exception:
+                # Quota and transient API errors: keep the cells and back off.
+                delay = min(delay * 2, SHEET_FLUSH_BACKOFF_MAX)
+
+@st.cache_resource(show_spinner=False)
+def _sheet_writer(creds_key, sheet_id, _client):
+    return SheetWriteBuffer(lambda: _open_worksheet(creds_key, sheet_id, _client)).start()
+
+def get_sheet_writer(credentials_dict, sheet_id=SHEET_ID):
+    creds_key = credentials_key(credentials_dict)
+    return _sheet_writer(creds_key, sheet_id, _authorized_client(creds_key, credentials_dict))
+
+def stage_sheet_updates(credentials_dict, updates):
+    """Queue (row_id, field, value) cell writes for the loaded sheet; returns how many were staged."""
+    sync_state = st.session_state.get('sheet_sync')
+    if not credentials_dict or not sync_state:
+        return 0
+    refs = []
+    for row_id, field, value in updates:
+        ref = sheet_row_ref(row_id)
+        if ref is not None:
+            refs.append((ref[0], ref[1], field, value))
+    if refs:
+        get_sheet_writer(credentials_dict).stage(sync_state['header'], refs)
+    return len(refs)
+
+def save_draft(email_data, body, credentials_dict):
+    draft = {
+        'original_email': email_data,
+        'body': body,
+        'timestamp': datetime.now().isoformat(),
+        'subject': f"Re: {email_data.get('subject', '')}",
+        'to': email_data.get('sender email', '')
+    }
+    mailstore_add(DRAFTS_TABLE, draft)
+    
+    try:
+        staged = stage_sheet_updates(credentials_dict, [(email_data.get('row_id'), 'draft', body)])
+    except Exception as e:
+        st.error(f"Error queueing draft for Google Sheet: {e}")
+        return
+    if staged:
+        st.toast("📋 Draft saved; Google Sheet update queued.", icon="✅")
+    else:
+        st.toast("📋 Draft saved successfully!", icon="✅")
+
+# ------------------------------
+# 📮 SMTP CONNECTION POOL
+# ------------------------------
+SMTP_MAX_CONNECTIONS = 3
+SMTP_NOOP_AFTER_IDLE = 5.0
+SMTP_MAX_IDLE = 240.0
+SMTP_TIMEOUT = 30
+
+class SMTPPool:
+    """Authenticated SMTP sessions kept alive per account and handed out per send."""
+
+    def __init__(self, host, port, username=None, password=None, max_connections=SMTP_MAX_CONNECTIONS):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_connections)
+
+    def _connect(self):
+        if self.port == 465:
+            server = smtplib.SMTP_SSL(self.host, self.port, timeout=SMTP_TIMEOUT)
+        else:
+            server = smtplib.SMTP(self.host, self.port, timeout=SMTP_TIMEOUT)
+            server.ehlo()
+            if server.has_extn("starttls"):
+                server.starttls()
+                server.ehlo()
+        if self.username and self.password:
+            server.login(self.username, self.password)
+        return server
+
+    @staticmethod
+    def _close(server):
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+    def _checkout(self):
+        while True:
+            try:
+                server, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                return self._connect()
+            idle = time.monotonic() - last_used
+            if idle > SMTP_MAX_IDLE:
+                self._close(server)
+                continue
+            if idle > SMTP_NOOP_AFTER_IDLE:
+                try:
+                    if server.noop()[0] != 250:
+                        raise smtplib.SMTPServerDisconnected("NOOP rejected")
+                except (smtplib.SMTPException, OSError):
+                    server.close()
+                    continue
+            return server
+
+    @contextmanager
+    def connection(self):
+        with self._slots:
+            server = self._checkout()
+            try:
+                yield server
+            except Exception as e:
+                # SMTPException subclasses OSError; only a dropped session or a
+                # socket-level error makes the session unusable.
+                if isinstance(e, smtplib.SMTPServerDisconnected) or (
+                        isinstance(e, OSError) and not isinstance(e, smtplib.SMTPException)):
+                    server.close()
+                    raise
+                # The session may be mid-transaction; reset it before reuse.
+                try:
+                    server.rset()
+                except (smtplib.SMTPException, OSError):
+                    server.close()
+                    raise
+                self._idle.put((server, time.monotonic()))
+                raise
+            else:
+                self._idle.put((server, time.monotonic()))
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        try:
+            with self.connection() as server:
+                return server.sendmail(from_addr, to_addrs, msg)
+        except (smtplib.SMTPServerDisconnected, ConnectionError):
+            with self.connection() as server:
+                return server.sendmail(from_addr, to_addrs, msg)
+
+    def close_all(self):
+        while True:
+            try:
+                server, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._close(server)
+
+@st.cache_resource(show_spinner=False)
+def get_smtp_pool(host, port, username, _password):
+    return SMTPPool(host, port, username, _password)
+
+# ------------------------------
+# ✉️ MIME COMPOSITION
+# ------------------------------
+# 57 raw bytes encode to one 76-char base64 line, so chunks of whole lines
+# can be encoded independently and appended to the output as they are made.
+MIME_ENCODE_CHUNK = 57 * 1024
+
+def _base64_size(n):
+    chars = 4 * -(-n // 3)
+    return chars + 2 * max(0, -(-chars // 76) - 1)
+
+def _write_base64(out, offset, buffer):
+    """Encode buffer as CRLF-wrapped base64 into out[offset:], chunk by chunk; returns the new offset."""
+    view = memoryview(buffer)
+    for start in range(0, len(view), MIME_ENCODE_CHUNK):
+        encoded = base64.encodebytes(view[start:start + MIME_ENCODE_CHUNK]).replace(b"\n", b"\r\n")
+        if start + MIME_ENCODE_CHUNK >= len(view):
+            encoded = encoded[:-2]
+        out[offset:offset + len(encoded)] = encoded
+        offset += len(encoded)
+    return offset
+
+def build_mime_message(from_addr, to_address, subject, body, editor_mode="Plain Text", cc_address="", attachments=None):
+    """multipart/alternative (plain + HTML) body plus attachment parts, serialized to a bytearray."""
+    msg = EmailMessage(policy=SMTP_POLICY)
+    msg["From"] = from_addr
+    msg["To"] = to_address
+    if cc_address:
+        msg["Cc"] = cc_address
+    msg["Subject"] = subject
+    msg["Date"] = formatdate(localtime=True)
+    # An explicit domain skips make_msgid's per-call hostname lookup.
+    msg["Message-ID"] = make_msgid(domain=from_addr.rpartition("@")[2] or None)
+    
+    if editor_mode == "HTML":
+        msg.set_content(re.sub('<[^<]+?>', '', body))
+        msg.add_alternative(body, subtype="html")
+    else:
+        msg.set_content(body)
+    
+    placeholders = []
+    if attachments:
+        msg.make_mixed()
+        for i, file in enumerate(attachments):
+            token = f"INBOXKEEP-ATTACHMENT-{i}-{make_msgid().strip('<>')}"
+            part = MIMEPart(policy=SMTP_POLICY)
+            part["Content-Type"] = getattr(file, "type", None) or mimetypes.guess_type(file.name)[0] or "application/octet-stream"
+            part.add_header("Content-Disposition", "attachment", filename=file.name)
+            part["Content-Transfer-Encoding"] = "base64"
+            part.set_payload(token)
+            msg.attach(part)
+            # getvalue() hands back the upload's bytes without copying; getbuffer()
+            # would force BytesIO to unshare (copy) them first.
+            placeholders.append((token.encode("ascii"), file.getvalue()))
+    
+    skeleton = msg.as_bytes()
+    size = len(skeleton) + sum(_base64_size(len(buffer)) - len(token) for token, buffer in placeholders)
+    out = bytearray(size)
+    pos = offset = 0
+    for token, buffer in placeholders:
+        at = skeleton.index(token, pos)
+        out[offset:offset + at - pos] = skeleton[pos:at]
+        offset = _write_base64(out, offset + at - pos, buffer)
+        pos = at + len(token)
+    out[offset:] = skeleton[pos:]
+    return out
+
+def message_recipients(to_address, cc_address=""):
+    return [addr for _, addr in getaddresses([to_address, cc_address or ""]) if addr]
+
+def send_mail_smtp(to_address, subject, body, sent_id=None, cc_address="", editor_mode="Plain Text", attachments=None):
+    """Queue a MIME message on the outbox; background workers deliver it through the SMTP pool."""
+    if not GMAIL_EMAIL or not GMAIL_PASSWORD:
+        st.warning("Gmail credentials not configured in secrets.toml.")
+        return False
+    try:
+        message = build_mime_message(GMAIL_EMAIL, to_address, subject, body, editor_mode, cc_address, attachments)
+        get_outbox().enqueue(GMAIL_EMAIL, message_recipients(to_address, cc_address), message, sent_id=sent_id)
+        return True
+    except Exception as e:
+        st.error(f"Error queueing email: {e}")
+        return False
+
+# ------------------------------
+# 🗂️ LOCAL SNAPSHOT CACHE
+# ------------------------------
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".inboxkeep_cache")
+SNAPSHOT_SCHEMA_VERSION = 3
+# save_snapshot also runs on the refresher thread, where st.* calls have no page to render to.
+snapshot_log = logging.getLogger("inboxkeep.snapshot")
+
+try:
+    import pyarrow.feather as feather
+except ImportError:  # snapshots are an optimisation; the app runs without pyarrow
+    feather = None
+
+def _snapshot_paths(sheet_id):
+    return (
+        os.path.join(CACHE_DIR, f"{sheet_id}.arrow"),
+        os.path.join(CACHE_DIR, f"{sheet_id}.json"),
+    )
+
+def _snapshot_frame(df):
+    # Arrow needs one type per column; sheet cells can mix numbers and text.
+    out = df.reset_index(drop=True)
+    for col in out.columns:
+        if out[col].dtype == object:
+            out[col] = out[col].map(lambda v: "" if v is None or (isinstance(v, float) and pd.isna(v)) else str(v))
+    return out
+
+def save_snapshot(df, sync_state, sheet_id=SHEET_ID):
+    """Persist the normalized inbox as an Arrow IPC file plus a JSON version stamp."""
+    if feather is None:
+        return None
+    data_path, meta_path = _snapshot_paths(sheet_id)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        stamp = hashlib.sha256("".join(sync_state['fingerprints']).encode("utf-8")).hexdigest()[:16]
+        meta = {
+            'schema_version': SNAPSHOT_SCHEMA_VERSION,
+            'sheet_id': sheet_id,
+            'stamp': stamp,
+            'saved_at': datetime.now().isoformat(),
+            'rows': len(df),
+            'sync': sync_state,
+        }
+        feather.write_feather(_snapshot_frame(df), data_path + ".tmp", compression="uncompressed")
+        with open(meta_path + ".tmp", "w") as f:
+            json.dump(meta, f)
+        os.replace(data_path + ".tmp", data_path)
+        os.replace(meta_path + ".tmp", meta_path)
+        return meta
+    except Exception as e:
+        snapshot_log.warning("Could not write local snapshot: %s", e)
+        return None
+
+def load_snapshot(sheet_id=SHEET_ID):
+    if feather is None:
+        return None, None
+    data_path, meta_path = _snapshot_paths(sheet_id)
+    if not (os.path.exists(data_path) and os.path.exists(meta_path)):
+        return None, None
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get('schema_version') != SNAPSHOT_SCHEMA_VERSION or meta.get('sheet_id') != sheet_id:
+            return None, None
+        # Uncompressed IPC can be memory-mapped straight from the page cache.
+        table = feather.read_table(data_path, memory_map=True)
+        return table.to_pandas(), meta
+    except Exception:
+        return None, None
+
+@st.cache_resource(show_spinner=False)
+def _snapshot_validations():
+    return {}
+
+def validate_snapshot_async(worksheet, meta):
+    """Check the snapshot against the live sheet on a background thread."""
+    validations = _snapshot_validations()
+    stamp = meta['stamp']
+    if stamp not in validations:
+        validations[stamp] = 'checking'
+
+        def _check():
+            try:
+                modified = sheet_modified_time(worksheet)
+                if modified is not None and modified == meta['sync'].get('modified'):
+                    fresh = True
+                else:
+                    fresh = fetch_sheet_values(worksheet)[2] == meta['sync']['fingerprints']
+                validations[stamp] = 'fresh' if fresh else 'stale'
+            except Exception:
+                snapshot_log.warning("Snapshot freshness check failed", exc_info=True)
+                validations[stamp] = 'error'
+
+        threading.Thread(target=_check, daemon=True).start()
+    return validations[stamp]
+
+# ------------------------------
+# 🗄️ DRAFTS & SENT MAIL STORE
+# ------------------------------
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".inboxkeep_data")
+MAILSTORE_PATH = os.path.join(DATA_DIR, "mailstore.db")
+DRAFTS_TABLE = "drafts"
+SENT_TABLE = "sent_emails"
+MAILSTORE_COLUMNS = ['timestamp', 'recipient', 'cc', 'subject', 'body', 'editor_mode', 'attachments', 'original_email']
+ORIGINAL_EMAIL_FIELDS = ['sender name', 'sender email', 'subject', 'summary', 'date', 'attachment', 'aireply', 'department', 'priority']
+
+MAILSTORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS {table} (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    recipient TEXT NOT NULL DEFAULT '',
+    cc TEXT NOT NULL DEFAULT '',
+    subject TEXT NOT NULL DEFAULT '',
+    body TEXT NOT NULL DEFAULT '',
+    editor_mode TEXT NOT NULL DEFAULT 'Plain Text',
+    attachments TEXT NOT NULL DEFAULT '[]',
+    original_email TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_{table}_timestamp ON {table}(timestamp);
+CREATE INDEX IF NOT EXISTS idx_{table}_recipient ON {table}(recipient);
+"""
+
+@st.cache_resource(show_spinner=False)
+def get_mail_store(path=MAILSTORE_PATH):
+    """Process-wide SQLite connection (WAL mode) shared by all sessions, with a write lock."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    for table in (DRAFTS_TABLE, SENT_TABLE):
+        conn.executescript(MAILSTORE_SCHEMA.format(table=table))
+    conn.executescript(OUTBOX_SCHEMA)
+    conn.executescript(TEMPLATES_SCHEMA)
+    conn.executescript(AI_REPLY_CACHE_SCHEMA)
+    return conn, threading.Lock()
+
+def _original_email_json(email_data):
+    # Only the sheet fields are kept; derived display columns are rebuilt on load.
+    if not email_data:
+        return None
+    return json.dumps({k: email_data.get(k) for k in ORIGINAL_EMAIL_FIELDS if k in email_data}, default=str)
+
+def mailstore_add(table, record):
+    """Insert a draft/sent record (same dict shape the views use) and return its id."""
+    conn, lock = get_mail_store()
+    values = (
+        record.get('timestamp') or datetime.now().isoformat(),
+        record.get('to') or '',
+        record.get('cc') or '',
+        record.get('subject') or '',
+        record.get('body') or '',
+        record.get('editor_mode') or 'Plain Text',
+        json.dumps(list(record.get('attachments') or [])),
+        _original_email_json(record.get('original_email')),
+    )
+    with lock:
+        cur = conn.execute(
+            f"INSERT INTO {table} ({', '.join(MAILSTORE_COLUMNS)}) VALUES ({', '.join('?' * len(MAILSTORE_COLUMNS))})",
+            values
+        )
+    return cur.lastrowid
+
+def _insert_mail_records(conn, table, records):
+    # Caller holds the store lock and owns the transaction.
+    sql = f"INSERT INTO {table} ({', '.join(MAILSTORE_COLUMNS)}) VALUES ({', '.join('?' * len(MAILSTORE_COLUMNS))})"
+    ids = []
+    for record in records:
+        cur = conn.execute(sql, (
+            record.get('timestamp') or datetime.now().isoformat(),
+            record.get('to') or '',
+            record.get('cc') or '',
+            record.get('subject') or '',
+            record.get('body') or '',
+            record.get('editor_mode') or 'Plain Text',
+            json.dumps(list(record.get('attachments') or [])),
+            _original_email_json(record.get('original_email')),
+        ))
+        ids.append(cur.lastrowid)
+    return ids
+
+def _record_from_row(row):
+    return {
+        'id': row['id'],
+        'timestamp': row['timestamp'],
+        'to': row['recipient'],
+        'cc': row['cc'],
+        'subject': row['subject'],
+        'body': row['body'],
+        'editor_mode': row['editor_mode'],
+        'attachments': json.loads(row['attachments'] or '[]'),
+        'original_email': json.loads(row['original_email']) if row['original_email'] else None,
+    }
+
+def mailstore_page(table, limit, offset=0, newest_first=True):
+    conn, lock = get_mail_store()
+    order = "DESC" if newest_first else "ASC"
+    with lock:
+        rows = conn.execute(
+            f"SELECT * FROM {table} ORDER BY timestamp {order}, id {order} LIMIT ? OFFSET ?",
+            (limit, offset)
+        ).fetchall()
+    return [_record_from_row(row) for row in rows]
+
+def mailstore_count(table):
+    conn, lock = get_mail_store()
+    with lock:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+def mailstore_delete(table, record_id):
+    conn, lock = get_mail_store()
+    with lock:
+        conn.execute(f"DELETE FROM {table} WHERE id = ?", (record_id,))
+
+# ------------------------------
+# 📤 OUTBOX QUEUE
+# ------------------------------
+OUTBOX_TABLE = "outbox"
+OUTBOX_WORKERS = 2
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_BACKOFF_BASE = 5.0
+OUTBOX_POLL_INTERVAL = 1.0
+# Gmail allows roughly 20 messages/minute sustained on a standard account.
+OUTBOX_RATE_PER_MINUTE = float(st.secrets.get("outbox", {}).get("rate_per_minute", 20))
+OUTBOX_BURST = int(st.secrets.get("outbox", {}).get("burst", 5))
+
+OUTBOX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sent_id INTEGER,
+    account TEXT NOT NULL,
+    recipients TEXT NOT NULL,
+    message BLOB NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(status, next_attempt_at);
+CREATE INDEX IF NOT EXISTS idx_outbox_sent_id ON outbox(sent_id);
+"""
+
+class TokenBucket:
+    """Blocking token bucket: `rate` tokens per second, bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+def _is_transient_smtp_error(error):
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return True
+    # Any other SMTPException (e.g. SMTPNotSupportedError) will fail the same way
+    # again; checked before OSError, which it subclasses.
+    if isinstance(error, smtplib.SMTPException):
+        return False
+    return isinstance(error, OSError)
+
+class Outbox:
+    """Persistent send queue in the mail store, drained by background workers."""
+
+    def __init__(self, deliver, workers=OUTBOX_WORKERS):
+        self.deliver = deliver
+        self.workers = workers
+        self.buckets = {}
+        self.buckets_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self._threads = []
+
+    def start(self):
+        conn, lock = get_mail_store()
+        with lock:
+            # Jobs a previous process was sending when it stopped go back in line.
+            conn.execute(f"UPDATE {OUTBOX_TABLE} SET status = 'queued' WHERE status = 'sending'")
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"outbox-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def enqueue(self, account, recipients, message, sent_id=None):
+        now = datetime.now().isoformat()
+        conn, lock = get_mail_store()
+        with lock:
+            cur = conn.execute(
+                f"INSERT INTO {OUTBOX_TABLE} (sent_id, account, recipients, message, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (sent_id, account, json.dumps(recipients), message, now, now)
+            )
+        self.wakeup.set()
+        return cur.lastrowid
+
+    @staticmethod
+    def insert_jobs(conn, account, jobs):
+        """Insert (recipients, message, sent_id) tuples; the caller holds the store lock and owns the transaction."""
+        now = datetime.now().isoformat()
+        conn.executemany(
+            f"INSERT INTO {OUTBOX_TABLE} (sent_id, account, recipients, message, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+            [(sent_id, account, json.dumps(recipients), message, now, now) for recipients, message, sent_id in jobs]
+        )
+
+    def _bucket(self, account):
+        with self.buckets_lock:
+            if account not in self.buckets:
+                self.buckets[account] = TokenBucket(OUTBOX_RATE_PER_MINUTE / 60.0, OUTBOX_BURST)
+            return self.buckets[account]
+
+    def _claim(self):
+        conn, lock = get_mail_store()
+        with lock:
+            row = conn.execute(
+                f"SELECT * FROM {OUTBOX_TABLE} WHERE status = 'queued' AND next_attempt_at <= ? ORDER BY id LIMIT 1",
+                (time.time(),)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    f"UPDATE {OUTBOX_TABLE} SET status = 'sending', updated_at = ? WHERE id = ?",
+                    (datetime.now().isoformat(), row['id'])
+                )
+        return row
+
+    def _finish(self, job_id, status, attempts, error=None, next_attempt_at=0):
+        conn, lock = get_mail_store()
+        with lock:
+            conn.execute(
+                f"UPDATE {OUTBOX_TABLE} SET status = ?, attempts = ?, last_error = ?, next_attempt_at = ?, updated_at = ? WHERE id = ?",
+                (status, attempts, error, next_attempt_at, datetime.now().isoformat(), job_id)
+            )
+
+    def _run(self):
+        while True:
+            job = self._claim()
+            if job is None:
+                self.wakeup.wait(OUTBOX_POLL_INTERVAL)
+                self.wakeup.clear()
+                continue
+            attempts = job['attempts'] + 1
+            self._bucket(job['account']).acquire()
+            try:
+                self.deliver(job['account'], json.loads(job['recipients']), job['message'])
+            except Exception as e:
+                if _is_transient_smtp_error(e) and attempts < OUTBOX_MAX_ATTEMPTS:
+                    delay = OUTBOX_BACKOFF_BASE * (2 ** (attempts - 1)) * random.uniform(0.8, 1.2)
+                    self._finish(job['id'], 'queued', attempts, str(e), time.time() + delay)
+                else:
+                    self._finish(job['id'], 'failed', attempts, str(e))
+            else:
+                self._finish(job['id'], 'sent', attempts)
+
+def outbox_retry(job_id):
+    conn, lock = get_mail_store()
+    with lock:
+        conn.execute(
+            f"UPDATE {OUTBOX_TABLE} SET status = 'queued', attempts = 0, next_attempt_at = 0, updated_at = ? WHERE id = ? AND status = 'failed'",
+            (datetime.now().isoformat(), job_id)
+        )
+
+def outbox_summary():
+    conn, lock = get_mail_store()
+    with lock:
+        rows = conn.execute(f"SELECT status, COUNT(*) FROM {OUTBOX_TABLE} GROUP BY status").fetchall()
+    return {status: count for status, count in rows}
+
+def outbox_jobs_for(sent_ids):
+    """Latest outbox job per sent record id, for status badges in the Sent view."""
+    if not sent_ids:
+        return {}
+    conn, lock = get_mail_store()
+    with lock:
+        rows = conn.execute(
+            f"SELECT * FROM {OUTBOX_TABLE} WHERE sent_id IN ({', '.join('?' * len(sent_ids))}) ORDER BY id",
+            list(sent_ids)
+        ).fetchall()
+    return {row['sent_id']: row for row in rows}
+
+def _deliver_via_pool(account, recipients, message):
+    get_smtp_pool(SMTP_SERVER, SMTP_PORT, GMAIL_EMAIL, GMAIL_PASSWORD).sendmail(account, recipients, message)
+
+@st.cache_resource(show_spinner=False)
+def get_outbox():
+    return Outbox(_deliver_via_pool).start()
+
+# ------------------------------
+# 📨 MAIL MERGE
+# ------------------------------
+MERGE_FIELD_PATTERN = re.compile(r"\{\{\s*([^{}|]+?)\s*(?:\|\s*([^{}]*?)\s*)?\}\}")
+MERGE_RECIPIENT_FIELD = 'sender email'
+MERGE_DEFAULT_SUBJECT = "Re: {{subject}}"
+MERGE_DEFAULT_BODY = "<p>Dear {{sender name}},</p><p>Thank you for your email regarding <strong>{{subject}}</strong>. I have reviewed the details and will follow up with specific action items by end of day.</p><p>Best regards</p>"
+
+def compile_merge_template(text):
+    """Split a template into literal segments and (field, default) placeholders for {{field}} / {{field|default}}."""
+    parts = MERGE_FIELD_PATTERN.split(text)
+    return parts[0::3], list(zip(parts[1::3], [d or '' for d in parts[2::3]]))
+
+def render_merge(df, template):
+    """Render a template for every row of df in one vectorized pass; returns a Series of strings."""
+    literals, fields = compile_merge_template(template)
+    missing = sorted({field for field, _ in fields} - set(df.columns))
+    if missing:
+        raise ValueError(f"Unknown placeholder(s): {', '.join('{{' + f + '}}' for f in missing)}")
+    rendered = pd.Series(literals[0], index=df.index, dtype=object)
+    for (field, default), literal in zip(fields, literals[1:]):
+        values = df[field].fillna('').astype(str)
+        if default:
+            values = values.where(values != '', default)
+        rendered = rendered + values.to_numpy(dtype=object) + literal
+    return rendered
+
+def merge_batch(df, subject_template, body_template, editor_mode="HTML"):
+    """Rendered (recipient, subject, body, row) records for every row with a recipient address."""
+    subjects = render_merge(df, subject_template)
+    bodies = render_merge(df, body_template)
+    recipients = df[MERGE_RECIPIENT_FIELD].fillna('').astype(str).str.strip()
+    originals = df[[c for c in ORIGINAL_EMAIL_FIELDS if c in df.columns]].to_dict('records')
+    timestamp = datetime.now().isoformat()
+    return [
         {
-            "sender name": "Blogz Team",
-            "sender email": "info@blogz.life",
-            "subject": "[Blogz- The Blogging Community] A new subscriber has (been) registered!",
-            "summary": "New subscriber on Blogz: example user.",
-            "date": "2025-08-23",
-            "attachment": "No",
-            "aireply": "who are you",
-            "department": "Community",
-            "priority": "medium"
+            'to': to_address,
+            'subject': subject,
+            'body': body,
+            'editor_mode': editor_mode,
+            'timestamp': timestamp,
+            'original_email': original,
         }
+        for to_address, subject, body, original in zip(recipients, subjects, bodies, originals)
+        if to_address
     ]
+
+def merge_batch_key(records):
+    """Digest of a batch's rendered recipients and content, to recognise a batch that was already sent."""
+    digest = hashlib.blake2b(digest_size=16)
+    for record in records:
+        digest.update("\x1f".join((record['to'], record['subject'], record['body'], record['editor_mode'])).encode("utf-8"))
+        digest.update(b"\x1e")
+    return digest.hexdigest()
+
+def send_merge_batch(records):
+    """Log the batch to Sent and hand it to the outbox in one transaction; returns the count."""
+    smtp_configured = bool(GMAIL_EMAIL and GMAIL_PASSWORD)
+    messages = [
+        build_mime_message(GMAIL_EMAIL, record['to'], record['subject'], record['body'], record['editor_mode'])
+        for record in records
+    ] if smtp_configured else []
+    conn, lock = get_mail_store()
+    with lock:
+        conn.execute("BEGIN")
+        try:
+            sent_ids = _insert_mail_records(conn, SENT_TABLE, records)
+            if smtp_configured:
+                Outbox.insert_jobs(conn, GMAIL_EMAIL, [
+                    (message_recipients(record['to']), message, sent_id)
+                    for record, message, sent_id in zip(records, messages, sent_ids)
+                ])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    if smtp_configured:
+        get_outbox().wakeup.set()
+    return len(sent_ids)
+
+# ------------------------------
+# 🧩 TEMPLATE REGISTRY
+# ------------------------------
+TEMPLATES_TABLE = "templates"
+TEMPLATE_CACHE_SIZE = 4096
+
+TEMPLATES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS templates (
+    name TEXT PRIMARY KEY,
+    body TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+"""
+
+BUILTIN_TEMPLATES = {
+    "Acknowledgment": "<p>Dear {{sender name|there}},</p><p>Thank you for your email regarding <strong>{{subject|this matter}}</strong>. I have reviewed the details and will follow up with specific action items by end of day.</p><p>In the meantime, please let me know if you need any additional information.</p><p>Best regards</p>",
+    "Schedule Meeting": "<p>Dear {{sender name|there}},</p><p>Regarding <strong>{{subject|this matter}}</strong>, I suggest we schedule a brief meeting to discuss this in detail. I have availability tomorrow afternoon or Thursday morning.</p><p>Please let me know what works best for you.</p><p>Best regards</p>",
+    "Request More Info": "<p>Dear {{sender name|there}},</p><p>Thank you for reaching out about <strong>{{subject|this matter}}</strong>. To better assist you, could you please provide additional details about:</p><ul><li>Specific requirements</li><li>Timeline expectations</li><li>Any relevant documentation</li></ul><p>Looking forward to your response.</p><p>Best regards</p>",
+    "Approval": "<p>Dear {{sender name|there}},</p><p>Thank you for the update on <strong>{{subject|this matter}}</strong>. I have reviewed the information and approve the proposed approach.</p><p>Let us proceed as discussed and reconvene next week to review progress.</p><p>Best regards</p>",
+    "Follow Up": "<p>Dear {{sender name|there}},</p><p>I have received your email about <strong>{{subject|this matter}}</strong> and am currently reviewing the details. I should have feedback for you by tomorrow morning.</p><p>Thanks for your patience on this matter.</p><p>Best regards</p>",
+}
+
+def compile_template(text):
+    """Precompile a {{field|default}} template into a render function over a row dict."""
+    literals, fields = compile_merge_template(text)
+    head, tail = literals[0], literals[1:]
     
-    mock_subjects = [
-        "Urgent: Q4 Sales Report Review",
-        "Marketing Campaign Results for Q1 Launch",
-        "System Maintenance Scheduled for Weekend",
-        "Team Building Event - Save the Date",
-        "Budget Approval Request for Project Alpha",
-        "Follow-up on Customer Ticket #4567",
-        "New Feature Proposal: Dark Mode Implementation",
-        "Contract Review for Vendor X",
-        "Feedback on the latest UI/UX changes",
-        "Request for time-off approval",
-        "Invoice #2024-987 payment status",
-        "Security vulnerability report - URGENT",
-        "Welcome to the new team member!",
-        "Quarterly performance review schedule",
-        "Important: Policy update on remote work",
-        "Project deadline extension request",
-        "Client meeting notes and action items",
-        "Weekly status report submission",
-        "Equipment purchase request approval",
-        "Training session scheduled for next week",
-        "Office relocation announcement",
-        "New employee onboarding checklist",
-        "Monthly expense report review",
-        "Collaboration opportunity with Partner Co",
-        "Year-end bonus and compensation review",
-    ]
+    def render(row):
+        out = [head]
+        for (field, default), literal in zip(fields, tail):
+            value = row.get(field)
+            value = '' if value is None or (isinstance(value, float) and math.isnan(value)) else str(value)
+            out.append(value or default)
+            out.append(literal)
+        return "".join(out)
     
-    mock_summaries = [
-        "The Q4 sales figures are attached for your review. Please provide feedback by EOD.",
-        "The campaign exceeded expectations with a 25% increase in engagement. Full report inside.",
-        "Server maintenance scheduled this weekend. Expected downtime: 2–4 hours. Details attached.",
-        "Annual team building event next month. Please confirm your attendance and dietary restrictions.",
-        "Requesting approval for additional project budget. ROI details attached for your consideration.",
-        "The customer is still experiencing login issues. Need your technical input on the solution.",
-        "Detailed proposal for implementing a dark mode theme across all platforms.",
-        "Legal review required for the new vendor contract before signing.",
-        "We have gathered user feedback on the recent design changes.",
-        "Requesting two days off next week for a personal appointment.",
-        "Checking on the status of the latest vendor invoice payment.",
-        "A critical security flaw was identified in the login module. Immediate action required.",
-        "Introducing our newest team member who will be joining the Engineering team.",
-        "Your QPR meeting is scheduled for next Tuesday.",
-        "New guidelines for remote work eligibility and office attendance.",
-        "Project deadline needs to be pushed due to resource constraints.",
-        "Summary of action items from yesterday's client meeting.",
-        "Weekly team status report is due by Friday EOD.",
-        "Requesting approval to purchase new laptops for the development team.",
-        "Mandatory security training session scheduled for Thursday afternoon.",
-        "Office will be moving to a new location next quarter.",
-        "Updated onboarding checklist for new hires.",
-        "Monthly expense reports need to be submitted by the end of this week.",
-        "Exploring a strategic partnership with a new vendor.",
-        "Year-end performance bonuses will be discussed soon.",
-    ]
+    return render
+
+def template_row_key(row):
+    """Cache key for an email row: its row id when it came from the inbox, else a content hash."""
+    if row.get('row_id') is not None:
+        return ('row', current_dataset_version(), row['row_id'])
+    return ('hash', hashlib.blake2b(_original_email_json(row).encode("utf-8"), digest_size=8).hexdigest())
+
+class TemplateRegistry:
+    """Built-in and user templates, compiled once, with an LRU cache of rendered output."""
+
+    def __init__(self, cache_size=TEMPLATE_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._compiled = {}
+        self._rendered = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        conn, lock = get_mail_store()
+        with lock:
+            rows = conn.execute(f"SELECT name, body FROM {TEMPLATES_TABLE} ORDER BY name").fetchall()
+        self._user = {row['name']: row['body'] for row in rows}
+
+    def names(self):
+        return list(BUILTIN_TEMPLATES) + [name for name in self._user if name not in BUILTIN_TEMPLATES]
+
+    def is_custom(self, name):
+        return name in self._user
+
+    def text(self, name):
+        return self._user.get(name, BUILTIN_TEMPLATES.get(name, ""))
+
+    def save(self, name, body):
+        conn, lock = get_mail_store()
+        with lock:
+            conn.execute(
+                f"INSERT INTO {TEMPLATES_TABLE} (name, body, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET body = excluded.body, updated_at = excluded.updated_at",
+                (name, body, datetime.now().isoformat())
+            )
+        with self._lock:
+            self._user[name] = body
+
+    def delete(self, name):
+        conn, lock = get_mail_store()
+        with lock:
+            conn.execute(f"DELETE FROM {TEMPLATES_TABLE} WHERE name = ?", (name,))
+        with self._lock:
+            self._user.pop(name, None)
+
+    def render_text(self, text, row, row_key=None):
+        key = (text, row_key if row_key is not None else template_row_key(row))
+        with self._lock:
+            if key in self._rendered:
+                self._rendered.move_to_end(key)
+                self.hits += 1
+                return self._rendered[key]
+            render = self._compiled.get(text)
+            if render is None:
+                render = self._compiled[text] = compile_template(text)
+        rendered = render(row)
+        with self._lock:
+            self.misses += 1
+            self._rendered[key] = rendered
+            while len(self._rendered) > self.cache_size:
+                self._rendered.popitem(last=False)
+        return rendered
+
+    def render(self, name, row, row_key=None):
+        return self.render_text(self.text(name), row, row_key)
+
+@st.cache_resource(show_spinner=False)
+def get_template_registry():
+    return TemplateRegistry()
+
+# ------------------------------
+# 🤖 AI REPLY GENERATION
+# ------------------------------
+try:
+    from openai import OpenAI
+except ImportError:  # generation is optional; replies can still come from the sheet
+    OpenAI = None
+
+OPENAI_SETTINGS = st.secrets.get("openai", {})
+OPENAI_MODEL = OPENAI_SETTINGS.get("model", "gpt-4o-mini")
+AI_REPLY_CONCURRENCY = int(OPENAI_SETTINGS.get("max_concurrency", 8))
+AI_REPLY_CACHE_TABLE = "ai_reply_cache"
+AI_REPLY_SYSTEM_PROMPT = (
+    "You are an assistant drafting replies for a busy professional. "
+    "Write a short, polite reply to the email described by the user. "
+    "Return only the reply body as simple HTML using <p> tags."
+)
+
+AI_REPLY_CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ai_reply_cache (
+    key TEXT PRIMARY KEY,
+    reply TEXT NOT NULL,
+    model TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+"""
+
+def get_openai_client():
+    """OpenAI client from secrets, or None when not configured. base_url may point at a local stub."""
+    if OpenAI is None or not OPENAI_SETTINGS.get("api_key"):
+        return None
+    return _openai_client(OPENAI_SETTINGS["api_key"], OPENAI_SETTINGS.get("base_url"))
+
+@st.cache_resource(show_spinner=False)
+def _openai_client(api_key, base_url):
+    return OpenAI(api_key=api_key, base_url=base_url)
+
+def ai_reply_cache_key(subject, summary, sender):
+    payload = "\x1f".join(str(v or '') for v in (subject, summary, sender))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def ai_reply_cache_get(keys):
+    conn, lock = get_mail_store()
+    found = {}
+    keys = list(keys)
+    for start in range(0, len(keys), 500):
+        chunk = keys[start:start + 500]
+        with lock:
+            rows = conn.execute(
+                f"SELECT key, reply FROM {AI_REPLY_CACHE_TABLE} WHERE key IN ({', '.join('?' * len(chunk))})",
+                chunk
+            ).fetchall()
+        found.update((row['key'], row['reply']) for row in rows)
+    return found
+
+def ai_reply_cache_put(key, reply, model):
+    conn, lock = get_mail_store()
+    with lock:
+        conn.execute(
+            f"INSERT OR REPLACE INTO {AI_REPLY_CACHE_TABLE} (key, reply, model, created_at) VALUES (?, ?, ?, ?)",
+            (key, reply, model, datetime.now().isoformat())
+        )
+
+def request_ai_reply(client, model, sender, subject, summary):
+    response = client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": AI_REPLY_SYSTEM_PROMPT},
+            {"role": "user", "content": f"From: {sender}\nSubject: {subject}\nSummary: {summary}"},
+        ],
+    )
+    return (response.choices[0].message.content or "").strip()
+
+def generate_ai_replies(df, client, model=OPENAI_MODEL, max_workers=AI_REPLY_CONCURRENCY, progress=None):
+    """Fill in replies for rows without one; returns (replies Series indexed like df, stats dict)."""
+    missing = df[~df['has_ai_reply']]
+    senders = missing['sender email'].fillna('').astype(str) if 'sender email' in missing.columns else pd.Series('', index=missing.index)
+    subjects = missing['subject'].fillna('').astype(str)
+    summaries = missing['summary'].fillna('').astype(str) if 'summary' in missing.columns else pd.Series('', index=missing.index)
+    keys = pd.Series([ai_reply_cache_key(*v) for v in zip(subjects, summaries, senders)], index=missing.index, dtype=object)
     
-    ai_reply_templates = [
-        "<p>Thank you for your email regarding <strong>{subject}</strong>. I have reviewed the details and will follow up with specific action items by end of day.</p><p>In the meantime, please let me know if you need any additional information.</p><p>Best regards</p>",
-        "<p>I appreciate you bringing <strong>{subject}</strong> to my attention. This requires careful consideration and I will provide a comprehensive response within 24 hours.</p><p>Thank you for your patience.</p>",
-        "<p>Regarding <strong>{subject}</strong>, I suggest we schedule a brief meeting to discuss this in detail. I have availability tomorrow afternoon or Thursday morning.</p><p>Please let me know what works best for you.</p><p>Best regards</p>",
-        "<p>Thank you for the update on <strong>{subject}</strong>. I have reviewed the information and agree with the proposed approach.</p><p>Let us proceed as discussed and reconvene next week to review progress.</p>",
-        "<p>I have received your email about <strong>{subject}</strong> and am currently reviewing the attached documents. I should have feedback for you by tomorrow morning.</p><p>Thanks for your thoroughness on this matter.</p>",
-    ]
+    replies = ai_reply_cache_get(keys.unique())
+    cached_rows = int(keys.isin(replies.keys()).sum())
+    to_generate = {}
+    for idx, key in keys.items():
+        if key not in replies and key not in to_generate:
+            to_generate[key] = (senders[idx], subjects[idx], summaries[idx])
     
-    emails = example_emails.copy()
-    priorities = ["high", "medium", "low"]
+    generated = failures = 0
+    if to_generate:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(request_ai_reply, client, model, *fields): key for key, fields in to_generate.items()}
+            for done, future in enumerate(as_completed(futures), start=1):
+                key = futures[future]
+                try:
+                    reply = future.result()
+                except Exception:
+                    reply = None
+                # An empty completion is not stored, so it counts as a failure.
+                if reply:
+                    replies[key] = reply
+                    ai_reply_cache_put(key, reply, model)
+                    generated += 1
+                else:
+                    failures += 1
+                if progress is not None:
+                    progress(done, len(futures))
     
-    for i in range(num_emails - len(example_emails)):
-        sender_name, sender_email, department = random.choice(mock_senders)
-        subject = mock_subjects[i % len(mock_subjects)]
-        summary = mock_summaries[i % len(mock_summaries)]
-        
-        date_offset = random.randint(0, 45)
-        date = (datetime.now() - pd.Timedelta(days=date_offset)).strftime("%Y-%m-%d")
+    result = keys.map(replies).dropna()
+    stats = {
+        'missing': len(missing),
+        'cached': cached_rows,
+        'generated': generated,
+        'failed': failures,
+    }
+    return result, stats
+
+def apply_ai_replies(df, replies):
+    """Copy generated replies into df and refresh the derived columns for those rows."""
+    if replies.empty:
+        return df
+    df = df.copy()
+    df.loc[replies.index, 'aireply'] = replies
+    refreshed = enrich_emails(df.loc[replies.index].copy())
+    for col in ['has_ai_reply', 'ai_preview']:
+        df.loc[replies.index, col] = refreshed[col]
+    return df
+
+# ------------------------------
+# 📝 MOCK DATA GENERATION
+# ------------------------------
+MOCK_SENDERS = [
+    ("Custom All Stars", "customallstars@gmail.com", "Community"),
+    ("Blogz Team", "info@blogz.life", "Community"),
+    ("John Smith", "john.s@sales.com", "Sales"),
+    ("Sarah Johnson", "sarah.j@marketing.com", "Marketing"),
+    ("Mike Chen", "m.chen@tech.io", "IT"),
+    ("Lisa Rodriguez", "lisa.r@hr.company.com", "HR"),
+    ("David Wilson", "d.wilson@finance.com", "Finance"),
+    ("Emily Brown", "emily.b@support.com", "Support"),
+    ("Alex Green", "alex.g@product.com", "Product"),
+    ("Jessica Lee", "jessica.l@legal.com", "Legal"),
+    ("Robert Taylor", "robert.t@operations.com", "Operations"),
+    ("Maria Garcia", "maria.g@research.com", "Research"),
+    ("James Anderson", "james.a@design.com", "Design"),
+    ("Linda Martinez", "linda.m@qa.com", "Quality Assurance"),
+    ("William Thomas", "william.t@security.com", "Security"),
+]
+
+MOCK_EXAMPLE_EMAILS = [
+    {
+        "sender name": "Custom All Stars",
+        "sender email": "customallstars@gmail.com",
+        "subject": "ai_systems_checklist",
+        "summary": "Mock summary for AI systems checklist.",
+        "date": "2025-10-09",
+        "attachment": "No",
+        "aireply": "hey there",
+        "department": "Community",
+        "priority": "high"
+    },
+    {
+        "sender name": "Blogz Team",
+        "sender email": "info@blogz.life",
+        "subject": "[Blogz- The Blogging Community] A new subscriber has (been) registered!",
+        "summary": "New subscriber on Blogz: example user.",
+        "date": "2025-08-23",
+        "attachment": "No",
+        "aireply": "who are you",
+        "department": "Community",
+        "priority": "medium"
+    }
+]
+
+MOCK_SUBJECTS = [
+    "Urgent: Q4 Sales Report Review",
+    "Marketing Campaign Results for Q1 Launch",
+    "System Maintenance Scheduled for Weekend",
+    "Team Building Event - Save the Date",
+    "Budget Approval Request for Project Alpha",
+    "Follow-up on Customer Ticket #4567",
+    "New Feature Proposal: Dark Mode Implementation",
+    "Contract Review for Vendor X",
+    "Feedback on the latest UI/UX changes",
+    "Request for time-off approval",
+    "Invoice #2024-987 payment status",
+    "Security vulnerability report - URGENT",
+    "Welcome to the new team member!",
+    "Quarterly performance review schedule",
+    "Important: Policy update on remote work",
+    "Project deadline extension request",
+    "Client meeting notes and action items",
+    "Weekly status report submission",
+    "Equipment purchase request approval",
+    "Training session scheduled for next week",
+    "Office relocation announcement",
+    "New employee onboarding checklist",
+    "Monthly expense report review",
+    "Collaboration opportunity with Partner Co",
+    "Year-end bonus and compensation review",
+]
+
+MOCK_SUMMARIES = [
+    "The Q4 sales figures are attached for your review. Please provide feedback by EOD.",
+    "The campaign exceeded expectations with a 25% increase in engagement. Full report inside.",
+    "Server maintenance scheduled this weekend. Expected downtime: 2–4 hours. Details attached.",
+    "Annual team building event next month. Please confirm your attendance and dietary restrictions.",
+    "Requesting approval for additional project budget. ROI details attached for your consideration.",
+    "The customer is still experiencing login issues. Need your technical input on the solution.",
+    "Detailed proposal for implementing a dark mode theme across all platforms.",
+    "Legal review required for the new vendor contract before signing.",
+    "We have gathered user feedback on the recent design changes.",
+    "Requesting two days off next week for a personal appointment.",
+    "Checking on the status of the latest vendor invoice payment.",
+    "A critical security flaw was identified in the login module. Immediate action required.",
+    "Introducing our newest team member who will be joining the Engineering team.",
+    "Your QPR meeting is scheduled for next Tuesday.",
+    "New guidelines for remote work eligibility and office attendance.",
+    "Project deadline needs to be pushed due to resource constraints.",
+    "Summary of action items from yesterday's client meeting.",
+    "Weekly team status report is due by Friday EOD.",
+    "Requesting approval to purchase new laptops for the development team.",
+    "Mandatory security training session scheduled for Thursday afternoon.",
+    "Office will be moving to a new location next quarter.",
+    "Updated onboarding checklist for new hires.",
+    "Monthly expense reports need to be submitted by the end of this week.",
+    "Exploring a strategic partnership with a new vendor.",
+    "Year-end performance bonuses will be discussed soon.",
+]
+
+MOCK_AI_REPLY_TEMPLATES = [
+    "<p>Thank you for your email regarding <strong>{subject}</strong>. I have reviewed the details and will follow up with specific action items by end of day.</p><p>In the meantime, please let me know if you need any additional information.</p><p>Best regards</p>",
+    "<p>I appreciate you bringing <strong>{subject}</strong> to my attention. This requires careful consideration and I will provide a comprehensive response within 24 hours.</p><p>Thank you for your patience.</p>",
+    "<p>Regarding <strong>{subject}</strong>, I suggest we schedule a brief meeting to discuss this in detail. I have availability tomorrow afternoon or Thursday morning.</p><p>Please let me know what works best for you.</p><p>Best regards</p>",
+    "<p>Thank you for the update on <strong>{subject}</strong>. I have reviewed the information and agree with the proposed approach.</p><p>Let us proceed as discussed and reconvene next week to review progress.</p>",
+    "<p>I have received your email about <strong>{subject}</strong> and am currently reviewing the attached documents. I should have feedback for you by tomorrow morning.</p><p>Thanks for your thoroughness on this matter.</p>",
+]
+MOCK_FIRST_NAMES = ["Aisha", "Ben", "Carla", "Diego", "Elena", "Farid", "Grace", "Hiro", "Ines", "Jonas",
+                    "Kemi", "Liam", "Mei", "Noah", "Olga", "Priya", "Quinn", "Rosa", "Sven", "Tariq"]
+MOCK_LAST_NAMES = ["Adams", "Baker", "Costa", "Dubois", "Evans", "Fischer", "Gupta", "Haddad", "Ito", "Jensen",
+                   "Kowalski", "Lopez", "Moreau", "Nakamura", "Okafor", "Petrov", "Rossi", "Silva", "Tanaka", "Walsh"]
+MOCK_PRIORITY_WEIGHTS = {"high": 0.2, "medium": 0.5, "low": 0.3}
+MOCK_AI_REPLY_RATE = 1 / 3
+MOCK_ATTACHMENT_RATE = 0.5
+MOCK_REFERENCE_RATE = 0.3
+MOCK_MAX_AGE_DAYS = 45
+MOCK_CHUNK_SIZE = 1_000_000
+
+def _mock_sender_pool(num_emails):
+    """(names, emails, departments, weights) of mock senders, growing with the inbox size."""
+    names = [name for name, _, _ in MOCK_SENDERS]
+    emails = [email for _, email, _ in MOCK_SENDERS]
+    departments = [dept for _, _, dept in MOCK_SENDERS]
+    domains = [(email.split("@", 1)[1], dept) for _, email, dept in MOCK_SENDERS[2:]]
+    synthetic = min(num_emails // 20, len(MOCK_FIRST_NAMES) * len(MOCK_LAST_NAMES) * len(domains))
+    for i in range(synthetic):
+        domain, dept = domains[i % len(domains)]
+        first = MOCK_FIRST_NAMES[(i // len(domains)) % len(MOCK_FIRST_NAMES)]
+        last = MOCK_LAST_NAMES[(i // (len(domains) * len(MOCK_FIRST_NAMES))) % len(MOCK_LAST_NAMES)]
+        names.append(f"{first} {last}")
+        emails.append(f"{first.lower()}.{last[0].lower()}{i}@{domain}")
+        departments.append(dept)
+    weights = 1.0 / np.arange(1, len(names) + 1) ** 1.1
+    return (np.array(names, dtype=object), np.array(emails, dtype=object),
+            np.array(departments, dtype=object), weights / weights.sum())
+
+def _take(values, positions):
+    """values[positions] as a string column; gathering from the few distinct values is vectorized."""
+    return pd.Series(pd.array(list(values), dtype="str").take(positions))
+
+def mock_email_frame(num_emails, rng, pool=None):
+    """Raw mock inbox rows (the sheet's columns, not yet enriched) drawn with NumPy."""
+    names, emails, departments, weights = pool if pool is not None else _mock_sender_pool(num_emails)
+    sender = rng.choice(len(names), size=num_emails, p=weights)
+    topic = rng.integers(0, len(MOCK_SUBJECTS), size=num_emails)
+    sender_name = _take(names, sender)
+    
+    subject = _take(MOCK_SUBJECTS, topic)
+    referenced = np.flatnonzero(rng.random(num_emails) < MOCK_REFERENCE_RATE)
+    reference = pd.Series(rng.integers(1000, 100000, size=len(referenced)), index=referenced).astype("str")
+    subject.iloc[referenced] = subject.iloc[referenced] + " #" + reference
+    
+    today = datetime.now().date()
+    recent_dates = [(today - pd.Timedelta(days=age)).strftime("%Y-%m-%d") for age in range(MOCK_MAX_AGE_DAYS + 1)]
+    
+    # Reply templates are split around {subject} so they can be joined column-wise,
+    # and only for the rows that get a reply.
+    heads, tails = zip(*(t.split("{subject}", 1) for t in MOCK_AI_REPLY_TEMPLATES))
+    replied = np.flatnonzero(rng.random(num_emails) < MOCK_AI_REPLY_RATE)
+    template = rng.integers(0, len(MOCK_AI_REPLY_TEMPLATES), size=len(replied))
+    ai_reply = _take([""], np.zeros(num_emails, dtype=np.intp))
+    ai_reply.iloc[replied] = ("<div style='font-family: Arial, sans-serif;'><p>Dear " + sender_name.iloc[replied] + ",</p>"
+                              + _take(heads, template).set_axis(replied) + subject.iloc[replied]
+                              + _take(tails, template).set_axis(replied) + "</div>")
+    
+    return pd.DataFrame({
+        "sender name": sender_name,
+        "sender email": _take(emails, sender),
+        "subject": subject,
+        "summary": _take(MOCK_SUMMARIES, topic % len(MOCK_SUMMARIES)),
+        "date": _take(recent_dates, rng.integers(0, MOCK_MAX_AGE_DAYS + 1, size=num_emails)),
+        "attachment": _take(["Yes", "No"], (rng.random(num_emails) >= MOCK_ATTACHMENT_RATE).astype(np.intp)),
+        "aireply": ai_reply,
+        "department": _take(departments, sender),
+        "priority": _take(list(MOCK_PRIORITY_WEIGHTS), rng.choice(len(MOCK_PRIORITY_WEIGHTS), size=num_emails, p=list(MOCK_PRIORITY_WEIGHTS.values()))),
+    })
+
+def iter_mock_chunks(num_emails, chunk_size=MOCK_CHUNK_SIZE, seed=None):
+    """Yield the mock inbox as raw frames of at most chunk_size rows, indexed by row id."""
+    examples = pd.DataFrame(MOCK_EXAMPLE_EMAILS[:num_emails])
+    pool = _mock_sender_pool(num_emails)
+    chunk_starts = range(0, num_emails, chunk_size)
+    for start, child in zip(chunk_starts, np.random.SeedSequence(seed).spawn(len(chunk_starts))):
+        size = min(chunk_size, num_emails - start)
+        lead = examples if start == 0 else examples.iloc[:0]
+        frame = mock_email_frame(size - len(lead), np.random.default_rng(child), pool)
+        frame = pd.concat([lead, frame], ignore_index=True) if len(lead) else frame
+        frame.index = pd.RangeIndex(start, start + size)
+        yield frame
+
+def generate_mock_data(num_emails=25, seed=None):
+    frames = list(iter_mock_chunks(num_emails, seed=seed)) or [mock_email_frame(0, np.random.default_rng(seed))]
+    return enrich_emails(pd.concat(frames) if len(frames) > 1 else frames[0])
+
+# ------------------------------
+# 🏷️ CLASSIFICATION
+# ------------------------------
+DEFAULT_DEPARTMENT = "General"
+PRIORITY_LEVELS = np.array(["high", "medium", "low"], dtype=object)
+CLASSIFIER_CACHE_SIZE = 2_000_000
+
+# Sender domain labels (e.g. "hr" in lisa@hr.company.com) win over content keywords.
+DEPARTMENT_DOMAINS = {
+    "Sales": ["sales", "crm"],
+    "Marketing": ["marketing", "mailchimp", "hubspot"],
+    "IT": ["it", "tech", "helpdesk", "itsupport"],
+    "HR": ["hr", "people", "careers", "workday"],
+    "Finance": ["finance", "billing", "accounts", "payroll", "stripe", "paypal", "quickbooks"],
+    "Support": ["support", "zendesk", "freshdesk", "intercom"],
+    "Product": ["product"],
+    "Legal": ["legal", "docusign"],
+    "Operations": ["operations", "ops", "facilities"],
+    "Research": ["research", "lab", "labs"],
+    "Design": ["design", "figma"],
+    "Quality Assurance": ["qa", "quality"],
+    "Security": ["security", "secops"],
+}
+DEPARTMENT_KEYWORDS = {
+    "Sales": ["sales", "quota", "pipeline", "deal", "prospect", "lead", "leads"],
+    "Marketing": ["marketing", "campaign", "engagement", "brand", "seo", "newsletter", "launch"],
+    "IT": ["server", "maintenance", "downtime", "laptop", "laptops", "password", "vpn", "outage", "login"],
+    "HR": ["time-off", "time off", "vacation", "leave", "onboarding", "new hire", "new hires", "team member",
+           "compensation", "bonus", "bonuses", "performance review", "remote work", "training"],
+    "Finance": ["invoice", "payment", "budget", "expense", "expenses", "reimbursement", "payroll", "roi", "purchase"],
+    "Support": ["ticket", "customer", "complaint", "refund", "support"],
+    "Product": ["feature", "roadmap", "proposal", "dark mode", "release"],
+    "Legal": ["contract", "legal", "nda", "compliance", "policy", "agreement"],
+    "Operations": ["office", "relocation", "logistics", "facilities", "schedule", "status report"],
+    "Research": ["research", "study", "experiment", "paper"],
+    "Design": ["design", "ui/ux", "ui", "ux", "mockup", "prototype"],
+    "Quality Assurance": ["qa", "bug", "regression", "test plan"],
+    "Security": ["security", "vulnerability", "breach", "phishing", "2fa", "mfa"],
+    "Community": ["subscriber", "community", "blog", "forum", "meetup", "checklist"],
+}
+HIGH_PRIORITY_KEYWORDS = ["urgent", "asap", "critical", "immediate", "immediately", "important", "action required",
+                          "deadline", "overdue", "escalation", "vulnerability", "breach", "outage", "eod"]
+LOW_PRIORITY_KEYWORDS = ["fyi", "newsletter", "digest", "unsubscribe", "subscriber", "announcement", "welcome",
+                         "save the date", "team building", "weekly", "no action needed"]
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # falls back to Python's re, several times slower on large sheets
+    pc = None
+
+def _alternation(words):
+    """Longest first, so phrases beat their prefixes."""
+    return "|".join(re.escape(w) for w in sorted({w.lower() for w in words}, key=len, reverse=True))
+
+# Patterns stay within the syntax shared by re and RE2 (Arrow's regex engine).
+DEPARTMENT_BY_DOMAIN_LABEL = {label: dept for dept, labels in DEPARTMENT_DOMAINS.items() for label in labels}
+DEPARTMENT_BY_KEYWORD = {kw.lower(): dept for dept, kws in DEPARTMENT_KEYWORDS.items() for kw in kws}
+DEPARTMENT_LEVELS = np.array(list(DEPARTMENT_KEYWORDS) + [DEFAULT_DEPARTMENT], dtype=object)
+DOMAIN_LABEL_PATTERN = r"(?i)@(?:[\w-]+\.)*?(?P<kw>" + _alternation(DEPARTMENT_BY_DOMAIN_LABEL) + r")\."
+DEPARTMENT_KEYWORD_PATTERN = r"(?i)\b(?P<kw>" + _alternation(DEPARTMENT_BY_KEYWORD) + r")\b"
+HIGH_PRIORITY_PATTERN = r"(?i)\b(?:" + _alternation(HIGH_PRIORITY_KEYWORDS) + r")\b"
+LOW_PRIORITY_PATTERN = r"(?i)\b(?:" + _alternation(LOW_PRIORITY_KEYWORDS) + r")\b"
+
+class ClassificationCache:
+    """Row fingerprint -> (priority code, department code), kept as sorted arrays for searchsorted lookups."""
+    
+    def __init__(self, max_size=CLASSIFIER_CACHE_SIZE):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.keys = np.empty(0, dtype=np.uint64)
+        self.codes = np.empty((0, 2), dtype=np.int8)
+    
+    def lookup(self, hashes):
+        with self.lock:
+            keys, codes = self.keys, self.codes
+        codes_out = np.full((len(hashes), 2), -1, dtype=np.int8)
+        if len(keys):
+            slots = np.minimum(np.searchsorted(keys, hashes), len(keys) - 1)
+            found = keys[slots] == hashes
+            codes_out[found] = codes[slots[found]]
+        return codes_out
+    
+    def store(self, hashes, codes):
+        hashes, first = np.unique(hashes, return_index=True)
+        codes = codes[first]
+        with self.lock:
+            if len(self.keys) + len(hashes) > self.max_size:
+                self.keys, self.codes = self.keys[:0], self.codes[:0]
+            keep = ~np.isin(self.keys, hashes)
+            keys = np.concatenate([self.keys[keep], hashes])
+            order = np.argsort(keys, kind='stable')
+            self.keys = keys[order]
+            self.codes = np.concatenate([self.codes[keep], codes])[order]
+
+@st.cache_resource(show_spinner=False)
+def get_classification_cache():
+    return ClassificationCache()
+
+def _text_column(df, col):
+    values = df[col].fillna('').astype(str).to_numpy(dtype=object) if col in df.columns else np.full(len(df), '', dtype=object)
+    return pd.Series(values, index=df.index, dtype=object)
+
+def _distinct(values):
+    """Factorize values so each distinct string is matched once; uniques are Arrow strings when available."""
+    codes, uniques = pd.factorize(values)
+    uniques = np.asarray(uniques, dtype=object)
+    return codes, (pa.array(uniques, type=pa.string()) if pc is not None else pd.Series(uniques, dtype=object))
+
+def _first_match(uniques, pattern, lookup):
+    if pc is not None:
+        hits = pd.Series(pc.extract_regex(uniques, pattern).field('kw').to_numpy(zero_copy_only=False), dtype=object)
+    else:
+        hits = uniques.str.extract(pattern, expand=False)
+    return hits.str.lower().map(lookup).to_numpy(dtype=object)
+
+def _contains(uniques, pattern):
+    if pc is not None:
+        return pc.match_substring_regex(uniques, pattern).to_numpy(zero_copy_only=False).astype(bool)
+    return uniques.str.contains(pattern, regex=True).to_numpy(dtype=bool)
+
+def classify_rows(inputs):
+    """Rule-based (priority code, department code) per row of subject/summary/sender email/attachment."""
+    text_codes, texts = _distinct(inputs['subject'] + " \n " + inputs['summary'])
+    sender_codes, senders = _distinct(inputs['sender email'])
+    
+    department = _first_match(senders, DOMAIN_LABEL_PATTERN, DEPARTMENT_BY_DOMAIN_LABEL)[sender_codes]
+    by_keyword = _first_match(texts, DEPARTMENT_KEYWORD_PATTERN, DEPARTMENT_BY_KEYWORD)[text_codes]
+    department = np.where(pd.isna(department), by_keyword, department)
+    department = np.where(pd.isna(department), DEFAULT_DEPARTMENT, department)
+    
+    has_attachment = inputs['attachment'].str.strip().str.lower().isin(['yes', 'true', '1']).to_numpy()
+    high = _contains(texts, HIGH_PRIORITY_PATTERN)[text_codes]
+    low = _contains(texts, LOW_PRIORITY_PATTERN)[text_codes] & ~has_attachment
+    priority = np.select([high, low], [0, 2], 1)
+    
+    department_codes = pd.Categorical(department, categories=DEPARTMENT_LEVELS).codes
+    return np.column_stack([priority, department_codes]).astype(np.int8)
+
+def classify_emails(df):
+    """Fill priority/department wherever the sheet left them blank, cached per row fingerprint."""
+    priority = df['priority'].fillna('').astype(str).str.strip().str.lower()
+    department = df['department'].fillna('').astype(str).str.strip()
+    needs_priority = ~priority.isin(PRIORITY_LEVELS)
+    needs_department = department.isin(['', 'nan', 'None'])
+    todo = (needs_priority | needs_department).to_numpy()
+    
+    if todo.any():
+        inputs = pd.DataFrame({col: _text_column(df, col)[todo] for col in ['subject', 'summary', 'sender email', 'attachment']})
+        hashes = pd.util.hash_pandas_object(inputs, index=False, categorize=False).to_numpy()
+        cache = get_classification_cache()
+        codes = cache.lookup(hashes)
+        miss = codes[:, 0] < 0
+        if miss.any():
+            codes[miss] = classify_rows(inputs[miss])
+            cache.store(hashes[miss], codes[miss])
         
-        has_attachment = random.choice(["Yes", "No"])
-        has_ai_reply = random.choice([True, False, False])
-        priority = random.choice(priorities)
+        priority = priority.mask(needs_priority, pd.Series(PRIORITY_LEVELS[codes[:, 0]], index=inputs.index))
+        department = department.mask(needs_department, pd.Series(DEPARTMENT_LEVELS[codes[:, 1]], index=inputs.index))
+    
+    df['priority'] = priority
+    df['department'] = department
+    return df
+
+# ------------------------------
+# 🧮 DERIVED COLUMNS
+# ------------------------------
+AI_REPLY_PREVIEW_CHARS = 150
+
+def enrich_emails(df):
+    """Add the typed display columns every view reads, computed once per load."""
+    attachment = df['attachment'].fillna('').astype(str).str.lower()
+    df['has_attachment'] = attachment.isin(['yes', 'true', '1'])
+    
+    ai_reply = df['aireply'].fillna('').astype(str)
+    df['has_ai_reply'] = ~ai_reply.str.strip().isin(['', 'nan', 'None', 'null'])
+    
+    preview = ai_reply.str.replace('<[^<]+?>', '', regex=True).str.replace('\n', ' ').str.strip()
+    long_preview = preview.str.len() > AI_REPLY_PREVIEW_CHARS
+    preview = preview.where(~long_preview, preview.str[:AI_REPLY_PREVIEW_CHARS] + "...")
+    df['ai_preview'] = preview.where(df['has_ai_reply'], '')
+    
+    names = df['sender name'].fillna('').astype(str) if 'sender name' in df.columns else pd.Series('', index=df.index)
+    parts = names.str.strip().str.split()
+    two_part = (parts.str[0].str[0].fillna('') + parts.str[-1].str[0].fillna('')).str.upper()
+    initials = two_part.where(parts.str.len() >= 2, names.str[0].fillna('').str.upper())
+    df['initials'] = initials.where((names != '') & (names != 'Unknown Sender') & (initials != ''), '?')
+    
+    raw_date = df['date'].fillna('').astype(str) if 'date' in df.columns else pd.Series('', index=df.index)
+    df['date_parsed'] = pd.to_datetime(raw_date, format='%Y-%m-%d', errors='coerce')
+    df['date_display'] = df['date_parsed'].dt.strftime('%b %d, %Y').fillna(raw_date)
+    return df
+
+# Low-cardinality text repeated on every row; stored as integer codes into a small category table.
+INBOX_CATEGORICAL_COLUMNS = ['department', 'priority', 'attachment', 'sender name', 'sender email']
+
+def apply_inbox_schema(df):
+    """Store the repeated text columns as categoricals; returns (df, report) with the bytes saved."""
+    columns = [col for col in INBOX_CATEGORICAL_COLUMNS
+               if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype)]
+    if not columns:
+        return df, None
+    before = int(df[columns].memory_usage(index=False, deep=True).sum())
+    for col in columns:
+        values = df[col].fillna('').astype(str).astype('category')
+        # Keep '' a category so the .fillna('') / .str calls downstream still work on coded columns.
+        if '' not in values.cat.categories:
+            values = values.cat.add_categories([''])
+        df[col] = values
+    after = int(df[columns].memory_usage(index=False, deep=True).sum())
+    return df, {'columns': columns, 'before_bytes': before, 'after_bytes': after}
+
+# ------------------------------
+# 🧠 SHARED DATASET CACHE
+# ------------------------------
+def dataset_scope():
+    """The loaded sheet's id; mock data gets its own scope so it never shares with sheet data."""
+    return SHEET_ID if st.session_state.get('sheet_sync') else "mock"
+
+def dataset_version(df):
+    """Content hash of df, so sessions that load identical data end up sharing one copy."""
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update("\x1f".join(str(col) for col in df.columns).encode("utf-8"))
+    digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+class DatasetEntry:
+    """One shared DataFrame plus everything derived from it: indexes and the sync state it was loaded with."""
+    
+    def __init__(self, scope, version, df, sync, snapshot_meta, schema_report, seq):
+        self.scope = scope
+        self.version = version
+        self.df = df
+        self.sync = sync
+        self.snapshot_meta = snapshot_meta
+        self.schema_report = schema_report
+        self.seq = seq
+        self.refs = 0
+        self.lock = threading.Lock()
+        self.inbox_index = None
+        # The search index has its own lock: it is built on a background thread
+        # and must not hold up the inbox index or the rest of the entry.
+        self.search_lock = threading.Lock()
+        self.search_index = None
+        self.search_synced = False
+        self.search_started = False
+
+class DatasetHandle:
+    """A session's reference to a shared dataset; the reference is released when the handle is freed."""
+    __slots__ = ('entry', '__weakref__')
+    
+    def __init__(self, cache, entry):
+        self.entry = entry
+        weakref.finalize(self, cache.release, entry.scope, entry.version)
+
+class DatasetCache:
+    """Inbox DataFrames shared by every session, keyed by (sheet scope, content version)."""
+    
+    def __init__(self):
+        # Reentrant because a handle's finalizer can run on this thread while the lock is held.
+        self.lock = threading.RLock()
+        self.entries = {}
+        self.seq = 0
+    
+    def acquire(self, scope, df, sync=None, snapshot_meta=None, schema_report=None, parent=None):
+        version = dataset_version(df)
+        inherit = None
+        with self.lock:
+            entry = self.entries.get((scope, version))
+            if entry is None:
+                self.seq += 1
+                entry = DatasetEntry(scope, version, df, dict(sync) if sync else None, snapshot_meta, schema_report, self.seq)
+                self.entries[(scope, version)] = entry
+                if parent is not None and parent is not entry:
+                    inherit, sole_owner = parent, parent.refs == 1
+            entry.refs += 1
+            handle = DatasetHandle(self, entry)
+        # The new version syncs the parent's search index incrementally: taken over
+        # when only the caller held the parent, copied while other sessions still use it.
+        # A parent whose index is still being built is not waited for.
+        if inherit is not None and inherit.search_lock.acquire(blocking=False):
+            try:
+                index = inherit.search_index
+                if index is not None and sole_owner:
+                    inherit.search_index, inherit.search_synced = None, False
+                elif index is not None:
+                    index = index.copy()
+            finally:
+                inherit.search_lock.release()
+            with entry.search_lock:
+                if entry.search_index is None:
+                    entry.search_index = index
+        return handle
+    
+    def attach_latest(self, scope):
+        """Handle to the most recently loaded live dataset for scope, or None."""
+        with self.lock:
+            live = [entry for entry in self.entries.values() if entry.scope == scope]
+            if not live:
+                return None
+            entry = max(live, key=lambda e: e.seq)
+            entry.refs += 1
+            return DatasetHandle(self, entry)
+    
+    def share(self, entry):
+        """Another handle to entry, e.g. for a session adopting a dataset the refresher published."""
+        with self.lock:
+            self.entries.setdefault((entry.scope, entry.version), entry)
+            entry.refs += 1
+            return DatasetHandle(self, entry)
+    
+    def release(self, scope, version):
+        with self.lock:
+            entry = self.entries.get((scope, version))
+            if entry is None:
+                return
+            entry.refs -= 1
+            if entry.refs <= 0:
+                del self.entries[(scope, version)]
+    
+    def stats(self):
+        with self.lock:
+            return {
+                'datasets': len(self.entries),
+                'rows': sum(len(entry.df) for entry in self.entries.values()),
+                'sessions': sum(entry.refs for entry in self.entries.values()),
+            }
+
+@st.cache_resource(show_spinner=False)
+def get_dataset_cache():
+    return DatasetCache()
+
+def set_dataset(df):
+    """Apply the compact schema to df, share it through the dataset cache and point this session at it."""
+    df, schema_report = apply_inbox_schema(df)
+    previous = st.session_state.get('dataset')
+    handle = st.session_state['dataset'] = get_dataset_cache().acquire(
+        dataset_scope(), df,
+        sync=st.session_state.get('sheet_sync'),
+        snapshot_meta=st.session_state.get('snapshot_meta'),
+        schema_report=schema_report,
+        parent=previous.entry if previous is not None else None,
+    )
+    st.session_state.pop('view_positions', None)
+    start_search_index(handle.entry)
+
+def adopt_dataset(handle):
+    """Point this session at a dataset someone else loaded, taking over its sync state and snapshot."""
+    st.session_state['dataset'] = handle
+    if handle.entry.sync is not None:
+        # Syncs replace the dict's lists rather than editing them, so a shallow copy keeps sessions apart.
+        st.session_state['sheet_sync'] = dict(handle.entry.sync)
+    if handle.entry.snapshot_meta is not None:
+        st.session_state['snapshot_meta'] = handle.entry.snapshot_meta
+
+def attach_latest_dataset(scope=SHEET_ID):
+    """Point a new session at the newest dataset another session already loaded for scope."""
+    handle = get_dataset_cache().attach_latest(scope)
+    if handle is None:
+        return False
+    adopt_dataset(handle)
+    return True
+
+def current_dataset():
+    return st.session_state['dataset'].entry.df
+
+def current_dataset_version():
+    handle = st.session_state.get('dataset')
+    return handle.entry.version if handle is not None else None
+
+def set_view(positions):
+    st.session_state['view_positions'] = (current_dataset_version(), positions)
+
+def current_view_positions():
+    """Row positions of this session's filtered view, or None when no filter ran on the current dataset."""
+    view = st.session_state.get('view_positions')
+    if view is None or view[0] != current_dataset_version():
+        return None
+    return view[1]
+
+def current_view():
+    """This session's filtered rows, rebuilt from its row positions for the current rerun only."""
+    positions = current_view_positions()
+    return current_dataset() if positions is None else current_dataset().iloc[positions]
+
+# ------------------------------
+# 🔄 BACKGROUND SHEET REFRESH
+# ------------------------------
+# Seconds between scheduled reloads; 0 reloads only when asked.
+SHEET_REFRESH_INTERVAL = float(SHEETS_SETTINGS.get("refresh_interval", 300))
+SHEET_REFRESH_POLL = 5
+SHEET_REFRESH_BACKOFF_MAX = 900.0
+
+class SheetRefresher:
+    """Reloads one sheet on a background thread and publishes each new dataset through the dataset cache."""
+    
+    def __init__(self, open_worksheet, sheet_id, cache, interval=SHEET_REFRESH_INTERVAL):
+        self.open_worksheet = open_worksheet
+        self.sheet_id = sheet_id
+        self.cache = cache
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.worksheet = None
+        self.handle = None
+        self.version = 0
+        self.refreshing = False
+        self.last_refresh = None
+        self.last_error = None
+        self.thread = None
+    
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="sheet-refresher", daemon=True)
+            self.thread.start()
+        return self
+    
+    def request(self):
+        """Ask for a reload now; returns immediately."""
+        self.wakeup.set()
+    
+    def current(self):
+        """(version, entry) of the newest published dataset; entry is None before the first refresh."""
+        with self.lock:
+            return self.version, (self.handle.entry if self.handle is not None else None)
+    
+    def refresh(self):
+        """Fetch and publish the sheet; returns True when its content changed."""
+        self.refreshing = True
+        try:
+            if self.worksheet is None:
+                self.worksheet = self.open_worksheet()
+            # Taken before the read, so an edit landing mid-read still looks newer later.
+            modified = sheet_modified_time(self.worksheet)
+            with self.lock:
+                parent = self.handle.entry if self.handle is not None else None
+            if modified is not None and parent is not None and parent.sync and parent.sync.get('modified') == modified:
+                # Nothing was written since the published dataset was read: no fetch, no new snapshot.
+                with self.lock:
+                    self.last_refresh = datetime.now()
+                    self.last_error = None
+                return False
+            df, sync_state = sheet_dataset(*fetch_sheet_values(self.worksheet), modified)
+            df, schema_report = apply_inbox_schema(df)
+            snapshot_meta = save_snapshot(df, sync_state, self.sheet_id)
+            handle = self.cache.acquire(self.sheet_id, df, sync=sync_state, snapshot_meta=snapshot_meta,
+                                        schema_report=schema_report, parent=parent)
+            with handle.entry.lock:
+                if handle.entry.inbox_index is None:
+                    handle.entry.inbox_index = build_inbox_index(handle.entry.df)
+            ensure_search_index(handle.entry)
+            with self.lock:
+                changed = handle.entry is not parent
+                self.handle = handle
+                if changed:
+                    self.version += 1
+                self.last_refresh = datetime.now()
+                self.last_error = None
+            return changed
+        except Exception as e:
+            self.worksheet = None
+            self.last_error = str(e)
+            raise
+        finally:
+            self.refreshing = False
+    
+    def _run(self):
+        delay = self.interval or None
+        while True:
+            self.wakeup.wait(delay)
+            self.wakeup.clear()
+            try:
+                self.refresh()
+                delay = self.interval or None
+            except Exception:
+                # Quota and transient API errors: keep serving the last dataset and back off.
+                delay = min(delay * 2, SHEET_REFRESH_BACKOFF_MAX) if self.interval else None
+
+@st.cache_resource(show_spinner=False)
+def _sheet_refresher(creds_key, sheet_id, _client):
+    return SheetRefresher(lambda: _open_worksheet(creds_key, sheet_id, _client), sheet_id, get_dataset_cache()).start()
+
+def get_sheet_refresher(credentials_dict, sheet_id=SHEET_ID):
+    creds_key = credentials_key(credentials_dict)
+    return _sheet_refresher(creds_key, sheet_id, _authorized_client(creds_key, credentials_dict))
+
+def adopt_refreshed_dataset(refresher):
+    """Switch this session to the refresher's newest dataset if it has not seen it yet; returns True when it switched."""
+    version, entry = refresher.current()
+    if entry is None or st.session_state.get('refresh_version') == version:
+        return False
+    st.session_state['refresh_version'] = version
+    adopt_dataset(get_dataset_cache().share(entry))
+    return True
+
+@st.fragment(run_every=SHEET_REFRESH_POLL)
+def render_refresh_status(refresher):
+    version, _ = refresher.current()
+    if version != st.session_state.get('refresh_version', 0):
+        st.rerun(scope="app")
+    if refresher.refreshing:
+        st.caption("🔄 Refreshing from Google Sheets in the background…")
+    elif refresher.last_error:
+        st.caption(f"❌ Last refresh failed: {refresher.last_error}")
+    elif refresher.last_refresh is not None:
+        st.caption(f"🔄 Refreshed {refresher.last_refresh:%H:%M:%S}" + (f" · every {SHEET_REFRESH_INTERVAL:.0f}s" if SHEET_REFRESH_INTERVAL else ""))
+
+# ------------------------------
+# 🗂️ INBOX INDEX
+# ------------------------------
+SORT_OPTIONS = ["Date (Newest First)", "Date (Oldest First)", "AI Replies First", "Priority (High First)"]
+PRIORITY_RANK = {'high': 0, 'medium': 1, 'low': 2}
+
+def build_inbox_index(df):
+    """Row-position sets per filter value and one presorted permutation per sort option."""
+    keys = pd.DataFrame({
+        'date': df['date_parsed'].to_numpy(),
+        'ai': df['has_ai_reply'].to_numpy(),
+        'rank': df['priority'].map(PRIORITY_RANK).astype(float).to_numpy(),
+    })
+    return {
+        'size': len(df),
+        'departments': {str(k): v for k, v in df.groupby('department', sort=True, observed=True).indices.items()},
+        'priorities': {str(k): v for k, v in df.groupby('priority', sort=False, observed=True).indices.items()},
+        'orders': {
+            "Date (Newest First)": keys.sort_values('date', ascending=False, kind='stable').index.to_numpy(),
+            "Date (Oldest First)": keys.sort_values('date', ascending=True, kind='stable').index.to_numpy(),
+            "AI Replies First": keys.sort_values(['ai', 'date'], ascending=[False, False], kind='stable').index.to_numpy(),
+            "Priority (High First)": keys.sort_values(['rank', 'date'], ascending=[True, False], kind='stable').index.to_numpy(),
+        },
+    }
+
+def get_inbox_index():
+    entry = st.session_state['dataset'].entry
+    with entry.lock:
+        if entry.inbox_index is None:
+            entry.inbox_index = build_inbox_index(entry.df)
+        return entry.inbox_index
+
+def query_inbox_index(index, department="All", priority="All", sort_option=SORT_OPTIONS[0]):
+    """Row positions matching the filters, in the requested sort order."""
+    order = index['orders'][sort_option]
+    mask = None
+    for value, groups in ((department, index['departments']), (priority, index['priorities'])):
+        if value == "All":
+            continue
+        selected = np.zeros(index['size'], dtype=bool)
+        selected[groups.get(value, [])] = True
+        mask = selected if mask is None else mask & selected
+    return order if mask is None else order[mask[order]]
+
+# ------------------------------
+# 🗃️ ARCHIVE
+# ------------------------------
+# Archived cell values the sheet treats as archived; write-backs use 'Yes'.
+ARCHIVED_SHEET_VALUES = {'yes', 'true', '1', 'x'}
+
+class ArchiveStore:
+    """Local archive decisions keyed by row identity, overriding the sheet's Archived column until it agrees."""
+    
+    def __init__(self, path=None):
+        # path=None keeps decisions in memory only.
+        self.path = path
+        self.lock = threading.Lock()
+        self.revision = 0
+        self.decisions = {}
+        if path is not None:
+            try:
+                with open(path) as f:
+                    self.decisions = json.load(f)
+            except FileNotFoundError:
+                pass
+    
+    def _save(self, decisions):
+        if self.path is None:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + ".tmp", "w") as f:
+            json.dump(decisions, f)
+        os.replace(self.path + ".tmp", self.path)
+    
+    def update(self, identities, archived=True):
+        if not identities:
+            return
+        with self.lock:
+            decisions = dict(self.decisions)
+            decisions.update(dict.fromkeys(identities, bool(archived)))
+            self._save(decisions)
+            self.decisions = decisions
+            self.revision += 1
+    
+    def settle(self, identities):
+        """Drop decisions the sheet now reflects; the archived state they give is unchanged."""
+        with self.lock:
+            decisions = {k: v for k, v in self.decisions.items() if k not in identities}
+            if len(decisions) != len(self.decisions):
+                self._save(decisions)
+                self.decisions = decisions
+    
+    def mask(self, identities, sheet_archived):
+        """(archived, settled): the decision per row where there is one, else sheet_archived; plus decisions the sheet agrees with."""
+        # Rows with identical content share an identity, so one decision covers all of them;
+        # it only settles once the sheet agrees on every one.
+        decisions = self.decisions
+        out = np.array(sheet_archived, dtype=bool)
+        if not decisions:
+            return out, set()
+        positions = pd.Index(list(decisions)).get_indexer(identities)
+        rows = np.flatnonzero(positions >= 0)
+        decided = np.fromiter(decisions.values(), dtype=bool, count=len(decisions))[positions[rows]]
+        agrees = decided == out[rows]
+        out[rows] = decided
+        matched = np.asarray(identities, dtype=object)[rows]
+        settled = set(matched[agrees]) - set(matched[~agrees])
+        return out, settled
+
+@st.cache_resource(show_spinner=False)
+def _archive_store(scope):
+    return ArchiveStore(os.path.join(DATA_DIR, f"archive_{scope}.json"))
+
+def get_archive():
+    """Archive for the loaded sheet; mock data gets a per-session store that is never persisted."""
+    if not st.session_state.get('sheet_sync'):
+        return st.session_state.setdefault('mock_archive', ArchiveStore())
+    return _archive_store(dataset_scope())
+
+def row_identities(row_ids):
+    """Archive identity per row id: the sheet row identity, or the row id itself for mock data."""
+    sync_state = st.session_state.get('sheet_sync')
+    if not sync_state:
+        return [str(int(row_id)) for row_id in row_ids]
+    identities = sync_state['identities']
+    return [identities[int(row_id)] for row_id in row_ids if 0 <= int(row_id) < len(identities)]
+
+def sheet_archived_flags(df):
+    if 'archived' not in df.columns:
+        return np.zeros(len(df), dtype=bool)
+    return df['archived'].astype(str).str.strip().str.lower().isin(ARCHIVED_SHEET_VALUES).to_numpy()
+
+def archived_mask(row_ids):
+    """Boolean array, True where the current dataset's row id is archived."""
+    store = get_archive()
+    key = (current_dataset_version(), id(store), store.revision)
+    cached = st.session_state.get('archive_mask')
+    if cached is None or cached[0] != key:
+        df = current_dataset()
+        mask, settled = store.mask(row_identities(range(len(df))), sheet_archived_flags(df))
+        if settled and st.session_state.get('sheet_sync'):
+            store.settle(settled)
+        cached = st.session_state['archive_mask'] = (key, mask)
+    return cached[1][np.asarray(row_ids, dtype=np.int64)]
+
+def archive_rows(row_ids, credentials_dict=None, archived=True):
+    """Archive or restore rows locally and queue the sheet's Archived cells."""
+    row_ids = [int(row_id) for row_id in row_ids]
+    get_archive().update(row_identities(row_ids), archived)
+    stage_sheet_updates(credentials_dict, [(row_id, 'archived', 'Yes' if archived else '') for row_id in row_ids])
+    verb = "Archived" if archived else "Restored"
+    st.toast(f"{verb} {len(row_ids)} email(s).", icon="✅")
+
+# ------------------------------
+# 🔎 FULL-TEXT SEARCH
+# ------------------------------
+SEARCH_FIELDS = ['subject', 'summary', 'aireply', 'sender name', 'sender email']
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+PREFIX_EXPANSION_LIMIT = 50
+
+def search_documents(df):
+    """One lowercased, tag-free text blob per row over the searchable columns."""
+    text = pd.Series('', index=df.index)
+    for col in SEARCH_FIELDS:
+        if col in df.columns:
+            text = text + ' ' + df[col].fillna('').astype(str)
+    return text.str.replace('<[^<]+?>', ' ', regex=True).str.lower()
+
+class SearchIndex:
+    """Inverted index with BM25 ranking, updated incrementally as rows arrive or change."""
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self):
+        self.postings = {}
+        self.doc_rows = []
+        self.doc_lengths = []
+        self.alive = []
+        self.row_docs = {}
+        self.row_hashes = None
+        self._frozen = None
+
+    def sync(self, df):
+        hashes = pd.util.hash_pandas_object(df[[c for c in SEARCH_FIELDS if c in df.columns]], index=False).to_numpy()
+        if self.row_hashes is None:
+            dirty = np.arange(len(df))
+        else:
+            known = min(len(self.row_hashes), len(hashes))
+            dirty = np.concatenate([
+                np.nonzero(self.row_hashes[:known] != hashes[:known])[0],
+                np.arange(known, len(hashes)),
+            ])
+            for pos in range(len(hashes), len(self.row_hashes)):
+                self._retire(pos)
+        if len(dirty):
+            self._add(dirty, search_documents(df.iloc[dirty]).tolist())
+        self.row_hashes = hashes
+        return len(dirty)
+
+    def copy(self):
+        """An independent index over the same documents; posting arrays are never modified in place, so they are shared."""
+        clone = SearchIndex()
+        clone.postings = {term: list(chunks) for term, chunks in self.postings.items()}
+        clone.doc_rows = list(self.doc_rows)
+        clone.doc_lengths = list(self.doc_lengths)
+        clone.alive = list(self.alive)
+        clone.row_docs = dict(self.row_docs)
+        clone.row_hashes = self.row_hashes
+        return clone
+
+    def _retire(self, pos):
+        doc = self.row_docs.pop(pos, None)
+        if doc is not None:
+            self.alive[doc] = False
+            self._frozen = None
+
+    def _add(self, positions, texts):
+        for pos in positions.tolist():
+            self._retire(pos)
+        base = len(self.doc_rows)
+        new_docs = np.arange(base, base + len(texts))
         
-        ai_reply = ""
-        if has_ai_reply:
-            template = random.choice(ai_reply_templates)
-            ai_reply = f"<div style='font-family: Arial, sans-serif;'><p>Dear {sender_name},</p>{template.format(subject=subject)}</div>"
+        # Count (term, doc) pairs for the whole batch with one integer sort
+        # instead of a Counter per document.
+        token_lists = [TOKEN_PATTERN.findall(text) for text in texts]
+        doc_lengths = np.fromiter((len(tokens) for tokens in token_lists), dtype=np.int64, count=len(token_lists))
+        flat = np.array([token for tokens in token_lists for token in tokens], dtype=object)
         
-        emails.append({
-            "sender name": sender_name,
-            "sender email": sender_email,
-            "subject": subject,
-            "summary": summary,
-            "date": date,
-            "attachment": has_attachment,
-            "aireply": ai_reply,
-            "department": department,
-            "priority": priority
-        })
+        if len(flat):
+            term_codes, vocab = pd.factorize(flat)
+            keys = term_codes.astype(np.int64) * len(texts) + np.repeat(np.arange(len(texts)), doc_lengths)
+            keys, tfs = np.unique(keys, return_counts=True)
+            pair_terms, docs = np.divmod(keys, len(texts))
+            docs += base
+            tfs = tfs.astype(np.float64)
+            bounds = np.r_[0, np.flatnonzero(np.diff(pair_terms)) + 1, len(keys)].tolist()
+            for term, start, end in zip(vocab[pair_terms[bounds[:-1]]], bounds[:-1], bounds[1:]):
+                self.postings.setdefault(term, []).append((docs[start:end], tfs[start:end]))
         
-    return pd.DataFrame(emails)
+        self.doc_rows.extend(positions.tolist())
+        self.doc_lengths.extend(doc_lengths.tolist())
+        self.alive.extend([True] * len(texts))
+        self.row_docs.update(zip(positions.tolist(), new_docs.tolist()))
+        self._frozen = None
+
+    def _freeze(self):
+        # Numpy views of the postings are built lazily after each batch of adds.
+        if self._frozen is None:
+            lengths = np.asarray(self.doc_lengths, dtype=np.float64)
+            alive = np.asarray(self.alive, dtype=bool)
+            self._frozen = {
+                'rows': np.asarray(self.doc_rows, dtype=np.int64),
+                'lengths': lengths,
+                'alive': alive,
+                'avgdl': float(lengths[alive].mean()) if alive.any() else 1.0,
+                'vocab': sorted(self.postings),
+                'arrays': {},
+            }
+        return self._frozen
+
+    def _posting_arrays(self, term):
+        frozen = self._freeze()
+        arrays = frozen['arrays'].get(term)
+        if arrays is None:
+            chunks = self.postings[term]
+            if len(chunks) > 1:
+                chunks[:] = [(np.concatenate([c[0] for c in chunks]), np.concatenate([c[1] for c in chunks]))]
+            arrays = frozen['arrays'][term] = chunks[0]
+        return arrays
+
+    def expand_terms(self, query):
+        """Query tokens; the last one also matches as a prefix for search-as-you-type."""
+        tokens = TOKEN_PATTERN.findall(str(query).lower())
+        if not tokens:
+            return []
+        terms = [t for t in tokens[:-1] if t in self.postings]
+        vocab = self._freeze()['vocab']
+        start = bisect.bisect_left(vocab, tokens[-1])
+        for term in vocab[start:start + PREFIX_EXPANSION_LIMIT]:
+            if not term.startswith(tokens[-1]):
+                break
+            terms.append(term)
+        return list(dict.fromkeys(terms))
+
+    def search(self, query):
+        """Row positions ranked by BM25 score, best first."""
+        frozen = self._freeze()
+        terms = self.expand_terms(query)
+        if not terms:
+            return np.empty(0, dtype=np.int64)
+        n_docs = int(frozen['alive'].sum())
+        scores = np.zeros(len(self.doc_rows))
+        for term in terms:
+            docs, tfs = self._posting_arrays(term)
+            idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            norm = self.K1 * (1 - self.B + self.B * frozen['lengths'][docs] / frozen['avgdl'])
+            scores[docs] += idf * tfs * (self.K1 + 1) / (tfs + norm)
+        scores[~frozen['alive']] = 0
+        hits = np.nonzero(scores > 0)[0]
+        hits = hits[np.argsort(-scores[hits], kind='stable')]
+        return frozen['rows'][hits]
+
+def ensure_search_index(entry):
+    """entry's search index, built or synced from the one it inherited if that has not happened yet."""
+    with entry.search_lock:
+        if entry.search_index is None:
+            entry.search_index = SearchIndex()
+        if not entry.search_synced:
+            entry.search_index.sync(entry.df)
+            entry.search_synced = True
+        return entry.search_index
+
+def start_search_index(entry):
+    """Build entry's search index on a background thread, so loading a dataset never waits for it."""
+    with entry.search_lock:
+        if entry.search_synced or entry.search_started:
+            return
+        entry.search_started = True
+    threading.Thread(target=ensure_search_index, args=(entry,), name="search-index", daemon=True).start()
+
+def get_search_index():
+    # Waits for a background build still in progress, or builds the index here if none was started.
+    return ensure_search_index(st.session_state['dataset'].entry)
+
+def search_snippet(email_data, terms, width=80):
+    """Short excerpt around the first matching term, with matches wrapped in <mark>."""
+    if not terms:
+        return ""
+    pattern = re.compile(r"\b(" + "|".join(re.escape(t) for t in sorted(terms, key=len, reverse=True)) + r")", re.IGNORECASE)
+    for field in ['summary', 'aireply', 'subject']:
+        text = re.sub('<[^<]+?>', ' ', str(email_data.get(field, '') or ''))
+        text = re.sub(r"\s+", ' ', text).strip()
+        match = pattern.search(text)
+        if match:
+            start = max(0, match.start() - width // 2)
+            excerpt = text[start:start + width]
+            excerpt = ("…" if start else "") + excerpt + ("…" if start + width < len(text) else "")
+            return pattern.sub(r"<mark>\1</mark>", excerpt)
+    return ""
 
 # ------------------------------
 # 📊 UI RENDERING FUNCTIONS
 # ------------------------------
 def display_stats(df):
-    total_emails = len(df)
-    with_attachments = df[df['attachment'].str.lower().isin(['yes', 'true', '1'])].shape[0]
-    high_priority = df[df['priority'] == 'high'].shape[0]
-    ai_replies_ready = df[df['aireply'].apply(lambda x: bool(x and str(x).strip() not in ["", "nan", "None", "null"]))].shape[0]
+    live = ~archived_mask(df.index)
+    total_emails = int(live.sum())
+    with_attachments = int((df['has_attachment'].to_numpy() & live).sum())
+    high_priority = int(((df['priority'] == 'high').to_numpy() & live).sum())
+    ai_replies_ready = int((df['has_ai_reply'].to_numpy() & live).sum())
     
     st.markdown(f"""
     <div class="stats-container">
@@ -599,36 +2833,24 @@ def display_stats(df):
     </div>
     """, unsafe_allow_html=True)
 
-def display_email_card(email_data, index, credentials_dict=None):
+def build_email_card_html(email_data, snippet=""):
     sender_name = email_data.get("sender name", "Unknown Sender")
     sender_email = email_data.get("sender email", "")
     subject = email_data.get("subject", "No Subject")
     summary = email_data.get("summary", "No summary available")
-    date = email_data.get("date", "")
-    attachment = email_data.get("attachment", "No")
-    ai_reply = email_data.get("aireply", "")
     department = email_data.get("department", "General")
     priority = email_data.get("priority", "low")
-    
-    initials = get_initials(sender_name)
-
-    try:
-        formatted_date = datetime.strptime(str(date), "%Y-%m-%d").strftime("%b %d, %Y")
-    except Exception:
-        formatted_date = str(date)
-
-    has_attachment = str(attachment).lower() in ["yes", "true", "1"]
-    has_ai_reply = bool(ai_reply and str(ai_reply).strip() not in ["", "nan", "None", "null"])
+    initials = email_data.get("initials", "?")
+    formatted_date = email_data.get("date_display", "")
+    has_attachment = bool(email_data.get("has_attachment", False))
+    has_ai_reply = bool(email_data.get("has_ai_reply", False))
     
     attachment_tag = '<span class="tag attachment">📎 Attachment</span>' if has_attachment else '<span class="tag no-attachment">No Attachment</span>'
     ai_tag = '<span class="tag ai">🤖 AI Suggestion</span>' if has_ai_reply else ''
     
     ai_reply_preview = ""
     if has_ai_reply:
-        preview_text = re.sub('<[^<]+?>', '', str(ai_reply))
-        preview_text = preview_text.replace('\n', ' ').strip()
-        preview_text = preview_text[:150] + "..." if len(preview_text) > 150 else preview_text
-        ai_reply_preview = f'<div class="ai-reply-preview"><strong>AI Suggestion:</strong> {preview_text}</div>'
+        ai_reply_preview = f'<div class="ai-reply-preview"><strong>AI Suggestion:</strong> {email_data.get("ai_preview", "")}</div>'
 
     card_html = f"""
     <div class="email-card priority-{priority}">
@@ -641,6 +2863,7 @@ def display_email_card(email_data, index, credentials_dict=None):
         </div>
         <div class="subject">{subject}</div>
         <div class="summary">{summary}</div>
+        {f'<div class="search-snippet">🔎 {snippet}</div>' if snippet else ''}
         {ai_reply_preview}
         <div class="email-meta">
             <div class="date">📅 {formatted_date} | 🏢 {department} | Priority: {priority.upper()}</div>
@@ -648,7 +2871,14 @@ def display_email_card(email_data, index, credentials_dict=None):
         </div>
     </div>
     """
-    st.markdown(card_html, unsafe_allow_html=True)
+    return card_html
+
+def display_email_card(email_data, index, credentials_dict=None, snippet="", archived=False):
+    summary = email_data.get("summary", "No summary available")
+    ai_reply = email_data.get("aireply", "")
+    has_ai_reply = bool(email_data.get("has_ai_reply", False))
+    
+    st.markdown(build_email_card_html(email_data, snippet), unsafe_allow_html=True)
     
     col1, col2, col3, col4 = st.columns([2, 2, 2, 2])
     with col1:
@@ -665,23 +2895,15 @@ def display_email_card(email_data, index, credentials_dict=None):
             st.rerun()
     with col3:
         if st.button("📋 Save as Draft", key=f"draft_{index}", use_container_width=True):
-            if 'drafts' not in st.session_state:
-                st.session_state['drafts'] = []
-            
-            draft = {
-                'sender name': sender_name,
-                'sender email': sender_email,
-                'subject': f"Re: {subject}",
-                'body': ai_reply if ai_reply else f"Replying to: {summary[:100]}...",
-                'timestamp': datetime.now().isoformat(),
-                'to': sender_email,
-                'original_email': email_data
-            }
-            st.session_state['drafts'].append(draft)
-            st.toast("📋 Draft saved successfully!", icon="✅")
+            save_draft(email_data, ai_reply if ai_reply else f"Replying to: {summary[:100]}...", credentials_dict)
     with col4:
-        if st.button("✅ Archive", key=f"archive_{index}", use_container_width=True):
-            st.toast(f"Archived email from {sender_name}!", icon="✅")
+        # Callbacks run before the next script pass, so the card is gone on that rerun.
+        if archived:
+            st.button("↩️ Unarchive", key=f"unarchive_{index}", use_container_width=True,
+                      on_click=archive_rows, args=([email_data['row_id']], credentials_dict, False))
+        else:
+            st.button("✅ Archive", key=f"archive_{index}", use_container_width=True,
+                      on_click=archive_rows, args=([email_data['row_id']], credentials_dict))
     
     st.markdown("---")
 
@@ -730,23 +2952,34 @@ def render_compose(email_data=None):
                 initial_body = ai_reply_body if ai_reply_body else "No AI suggestion available for this email."
             elif reply_method == "Use Template":
                 st.markdown("**Select a Template:**")
-                templates = {
-                    "Acknowledgment": f"<p>Dear {email_data.get('sender name', 'there')},</p><p>Thank you for your email regarding <strong>{email_data.get('subject', 'this matter')}</strong>. I have reviewed the details and will follow up with specific action items by end of day.</p><p>In the meantime, please let me know if you need any additional information.</p><p>Best regards</p>",
-                    "Schedule Meeting": f"<p>Dear {email_data.get('sender name', 'there')},</p><p>Regarding <strong>{email_data.get('subject', 'this matter')}</strong>, I suggest we schedule a brief meeting to discuss this in detail. I have availability tomorrow afternoon or Thursday morning.</p><p>Please let me know what works best for you.</p><p>Best regards</p>",
-                    "Request More Info": f"<p>Dear {email_data.get('sender name', 'there')},</p><p>Thank you for reaching out about <strong>{email_data.get('subject', 'this matter')}</strong>. To better assist you, could you please provide additional details about:</p><ul><li>Specific requirements</li><li>Timeline expectations</li><li>Any relevant documentation</li></ul><p>Looking forward to your response.</p><p>Best regards</p>",
-                    "Approval": f"<p>Dear {email_data.get('sender name', 'there')},</p><p>Thank you for the update on <strong>{email_data.get('subject', 'this matter')}</strong>. I have reviewed the information and approve the proposed approach.</p><p>Let us proceed as discussed and reconvene next week to review progress.</p><p>Best regards</p>",
-                    "Follow Up": f"<p>Dear {email_data.get('sender name', 'there')},</p><p>I have received your email about <strong>{email_data.get('subject', 'this matter')}</strong> and am currently reviewing the details. I should have feedback for you by tomorrow morning.</p><p>Thanks for your patience on this matter.</p><p>Best regards</p>"
-                }
+                registry = get_template_registry()
                 
                 template_choice = st.selectbox(
                     "Choose a template:",
-                    options=list(templates.keys())
+                    options=registry.names()
                 )
                 
                 if template_choice:
-                    initial_body = templates[template_choice]
+                    initial_body = registry.render(template_choice, email_data)
                     st.markdown("**Template Preview:**")
                     st.markdown(f"<div style='background: #f9f9f9; padding: 15px; border-radius: 8px; border-left: 4px solid #4CAF50;'>{initial_body}</div>", unsafe_allow_html=True)
+                    if registry.is_custom(template_choice):
+                        if st.button("🗑️ Delete this template", key=f"delete_template_{template_choice}"):
+                            registry.delete(template_choice)
+                            st.toast(f"Template '{template_choice}' deleted.", icon="🗑️")
+                            st.rerun()
+                
+                with st.expander("➕ Save a custom template", expanded=False):
+                    st.caption("Use `{{column}}` or `{{column|fallback}}` placeholders, e.g. `{{sender name|there}}`, `{{subject}}`.")
+                    new_template_name = st.text_input("Template name:", key='new_template_name')
+                    new_template_body = st.text_area("Template body:", key='new_template_body', height=150)
+                    if st.button("💾 Save Template", key='save_template'):
+                        if new_template_name.strip() and new_template_body.strip():
+                            registry.save(new_template_name.strip(), new_template_body)
+                            st.toast(f"Template '{new_template_name.strip()}' saved.", icon="💾")
+                            st.rerun()
+                        else:
+                            st.error("❌ Please provide both a name and a body for the template.")
         else:
             st.info("Composing a new email.")
             reply_subject = ""
@@ -812,8 +3045,6 @@ def render_compose(email_data=None):
         
         if send_button:
             if to_address and subject and body:
-                if 'sent_emails' not in st.session_state:
-                    st.session_state['sent_emails'] = []
                 attachments_list = [file.name for file in uploaded_files] if uploaded_files else []
                 sent_record = {
                     "to": to_address,
@@ -825,20 +3056,19 @@ def render_compose(email_data=None):
                     "timestamp": datetime.now().isoformat(),
                     "original_email": email_data,
                 }
-                st.session_state['sent_emails'].append(sent_record)
+                sent_id = mailstore_add(SENT_TABLE, sent_record)
 
-                # Optional real send via Gmail secrets
+                # Optional real send via Gmail secrets; delivery happens on the outbox workers
                 if GMAIL_EMAIL and GMAIL_PASSWORD:
-                    ok = send_mail_smtp(to_address, subject, body if editor_mode == "Plain Text" else re.sub('<[^<]+?>', '', body))
+                    ok = send_mail_smtp(to_address, subject, body, sent_id=sent_id, cc_address=cc_address,
+                                        editor_mode=editor_mode, attachments=uploaded_files)
                     if ok:
-                        st.success(f"✅ Email sent via Gmail to {to_address}!")
+                        st.toast(f"📤 Email to {to_address} queued for delivery.", icon="✅")
                     else:
-                        st.warning("Logged to Sent, but Gmail send failed.")
+                        st.toast("Logged to Sent, but the email could not be queued.", icon="⚠️")
                 else:
-                    st.success(f"✅ Email logged as sent to {to_address} (no SMTP configured).")
+                    st.toast(f"Email logged as sent to {to_address} (no SMTP configured).", icon="✅")
 
-                st.balloons()
-                time.sleep(1)
                 st.session_state['page'] = 'inbox'
                 st.session_state['selected_email'] = None
                 st.session_state['use_ai_reply'] = False
@@ -847,9 +3077,6 @@ def render_compose(email_data=None):
                 st.error("❌ Please fill in To, Subject, and Body fields before sending.")
         
         if draft_button:
-            if 'drafts' not in st.session_state:
-                st.session_state['drafts'] = []
-            
             draft = {
                 'subject': subject,
                 'body': body,
@@ -860,7 +3087,7 @@ def render_compose(email_data=None):
                 'attachments': [file.name for file in uploaded_files] if uploaded_files else [],
                 'original_email': email_data
             }
-            st.session_state['drafts'].append(draft)
+            mailstore_add(DRAFTS_TABLE, draft)
             st.success("📋 Draft saved successfully!")
             time.sleep(1)
             st.session_state['page'] = 'drafts'
@@ -883,7 +3110,8 @@ def render_compose(email_data=None):
 def render_drafts():
     st.markdown("## 📋 Drafts")
     
-    if 'drafts' not in st.session_state or len(st.session_state['drafts']) == 0:
+    total_drafts = mailstore_count(DRAFTS_TABLE)
+    if total_drafts == 0:
         st.info("No drafts saved yet. Compose an email and save it as a draft to see it here!")
         
         if st.button("✉️ Compose New Email"):
@@ -892,10 +3120,15 @@ def render_drafts():
             st.rerun()
         return
     
-    st.success(f"You have **{len(st.session_state['drafts'])}** saved draft(s).")
+    st.success(f"You have **{total_drafts}** saved draft(s).")
     st.markdown("---")
     
-    for idx, draft in enumerate(st.session_state['drafts']):
+    total_pages = max(1, -(-total_drafts // MAILSTORE_PAGE_SIZE))
+    st.session_state['drafts_page'] = max(1, min(st.session_state.get('drafts_page', 1), total_pages))
+    drafts = mailstore_page(DRAFTS_TABLE, MAILSTORE_PAGE_SIZE, (st.session_state['drafts_page'] - 1) * MAILSTORE_PAGE_SIZE, newest_first=False)
+    
+    for draft in drafts:
+        draft_id = draft['id']
         subject = draft.get('subject', 'No Subject')
         body = draft.get('body', 'No content')
         timestamp = draft.get('timestamp', datetime.now().isoformat())
@@ -945,22 +3178,42 @@ def render_drafts():
         
         col1, col2, col3 = st.columns([1, 1, 3])
         with col1:
-            if st.button("✏️ Edit", key=f"edit_draft_{idx}", use_container_width=True):
+            if st.button("✏️ Edit", key=f"edit_draft_{draft_id}", use_container_width=True):
                 st.session_state['selected_email'] = draft.get('original_email')
                 st.session_state['page'] = 'compose'
                 st.rerun()
         with col2:
-            if st.button("🗑️ Delete", key=f"delete_draft_{idx}", use_container_width=True):
-                st.session_state['drafts'].pop(idx)
+            if st.button("🗑️ Delete", key=f"delete_draft_{draft_id}", use_container_width=True):
+                mailstore_delete(DRAFTS_TABLE, draft_id)
                 st.toast("Draft deleted!", icon="🗑️")
                 st.rerun()
         
         st.markdown("---")
+    
+    if total_pages > 1:
+        render_pagination('drafts_page', total_pages, "drafts")
+
+OUTBOX_STATUS_LABELS = {
+    'queued': "⏳ Queued",
+    'sending': "📡 Sending",
+    'sent': "✅ Delivered",
+    'failed': "❌ Failed",
+}
+
+@st.fragment(run_every=2)
+def render_outbox_status():
+    summary = outbox_summary()
+    if not summary:
+        return
+    cols = st.columns(len(OUTBOX_STATUS_LABELS))
+    for col, (status, label) in zip(cols, OUTBOX_STATUS_LABELS.items()):
+        col.metric(label, summary.get(status, 0))
 
 def render_sent():
     st.markdown("## 📤 Sent Emails")
 
-    if 'sent_emails' not in st.session_state or len(st.session_state['sent_emails']) == 0:
+    total_sent = mailstore_count(SENT_TABLE)
+    if total_sent == 0:
         st.info("No sent emails yet. Send an email from Compose to see it here!")
         if st.button("✉️ Compose New Email"):
             st.session_state['page'] = 'compose'
@@ -968,11 +3221,19 @@ def render_sent():
             st.rerun()
         return
 
-    st.success(f"You have **{len(st.session_state['sent_emails'])}** sent email(s).")
+    st.success(f"You have **{total_sent}** sent email(s).")
+    render_outbox_status()
     st.markdown("---")
 
-    for idx, sent in enumerate(reversed(st.session_state['sent_emails'])):
-        real_index = len(st.session_state['sent_emails']) - 1 - idx
+    total_pages = max(1, -(-total_sent // MAILSTORE_PAGE_SIZE))
+    st.session_state['sent_page'] = max(1, min(st.session_state.get('sent_page', 1), total_pages))
+    sent_page = mailstore_page(SENT_TABLE, MAILSTORE_PAGE_SIZE, (st.session_state['sent_page'] - 1) * MAILSTORE_PAGE_SIZE)
+
+    outbox_jobs = outbox_jobs_for([sent['id'] for sent in sent_page])
+
+    for sent in sent_page:
+        sent_id = sent['id']
+        job = outbox_jobs.get(sent_id)
 
         subject = sent.get("subject", "No Subject")
         body = sent.get("body", "No content")
@@ -995,7 +3256,7 @@ def render_sent():
         sent_html = f"""
         <div class="draft-card sent">
             <div class="draft-timestamp">
-                🕒 Sent: {formatted_timestamp}
+                🕒 Sent: {formatted_timestamp}{f" · {OUTBOX_STATUS_LABELS.get(job['status'], job['status'])}" if job else ""}
             </div>
             <div class="draft-subject">{subject}</div>
             <div class="draft-body-container">
@@ -1011,9 +3272,16 @@ def render_sent():
         """
         st.markdown(sent_html, unsafe_allow_html=True)
 
+        if job and job['status'] == 'failed':
+            st.error(f"Delivery failed after {job['attempts']} attempt(s): {job['last_error']}")
+            if st.button("🔄 Retry delivery", key=f"retry_outbox_{job['id']}"):
+                outbox_retry(job['id'])
+                get_outbox().wakeup.set()
+                st.rerun()
+
         col1, col2, col3 = st.columns([1, 1, 2])
         with col1:
-            if st.button("🔁 Re-send", key=f"resend_{real_index}", use_container_width=True):
+            if st.button("🔁 Re-send", key=f"resend_{sent_id}", use_container_width=True):
                 st.session_state['selected_email'] = None
                 st.session_state['page'] = 'compose'
                 st.session_state['compose_preset'] = {
@@ -1025,10 +3293,8 @@ def render_sent():
                 }
                 st.rerun()
         with col2:
-            if st.button("📋 Copy to Draft", key=f"copy_to_draft_{real_index}", use_container_width=True):
-                if 'drafts' not in st.session_state:
-                    st.session_state['drafts'] = []
-                st.session_state['drafts'].append({
+            if st.button("📋 Copy to Draft", key=f"copy_to_draft_{sent_id}", use_container_width=True):
+                mailstore_add(DRAFTS_TABLE, {
                     "subject": subject,
                     "body": body,
                     "timestamp": datetime.now().isoformat(),
@@ -1041,17 +3307,112 @@ def render_sent():
                 st.toast("Copied to Drafts!", icon="✅")
                 st.rerun()
         with col3:
-            if st.button("🗑️ Delete", key=f"delete_sent_{real_index}", use_container_width=True):
-                st.session_state['sent_emails'].pop(real_index)
+            if st.button("🗑️ Delete", key=f"delete_sent_{sent_id}", use_container_width=True):
+                mailstore_delete(SENT_TABLE, sent_id)
                 st.toast("Sent record deleted.", icon="🗑️")
                 st.rerun()
 
         st.markdown("---")
 
+    if total_pages > 1:
+        render_pagination('sent_page', total_pages, "sent")
+
+INBOX_PAGE_SIZES = [10, 25, 50, 100]
+MAILSTORE_PAGE_SIZE = 20
+
+def _reset_inbox_page():
+    st.session_state['inbox_page'] = 1
+
+def _step_page(state_key, delta, total_pages):
+    page = st.session_state.get(state_key, 1) + delta
+    st.session_state[state_key] = max(1, min(page, total_pages))
+
+def render_pagination(state_key, total_pages, position):
+    page = st.session_state[state_key]
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col1:
+        st.button("⬅️ Previous", key=f"{state_key}_prev_{position}", disabled=page <= 1, use_container_width=True,
+                  on_click=_step_page, args=(state_key, -1, total_pages))
+    with col2:
+        st.markdown(f"<div style='text-align: center; padding-top: 6px;'>Page <strong>{page}</strong> of <strong>{total_pages}</strong></div>", unsafe_allow_html=True)
+    with col3:
+        st.button("Next ➡️", key=f"{state_key}_next_{position}", disabled=page >= total_pages, use_container_width=True,
+                  on_click=_step_page, args=(state_key, 1, total_pages))
+
+def _send_merge_batch(df, subject_template, body_template, editor_mode):
+    # Runs as the button callback so the confirmation checkbox can be reset
+    # before it is drawn again; each rendered batch is only ever queued once.
+    records = merge_batch(df, subject_template, body_template, editor_mode)
+    batch_key = merge_batch_key(records)
+    sent_batches = st.session_state.setdefault('merge_sent_batches', set())
+    st.session_state['merge_confirm'] = False
+    if batch_key in sent_batches:
+        st.session_state['merge_result'] = ('warning', "⚠️ This batch was already sent. Change the templates or the inbox view to send another.")
+        return
+    started = time.perf_counter()
+    count = send_merge_batch(records)
+    sent_batches.add(batch_key)
+    elapsed = time.perf_counter() - started
+    verb = "queued" if GMAIL_EMAIL and GMAIL_PASSWORD else "logged to Sent (no SMTP configured)"
+    st.session_state['merge_result'] = ('success', f"✅ {count} email(s) {verb} in {elapsed:.2f}s.")
+
+def render_mail_merge(df):
+    st.markdown("## 📨 Mail Merge")
+    st.info(f"Personalized replies for the **{len(df)}** email(s) in the current inbox view. "
+            "Use `{{column}}` placeholders, e.g. `{{sender name}}`, `{{subject}}`, `{{summary}}`.")
+    
+    registry = get_template_registry()
+    
+    def _load_merge_template():
+        st.session_state['merge_body'] = registry.text(st.session_state['merge_template'])
+    
+    st.selectbox("Start from template:", registry.names(), key='merge_template', on_change=_load_merge_template)
+    subject_template = st.text_input("📋 Subject template:", value=MERGE_DEFAULT_SUBJECT, key='merge_subject')
+    editor_mode = st.selectbox("Editor Mode:", ["HTML", "Plain Text"], key='merge_editor_mode')
+    if 'merge_body' not in st.session_state:
+        st.session_state['merge_body'] = MERGE_DEFAULT_BODY
+    body_template = st.text_area("📝 Body template:", height=250, key='merge_body')
+    preview_count = st.slider("Dry-run preview rows:", min_value=1, max_value=20, value=3, key='merge_preview_count')
+    
+    _, fields = compile_merge_template(subject_template + body_template)
+    missing = sorted({field for field, _ in fields} - set(df.columns))
+    if missing:
+        st.error(f"❌ Unknown placeholder(s): {', '.join('{{' + f + '}}' for f in missing)}")
+        return
+    
+    st.markdown("### 👁️ Dry-run Preview")
+    preview_rows = df.head(preview_count)
+    for idx, email_data in zip(preview_rows.index, preview_rows.to_dict('records')):
+        email_data['row_id'] = idx
+        record = {
+            'to': email_data.get(MERGE_RECIPIENT_FIELD, ''),
+            'subject': registry.render_text(subject_template, email_data),
+            'body': registry.render_text(body_template, email_data),
+        }
+        display_body = record['body'] if editor_mode == "HTML" else record['body'].replace(chr(10), "<br>")
+        st.markdown(f"""
+        <div style='background: white; padding: 20px; border-radius: 10px; border: 2px solid #e0e0e0; margin-bottom: 12px;'>
+            <div style='color: black;'><strong>To:</strong> {record['to']}</div>
+            <div style='color: black;'><strong>Subject:</strong> {record['subject']}</div>
+            <hr style='margin: 15px 0;'>
+            <div style='color: black;'>{display_body}</div>
+        </div>
+        """, unsafe_allow_html=True)
+    
+    st.markdown("---")
+    confirm = st.checkbox(f"I want to send {len(df)} personalized email(s)", key='merge_confirm')
+    st.button("📤 Send Batch", type="primary", disabled=not confirm or len(df) == 0,
+              on_click=_send_merge_batch, args=(df, subject_template, body_template, editor_mode))
+    result = st.session_state.pop('merge_result', None)
+    if result:
+        level, message = result
+        getattr(st, level)(message)
+
 def render_inbox(df, credentials_dict=None):
     st.markdown("## 📥 Inbox")
     
-    display_stats(df)
+    with profile_stage("display_stats"):
+        display_stats(df)
     
     st.markdown("---")
     st.markdown(f"### 📬 {len(df)} Email(s)")
@@ -1060,25 +3421,208 @@ def render_inbox(df, credentials_dict=None):
         st.info("No emails to display with the current filters.")
         return
     
-    for idx, row in df.iterrows():
-        display_email_card(row.to_dict(), idx, credentials_dict)
+    archived = archived_mask(df.index)
+    if st.session_state.get('show_archived'):
+        if archived.any():
+            st.button(f"↩️ Unarchive {int(archived.sum())} Shown", key='unarchive_all',
+                      on_click=archive_rows, args=(df.index[archived].tolist(), credentials_dict, False))
+    else:
+        st.button(f"✅ Archive All {len(df)} Shown", key='archive_all',
+                  on_click=archive_rows, args=(df.index.tolist(), credentials_dict))
+    
+    # Only the visible window is turned into widgets, so a rerun costs the
+    # same whether the sheet holds fifty rows or fifty thousand.
+    page_size = st.selectbox(
+        "Emails per page:",
+        INBOX_PAGE_SIZES,
+        index=INBOX_PAGE_SIZES.index(25),
+        key='inbox_page_size',
+        on_change=_reset_inbox_page
+    )
+    total_pages = max(1, -(-len(df) // page_size))
+    st.session_state['inbox_page'] = max(1, min(st.session_state.get('inbox_page', 1), total_pages))
+    start = (st.session_state['inbox_page'] - 1) * page_size
+    window = df.iloc[start:start + page_size]
+    window_archived = archived[start:start + page_size]
+    
+    st.caption(f"Showing {start + 1}–{start + len(window)} of {len(df)}")
+    render_pagination('inbox_page', total_pages, "top")
+    st.markdown("---")
+    
+    search_terms = st.session_state.get('search_terms', [])
+    
+    # Widget keys use the row's index label, so they stay stable across pages.
+    for (idx, row), is_archived in zip(window.iterrows(), window_archived):
+        email_data = row.to_dict()
+        email_data['row_id'] = idx
+        display_email_card(email_data, idx, credentials_dict, snippet=search_snippet(email_data, search_terms), archived=is_archived)
+    
+    render_pagination('inbox_page', total_pages, "bottom")
+
+# ------------------------------
+# ⏱️ RERUN PROFILING
+# ------------------------------
+PROFILE_ENABLED = bool(st.secrets.get("debug", {}).get("profile", False))
+PROFILE_LOG_PATH = os.path.join(DATA_DIR, "profile.log")
+PROFILE_LOG_MAX_BYTES = 5 * 2 ** 20
+PROFILE_LOG_BACKUPS = 3
+PROFILE_HISTORY = 20
+PROFILE_STAGE_COLUMNS = ['stage', 'depth', 'ms', 'alloc_kb', 'peak_kb']
+
+class AllocationTracer:
+    """Reference-counted tracemalloc switch, so tracing only runs while some rerun is being profiled."""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.users = 0
+    
+    def acquire(self):
+        with self.lock:
+            self.users += 1
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+    
+    def release(self):
+        with self.lock:
+            self.users = max(0, self.users - 1)
+            if self.users == 0 and tracemalloc.is_tracing():
+                tracemalloc.stop()
+
+@st.cache_resource(show_spinner=False)
+def get_allocation_tracer():
+    return AllocationTracer()
+
+@st.cache_resource(show_spinner=False)
+def get_profile_log(path=PROFILE_LOG_PATH):
+    """JSON-lines logger rotating at PROFILE_LOG_MAX_BYTES, one line per profiled rerun."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    logger = logging.getLogger(f"inboxkeep.profile.{path}")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    handler = RotatingFileHandler(path, maxBytes=PROFILE_LOG_MAX_BYTES, backupCount=PROFILE_LOG_BACKUPS, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    return logger
+
+# tracemalloc is process-wide, so background threads and other sessions' reruns are counted too.
+class RerunProfile:
+    """Wall time and allocations per named stage of one script run."""
+    
+    def __init__(self, session_id, page):
+        self.session_id = session_id
+        self.page = page
+        self.started_at = datetime.now().isoformat(timespec='seconds')
+        self.started = time.perf_counter()
+        self.stages = []
+        self.open_peaks = []
+        get_allocation_tracer().acquire()
+    
+    @contextmanager
+    def stage(self, name):
+        # Stages are listed in the order they open, with depth for nesting.
+        entry = {'stage': name, 'depth': len(self.open_peaks)}
+        self.stages.append(entry)
+        base, peak = tracemalloc.get_traced_memory()
+        if self.open_peaks:
+            self.open_peaks[-1] = max(self.open_peaks[-1], peak)
+        tracemalloc.reset_peak()
+        self.open_peaks.append(base)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            current, peak = tracemalloc.get_traced_memory()
+            peak = max(self.open_peaks.pop(), peak)
+            if self.open_peaks:
+                self.open_peaks[-1] = max(self.open_peaks[-1], peak)
+            tracemalloc.reset_peak()
+            entry['ms'] = round(seconds * 1000, 2)
+            entry['alloc_kb'] = round((current - base) / 1024, 1)
+            entry['peak_kb'] = round((peak - base) / 1024, 1)
+    
+    def finish(self):
+        get_allocation_tracer().release()
+        return {
+            'ts': self.started_at,
+            'session': self.session_id,
+            'page': self.page,
+            'total_ms': round((time.perf_counter() - self.started) * 1000, 2),
+            'stages': [entry for entry in self.stages if 'ms' in entry],
+        }
+
+def profile_stage(name):
+    """Time the enclosed block as a stage of the current rerun; a no-op unless profiling is on."""
+    profile = st.session_state.get('rerun_profile')
+    return profile.stage(name) if profile is not None else nullcontext()
+
+def begin_rerun_profile():
+    if 'profile_enabled' not in st.session_state:
+        st.session_state['profile_enabled'] = PROFILE_ENABLED
+    if not st.session_state['profile_enabled']:
+        st.session_state.pop('rerun_profile', None)
+        return None
+    if 'profile_session_id' not in st.session_state:
+        st.session_state['profile_session_id'] = os.urandom(4).hex()
+    profile = RerunProfile(st.session_state['profile_session_id'], st.session_state.get('page', 'inbox'))
+    st.session_state['rerun_profile'] = profile
+    return profile
+
+# Also runs when st.rerun() stops the script early, so those reruns show the stages they reached.
+def end_rerun_profile(profile):
+    """Close the rerun's profile, keep it for the panel and append it to the log."""
+    st.session_state.pop('rerun_profile', None)
+    record = profile.finish()
+    history = st.session_state.setdefault('profile_history', [])
+    history.append(record)
+    del history[:-PROFILE_HISTORY]
+    try:
+        get_profile_log().info(json.dumps(record))
+    except OSError:
+        pass
+
+def render_profile_panel():
+    st.markdown("---")
+    st.checkbox("🐞 Profile reruns", key='profile_enabled', help=f"Time each stage of every rerun and log it to {PROFILE_LOG_PATH}")
+    history = st.session_state.get('profile_history', [])
+    if not st.session_state['profile_enabled'] or not history:
+        return
+    # The current rerun is still running, so the panel shows the ones before it.
+    last = history[-1]
+    with st.expander(f"⏱️ Last rerun: {last['total_ms']:.0f} ms ({last['page']})", expanded=False):
+        # Reruns cut short by st.rerun() before any stage closed have no stages.
+        st.dataframe(
+            pd.DataFrame([{**s, 'stage': " " * s['depth'] + s['stage']} for s in last['stages']],
+                         columns=PROFILE_STAGE_COLUMNS).drop(columns='depth'),
+            hide_index=True, use_container_width=True
+        )
+        stages = pd.DataFrame([s for run in history for s in run['stages']], columns=PROFILE_STAGE_COLUMNS)
+        summary = stages.groupby('stage', sort=False)['ms'].agg(['count', 'mean', 'max']).round(2)
+        st.caption(f"Across the last {len(history)} rerun(s):")
+        st.dataframe(summary, use_container_width=True)
 
 # ------------------------------
 # 🎯 MAIN APPLICATION
 # ------------------------------
-def main():
+def render_app():
+    # Start the outbox workers with the app so jobs left queued by a previous process are delivered.
+    get_outbox()
     if 'page' not in st.session_state:
         st.session_state['page'] = 'inbox'
     if 'selected_email' not in st.session_state:
         st.session_state['selected_email'] = None
     if 'use_ai_reply' not in st.session_state:
         st.session_state['use_ai_reply'] = False
-    if 'df' not in st.session_state:
-        st.session_state['df'] = generate_mock_data(num_emails=25)
-    if 'drafts' not in st.session_state:
-        st.session_state['drafts'] = []
-    if 'sent_emails' not in st.session_state:
-        st.session_state['sent_emails'] = []
+    if 'dataset' not in st.session_state:
+        with profile_stage("initial dataset"):
+            if not attach_latest_dataset():
+                snapshot_df, snapshot_meta = load_snapshot()
+                if snapshot_df is not None:
+                    st.session_state['snapshot_meta'] = snapshot_meta
+                    st.session_state['sheet_sync'] = snapshot_meta['sync']
+                    set_dataset(snapshot_df)
+                else:
+                    set_dataset(generate_mock_data(num_emails=25))
 
     credentials_dict = None
     
@@ -1087,7 +3631,7 @@ def main():
     st.markdown("---")
     
     st.markdown("### 🧭 Navigation")
-    col1, col2, col3, col4 = st.columns([2, 2, 2, 2])
+    col1, col2, col3, col4, col5 = st.columns([2, 2, 2, 2, 2])
     with col1:
         if st.button("📥 Inbox", use_container_width=True, type="primary" if st.session_state['page'] == 'inbox' else "secondary"):
             st.session_state['page'] = 'inbox'
@@ -1099,19 +3643,23 @@ def main():
             st.session_state['selected_email'] = None
             st.rerun()
     with col3:
-        drafts_count = len(st.session_state.get('drafts', []))
+        drafts_count = mailstore_count(DRAFTS_TABLE)
         if st.button(f"📋 Drafts ({drafts_count})", use_container_width=True, type="primary" if st.session_state['page'] == 'drafts' else "secondary"):
             st.session_state['page'] = 'drafts'
             st.rerun()
     with col4:
-        sent_count = len(st.session_state.get('sent_emails', []))
+        sent_count = mailstore_count(SENT_TABLE)
         if st.button(f"📤 Sent ({sent_count})", use_container_width=True, type="primary" if st.session_state['page'] == 'sent' else "secondary"):
             st.session_state['page'] = 'sent'
             st.rerun()
+    with col5:
+        if st.button("📨 Mail Merge", use_container_width=True, type="primary" if st.session_state['page'] == 'merge' else "secondary"):
+            st.session_state['page'] = 'merge'
+            st.rerun()
     
     st.markdown("---")
     
-    with st.sidebar:
+    with st.sidebar, profile_stage("sidebar"):
         st.markdown("### 🔐 Google Service Account Credentials")
         st.markdown("""
         <div style='background: rgba(59, 130, 246, 0.1); padding: 16px; border-radius: 8px; margin-bottom: 16px; border-left: 4px solid #3b82f6;'>
@@ -1146,80 +3694,180 @@ def main():
         st.markdown("---")
         
         if credentials_dict:
+            # Loads run on the refresher's thread; the inbox stays usable and
+            # switches over on the rerun after the new dataset is published.
+            refresher = get_sheet_refresher(credentials_dict)
+            if adopt_refreshed_dataset(refresher):
+                st.toast(f"Inbox refreshed: {len(current_dataset())} emails from Google Sheets.", icon="🔄")
             if st.button("🔄 Load Data from Google Sheets", use_container_width=True, type="primary"):
-                with st.spinner("Loading data from Google Sheets..."):
-                    df = load_data_from_gsheet(credentials_dict)
-                    st.session_state['df'] = df
-                    st.rerun()
+                refresher.request()
+                st.toast("Loading from Google Sheets in the background…", icon="🔄")
+            render_refresh_status(refresher)
+            if 'sheet_sync' in st.session_state:
+                if st.button("⚡ Sync New & Changed Rows", use_container_width=True):
+                    with st.spinner("Syncing changes from Google Sheets..."):
+                        df, sync_stats = sync_data_from_gsheet(credentials_dict, current_dataset())
+                    # On an error the current inbox stays, and so does the message explaining it.
+                    if sync_stats is not None:
+                        if sync_stats.get('unmodified'):
+                            st.toast("Sheet unchanged since the last load.", icon="⚡")
+                        else:
+                            st.session_state['snapshot_meta'] = save_snapshot(df, st.session_state['sheet_sync'])
+                            if 'reloaded' in sync_stats:
+                                set_dataset(df)
+                                st.toast(f"Sheet rows were removed or its columns changed; reloaded {sync_stats['reloaded']} emails.", icon="⚡")
+                            else:
+                                if sync_stats['appended'] or sync_stats['changed']:
+                                    set_dataset(df)
+                                st.toast(f"Synced {sync_stats['appended']} new and {sync_stats['changed']} changed row(s).", icon="⚡")
+                        st.rerun()
         else:
-            st.warning("⚠️ No credentials uploaded. Using mock data.")
+            st.warning("⚠️ No credentials uploaded. Using mock data." if not st.session_state.get('snapshot_meta') else "⚠️ No credentials uploaded. Showing local snapshot.")
+        
+        snapshot_meta = st.session_state.get('snapshot_meta')
+        if snapshot_meta:
+            status = None
+            if credentials_dict:
+                try:
+                    status = validate_snapshot_async(get_worksheet(credentials_dict), snapshot_meta)
+                except Exception:
+                    status = 'error'
+            status_label = {
+                'checking': "⏳ validating against sheet…",
+                'fresh': "✅ up to date",
+                'stale': "⚠️ sheet has changed — sync to refresh",
+                'error': "❌ could not validate",
+            }.get(status, "offline")
+            st.caption(f"🗂️ Snapshot `{snapshot_meta['stamp']}` · {snapshot_meta['rows']} rows · saved {snapshot_meta['saved_at'][:16].replace('T', ' ')} · {status_label}")
+            
+        openai_client = get_openai_client()
+        missing_replies = int((~current_dataset()['has_ai_reply']).sum())
+        if openai_client is not None and missing_replies:
+            st.markdown("---")
+            st.markdown("### 🤖 AI Replies")
+            if st.button(f"🤖 Generate {missing_replies} Missing AI Replies", use_container_width=True):
+                progress_bar = st.progress(0.0, text="Generating AI replies...")
+                replies, ai_stats = generate_ai_replies(
+                    current_dataset(), openai_client,
+                    progress=lambda done, total: progress_bar.progress(done / total, text=f"Generated {done}/{total}")
+                )
+                set_dataset(apply_ai_replies(current_dataset(), replies))
+                stage_sheet_updates(credentials_dict, [(row_id, 'aireply', reply) for row_id, reply in replies.items()])
+                st.toast(f"AI replies: {ai_stats['generated']} generated, {ai_stats['cached']} from cache, {ai_stats['failed']} failed.", icon="🤖")
+                st.rerun()
             
         st.markdown("---")
         st.markdown("### 📊 Sheet Configuration")
         st.info(f"📊 Sheet ID: `{SHEET_ID}`")
+        if credentials_dict and 'sheet_sync' in st.session_state:
+            writer = get_sheet_writer(credentials_dict)
+            pending_cells = writer.pending_count()
+            if writer.last_error:
+                st.caption(f"✍️ {pending_cells} cell(s) waiting to write back · last attempt failed: {writer.last_error}")
+            elif pending_cells:
+                st.caption(f"✍️ {pending_cells} cell(s) queued for write-back")
+            if writer.conflicts:
+                fields = sorted({SHEET_WRITE_COLUMNS.get(field, field) for _, field in writer.dropped})
+                st.warning(
+                    f"✍️ {writer.conflicts} cell(s) ({', '.join(fields)}) were not written back: their row was "
+                    "edited, removed or duplicated in the sheet after it was loaded. Reload and redo them."
+                )
+                if st.button("Dismiss", key="dismiss_write_conflicts"):
+                    writer.clear_conflicts()
+                    st.rerun()
         
         if st.session_state['page'] == 'inbox':
             st.markdown("---")
             st.markdown("### 🔍 Inbox Filters")
             
-            all_departments = ['All'] + sorted(st.session_state['df']['department'].unique().tolist())
+            search_query = st.text_input(
+                "🔎 Search emails:",
+                key='search_query',
+                placeholder="Subject, summary, AI reply or sender",
+                on_change=_reset_inbox_page
+            )
+            
+            inbox_index = get_inbox_index()
+            all_departments = ['All'] + list(inbox_index['departments'].keys())
             department_filter = st.selectbox(
                 "Filter by Department:",
                 all_departments,
-                key='dept_filter'
+                key='dept_filter',
+                on_change=_reset_inbox_page
             )
             
             priority_filter = st.selectbox(
                 "Filter by Priority:",
                 ["All", "high", "medium", "low"],
-                key='priority_filter'
+                key='priority_filter',
+                on_change=_reset_inbox_page
             )
             
             sort_option = st.selectbox(
                 "Sort by:",
-                ["Date (Newest First)", "Date (Oldest First)", "AI Replies First", "Priority (High First)"],
-                key='sort_option'
+                SORT_OPTIONS,
+                key='sort_option',
+                on_change=_reset_inbox_page
             )
             
-            df_filtered = st.session_state['df'].copy()
+            show_archived = st.checkbox("🗃️ Show archived", key='show_archived', on_change=_reset_inbox_page)
             
-            if department_filter != "All":
-                df_filtered = df_filtered[df_filtered['department'] == department_filter]
-            
-            if priority_filter != "All":
-                df_filtered = df_filtered[df_filtered['priority'] == priority_filter]
-            
-            if sort_option == "Date (Newest First)":
-                df_filtered = df_filtered.sort_values('date', ascending=False)
-            elif sort_option == "Date (Oldest First)":
-                df_filtered = df_filtered.sort_values('date', ascending=True)
-            elif sort_option == "AI Replies First":
-                df_filtered['has_ai_reply'] = df_filtered['aireply'].apply(lambda x: bool(x and str(x).strip() not in ["", "nan", "None", "null"]))
-                df_filtered = df_filtered.sort_values(['has_ai_reply', 'date'], ascending=[False, False])
-                df_filtered = df_filtered.drop('has_ai_reply', axis=1)
-            elif sort_option == "Priority (High First)":
-                priority_order = pd.CategoricalDtype(['high', 'medium', 'low'], ordered=True)
-                df_filtered['priority'] = df_filtered['priority'].astype(priority_order)
-                df_filtered = df_filtered.sort_values(['priority', 'date'], ascending=[True, False])
-            
-            st.session_state['df_view'] = df_filtered
+            with profile_stage("filter and sort"):
+                positions = query_inbox_index(inbox_index, department_filter, priority_filter, sort_option)
+                if not show_archived:
+                    positions = positions[~archived_mask(current_dataset().index.to_numpy()[positions])]
+                st.session_state['search_terms'] = []
+                if search_query.strip():
+                    # Ranked search results replace the sort order but still honour the filters.
+                    with st.spinner("🔎 Indexing emails for search..."):
+                        search_index = get_search_index()
+                    ranked = search_index.search(search_query)
+                    allowed = np.zeros(inbox_index['size'], dtype=bool)
+                    allowed[positions] = True
+                    positions = ranked[allowed[ranked]]
+                    st.session_state['search_terms'] = search_index.expand_terms(search_query)
+                set_view(positions)
         
         st.markdown("---")
         st.markdown("### 📊 Data Summary")
-        current_view_len = len(st.session_state.get('df_view', st.session_state['df']))
+        positions = current_view_positions()
+        current_view_len = len(positions) if positions is not None else len(current_dataset())
         st.info(f"📧 Showing **{current_view_len}** emails in inbox view")
-        st.caption(f"🗄️ Total in database: **{len(st.session_state['df'])}** emails")
-        st.caption(f"📋 Drafts: **{len(st.session_state.get('drafts', []))}**")
-        st.caption(f"📤 Sent: **{len(st.session_state.get('sent_emails', []))}**")
+        st.caption(f"🗄️ Total in database: **{len(current_dataset())}** emails")
+        cache_stats = get_dataset_cache().stats()
+        st.caption(f"🧠 Shared in memory: **{cache_stats['datasets']}** dataset(s) for {cache_stats['sessions']} session(s)")
+        schema_report = st.session_state['dataset'].entry.schema_report
+        if schema_report:
+            saved_mb = (schema_report['before_bytes'] - schema_report['after_bytes']) / 2 ** 20
+            st.caption(f"🗜️ Categorical columns: {schema_report['before_bytes'] / 2 ** 20:.1f} → {schema_report['after_bytes'] / 2 ** 20:.1f} MB ({saved_mb:.1f} MB saved)")
+        st.caption(f"📋 Drafts: **{drafts_count}**")
+        st.caption(f"📤 Sent: **{sent_count}**")
+        
+        render_profile_panel()
     
     if st.session_state['page'] == 'inbox':
-        render_inbox(st.session_state.get('df_view', st.session_state['df']), credentials_dict)
+        with profile_stage("render_inbox"):
+            render_inbox(current_view(), credentials_dict)
     elif st.session_state['page'] == 'compose':
-        render_compose(st.session_state.get('selected_email'))
+        with profile_stage("render_compose"):
+            render_compose(st.session_state.get('selected_email'))
     elif st.session_state['page'] == 'drafts':
-        render_drafts()
+        with profile_stage("render_drafts"):
+            render_drafts()
     elif st.session_state['page'] == 'sent':
-        render_sent()
+        with profile_stage("render_sent"):
+            render_sent()
+    elif st.session_state['page'] == 'merge':
+        with profile_stage("render_mail_merge"):
+            render_mail_merge(current_view())
+
+def main():
+    profile = begin_rerun_profile()
+    try:
+        render_app()
+    finally:
+        if profile is not None:
+            end_rerun_profile(profile)
 
 if __name__ == "__main__":
     main()
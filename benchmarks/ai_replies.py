@@ -0,0 +1,58 @@
+"""Time AI reply generation against the local stub model server.
+
+Runs the same batch serially, with the bounded thread pool, and again with
+a warm on-disk cache. Run from the repository root::
+
+    python -m benchmarks.ai_replies --rows 200 --latency 0.2 --workers 8
+"""
+import argparse
+import time
+import uuid
+
+from openai import OpenAI
+
+from app import AI_REPLY_CONCURRENCY, generate_mock_data, generate_ai_replies
+from benchmarks.stub_model_server import StubModelServer
+
+
+def batch(rows):
+    """Mock inbox with every reply cleared and subjects made unique to this run."""
+    df = generate_mock_data(rows)
+    run_id = uuid.uuid4().hex[:8]
+    df['subject'] = df['subject'] + f" [{run_id}-" + df.index.astype(str) + "]"
+    df['aireply'] = ''
+    df['has_ai_reply'] = False
+    return df
+
+
+def run(label, df, client, server, workers):
+    server.requests = server.peak_in_flight = 0
+    start = time.perf_counter()
+    replies, stats = generate_ai_replies(df, client, model="stub", max_workers=workers)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<24} {len(replies):>6} replies  {elapsed:8.3f}s  {server.requests:>5} requests  "
+          f"peak {server.peak_in_flight:>3} in flight  cached {stats['cached']}")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.2, help="simulated inference time per request (s)")
+    parser.add_argument("--workers", type=int, default=AI_REPLY_CONCURRENCY)
+    args = parser.parse_args()
+
+    server = StubModelServer(latency=args.latency).start()
+    client = OpenAI(api_key="stub", base_url=server.base_url)
+    try:
+        serial = run("serial", batch(args.rows), client, server, 1)
+        pooled_df = batch(args.rows)
+        pooled = run(f"{args.workers} workers", pooled_df, client, server, args.workers)
+        run("warm cache", pooled_df, client, server, args.workers)
+    finally:
+        server.stop()
+    print(f"speedup: {serial / pooled:.1f}x with {args.workers} workers")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""Time the load -> enrich -> filter -> render pipeline at several inbox sizes.
+
+Each step is timed as the best of ``--repeat`` runs, and its peak memory is
+recorded from one more run under tracemalloc. Every size runs in a fresh
+process. Results can be written as JSON and compared against a stored
+baseline; the exit status is 1 when a step failed, got slower or hungrier
+than the baseline by more than ``--tolerance``, or there is no baseline to
+compare against. Run from the repository root::
+
+    python -m benchmarks.pipeline --sizes 1000 10000 100000 1000000 --json results.json
+    python -m benchmarks.pipeline --save-baseline      # refresh benchmarks/baseline.json
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+from app import (
+    SORT_OPTIONS,
+    SearchIndex,
+    adopt_dataset,
+    apply_inbox_schema,
+    build_email_card_html,
+    build_inbox_index,
+    classify_emails,
+    display_stats,
+    enrich_emails,
+    get_classification_cache,
+    get_dataset_cache,
+    iter_mock_chunks,
+    load_data_from_gsheet,
+    normalize_sheet_columns,
+    query_inbox_index,
+)
+from benchmarks.sheets_standin import WorksheetStandIn
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+SHEET_HEADERS = {
+    "sender name": "Sender Name", "sender email": "Sender Email", "subject": "Subject", "summary": "Summary",
+    "date": "Date", "attachment": "Attachment", "aireply": "AI Reply", "department": "Department", "priority": "Priority",
+}
+SEARCH_QUERY = "budget approval"
+PAGE_ROWS = 100
+# Noise floors below which a slowdown is not reported as a regression.
+MIN_SECONDS_DELTA = 0.002
+MIN_PEAK_MB_DELTA = 8.0
+
+
+def measure_peak_mb(fn):
+    """Peak Python and NumPy allocation above the starting point while fn runs, in MB."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+
+
+def measure(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return {"seconds": round(best, 6), "peak_mb": round(measure_peak_mb(fn), 2)}
+
+
+def card_html(df):
+    for _, row in df.iterrows():
+        build_email_card_html(row.to_dict())
+
+
+def keep(holder, key, fn):
+    """Store fn()'s result in holder, dropping the previous one first so repeats don't stack up."""
+    holder.pop(key, None)
+    holder[key] = fn()
+
+
+def load_standin(sheet, rows):
+    """load_data_from_gsheet on the stand-in, failing if it fell back to mock data instead."""
+    sheet.calls.clear()
+    df = load_data_from_gsheet(None, worksheet=sheet)
+    if "batch_get" not in sheet.calls or len(df) != rows:
+        raise RuntimeError(f"load_data_from_gsheet returned {len(df)} rows without reading the {rows}-row stand-in "
+                           "(fell back to mock data?)")
+    return df
+
+
+def build_search_index(df):
+    index = SearchIndex()
+    index.sync(df)
+    return index
+
+
+def cold_classify(frame):
+    get_classification_cache.clear()
+    classify_emails(frame)
+
+
+def pipeline_steps(rows, card_rows):
+    """Yield (name, callable) per step for one inbox size.
+    
+    Inputs are built just before the steps that need them and dropped right
+    after, so the largest sizes only hold what the current step touches.
+    """
+    sheet = WorksheetStandIn.from_frame(pd.concat(list(iter_mock_chunks(rows, seed=rows))).rename(columns=SHEET_HEADERS))
+    loaded = {}
+    yield "load_data_from_gsheet", lambda: keep(loaded, "df", lambda: load_standin(sheet, rows))
+    del sheet
+    df = loaded.pop("df")
+
+    sheet_frame = df[list(SHEET_HEADERS)].rename(columns=SHEET_HEADERS)
+    yield "normalize_sheet_columns", lambda: normalize_sheet_columns(sheet_frame.copy())
+    normalized = normalize_sheet_columns(sheet_frame)
+    del sheet_frame
+    yield "classify_emails (cold)", lambda: cold_classify(normalized.assign(priority="", department=""))
+    yield "enrich_emails", lambda: enrich_emails(normalized.copy())
+    del normalized
+
+    yield "apply_inbox_schema", lambda: apply_inbox_schema(df.copy())
+    df, _ = apply_inbox_schema(df)
+
+    # The archive mask is computed against the session's current dataset.
+    adopt_dataset(get_dataset_cache().acquire("benchmark", df))
+    yield "display_stats", lambda: display_stats(df)
+    yield "build_inbox_index", lambda: build_inbox_index(df)
+    index = build_inbox_index(df)
+    department = next(iter(index["departments"]))
+    yield "filter department", lambda: query_inbox_index(index, department=department)
+    yield "filter priority", lambda: query_inbox_index(index, priority="high")
+    yield "filter department+priority", lambda: query_inbox_index(index, department=department, priority="high")
+    for option in SORT_OPTIONS:
+        yield f"sort {option}", lambda option=option: query_inbox_index(index, sort_option=option)
+    del index
+
+    yield f"card html ({PAGE_ROWS}-row page)", lambda: card_html(df.iloc[-PAGE_ROWS:])
+    yield f"card html (first {min(rows, card_rows)} rows)", lambda: card_html(df.iloc[:card_rows])
+
+    search = {}
+    yield "search index build", lambda: keep(search, "index", lambda: build_search_index(df))
+    yield "search query", lambda: search["index"].search(SEARCH_QUERY)
+
+
+def run_size(rows, repeat, card_rows):
+    """Worker: run every step for one size, printing a JSON line before and after each."""
+    for name, fn in pipeline_steps(rows, card_rows):
+        print(json.dumps({"start": name}), flush=True)
+        # Steps at a million rows and up take long enough that one timing is enough.
+        result = measure(fn, repeat if rows < 1_000_000 else 1)
+        print(json.dumps({"step": name, **result}), flush=True)
+
+
+def run(sizes, repeat, card_rows):
+    """Run each size in its own process, so memory is returned between sizes and a
+    step killed for running out of memory is recorded instead of ending the run."""
+    results = {}
+    for rows in sizes:
+        steps = results[str(rows)] = {}
+        # A file rather than a pipe: bare-mode Streamlit warnings could fill a pipe nobody reads yet.
+        stderr = tempfile.TemporaryFile(mode="w+")
+        worker = subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.pipeline", "--worker", str(rows),
+             "--repeat", str(repeat), "--card-rows", str(card_rows)],
+            stdout=subprocess.PIPE, stderr=stderr, text=True,
+        )
+        running = None
+        for line in worker.stdout:
+            if not line.startswith("{"):
+                continue
+            event = json.loads(line)
+            if "start" in event:
+                running = event["start"]
+                continue
+            running = None
+            name = event.pop("step")
+            steps[name] = event
+            print(f"{rows:>9} rows  {name:<40} {event['seconds'] * 1000:11.2f} ms  {event['peak_mb']:9.1f} MB peak", flush=True)
+        worker.wait()
+        stderr.seek(0)
+        errors = stderr.read().strip().splitlines()
+        stderr.close()
+        if worker.returncode != 0 and running is not None:
+            reason = errors[-1] if errors else f"exit status {worker.returncode}; out of memory?"
+            steps[running] = {"error": reason}
+            print(f"{rows:>9} rows  {running:<40} FAILED ({reason})", flush=True)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Steps slower or bigger than baseline by more than tolerance, as printable lines."""
+    regressions = []
+    for rows, steps in results.items():
+        for name, current in steps.items():
+            before = baseline.get("results", {}).get(rows, {}).get(name)
+            if before is None or "error" in before:
+                continue
+            if "error" in current:
+                regressions.append(f"{rows:>9} rows  {name:<40} {current['error']}")
+                continue
+            slower = current["seconds"] - before["seconds"]
+            if slower > MIN_SECONDS_DELTA and current["seconds"] > before["seconds"] * (1 + tolerance):
+                regressions.append(f"{rows:>9} rows  {name:<40} time {before['seconds'] * 1000:.2f} -> {current['seconds'] * 1000:.2f} ms")
+            bigger = current["peak_mb"] - before["peak_mb"]
+            if bigger > MIN_PEAK_MB_DELTA and current["peak_mb"] > before["peak_mb"] * (1 + tolerance):
+                regressions.append(f"{rows:>9} rows  {name:<40} peak {before['peak_mb']:.1f} -> {current['peak_mb']:.1f} MB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--card-rows", type=int, default=10_000, help="rows rendered in the bulk card step")
+    parser.add_argument("--json", help="write results to this path ('-' for stdout)")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown/growth vs baseline (0.25 = 25%%)")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_size(args.worker, args.repeat, args.card_rows)
+        return
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": run(args.sizes, args.repeat, args.card_rows),
+    }
+
+    if args.json == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    elif args.json:
+        with open(args.json, "w") as out:
+            json.dump(report, out, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as out:
+            json.dump(report, out, indent=2)
+        print(f"baseline written to {args.baseline}")
+        return
+
+    failed = [f"{rows:>9} rows  {name:<40} {step['error']}"
+              for rows, steps in report["results"].items() for name, step in steps.items() if "error" in step]
+    if failed:
+        print(f"{len(failed)} step(s) failed:")
+        print("\n".join(failed))
+        sys.exit(1)
+    if not os.path.exists(args.baseline):
+        sys.exit(f"no baseline at {args.baseline}; run with --save-baseline on a reference machine to create one")
+    with open(args.baseline) as f:
+        regressions = compare(report["results"], json.load(f), args.tolerance)
+    if regressions:
+        print(f"{len(regressions)} regression(s) against {args.baseline}:")
+        print("\n".join(regressions))
+        sys.exit(1)
+    print(f"no regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Time the chunked parallel sheet fetch against a single get_all_records call.
+
+Both loads read the same in-process worksheet stand-in, and the run fails if
+they disagree on the frame or the sync fingerprints. Run from the
+repository root::
+
+    python -m benchmarks.sheet_fetch --rows 200000 --chunk-rows 20000 --workers 4 --latency 0.3
+"""
+import argparse
+import time
+import tracemalloc
+
+import pandas as pd
+
+from app import SHEET_FETCH_CHUNK_ROWS, SHEET_FETCH_WORKERS, fetch_sheet_values, iter_mock_chunks, row_fingerprint
+from benchmarks.pipeline import SHEET_HEADERS
+from benchmarks.sheets_standin import WorksheetStandIn
+
+
+def records_load(worksheet):
+    """The previous loader: one full read, then a dict per row."""
+    data = worksheet.get_all_records()
+    return (
+        pd.DataFrame(data),
+        [row_fingerprint(record.values()) for record in data],
+    )
+
+
+def chunked_load(worksheet, chunk_rows, workers):
+    header, columns, fingerprints = fetch_sheet_values(worksheet, chunk_rows, workers)
+    df = pd.DataFrame(dict(enumerate(columns)))
+    df.columns = header
+    return df.infer_objects(), fingerprints
+
+
+def run(label, fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = fn()
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+    print(f"{label:<28} {elapsed:8.3f}s  {peak:9.1f} MB peak")
+    return result, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--chunk-rows", type=int, default=SHEET_FETCH_CHUNK_ROWS)
+    parser.add_argument("--workers", type=int, default=SHEET_FETCH_WORKERS)
+    parser.add_argument("--latency", type=float, default=0.3, help="simulated round trip per request (s)")
+    args = parser.parse_args()
+
+    frame = pd.concat(list(iter_mock_chunks(args.rows, seed=args.rows))).rename(columns=SHEET_HEADERS)
+    worksheet = WorksheetStandIn.from_frame(frame, latency=args.latency)
+    del frame
+
+    (expected, expected_fps), single = run("get_all_records", lambda: records_load(worksheet))
+    worksheet.calls.clear()
+    (df, fps), chunked = run(
+        f"chunked ({args.workers} workers)", lambda: chunked_load(worksheet, args.chunk_rows, args.workers)
+    )
+
+    pd.testing.assert_frame_equal(df, expected, check_dtype=False)
+    assert fps == expected_fps, "sync state differs from get_all_records"
+    print(f"{len(df)} rows identical; {worksheet.calls.count('batch_get')} ranged reads; "
+          f"speedup {single / chunked:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Load, refresh and write back through gspread against the local Sheets stand-in.
+
+Times the chunked loader and a background refresh, then checks the results.
+The sheet's grid is trimmed to its data, so any read or write past it fails as
+it would against the API. Identical reloads must not publish a new dataset
+version. An edited cell must publish one. Staged write-backs must land in the
+right cells, follow a row moved by an insert, and must survive a quota error
+by being requeued. Exits non-zero
+on any mismatch. Run from the repository root::
+
+    python -m benchmarks.sheets_roundtrip --rows 50000 --latency 0.1 --workers 4
+"""
+import argparse
+import time
+
+import gspread
+
+from app import (
+    DatasetCache, SheetRefresher, SheetWriteBuffer, fetch_sheet_values, normalized_column_name, sheet_row_identities,
+)
+from benchmarks.sheets_server import SheetsServer, mock_sheet_frame
+
+SPREADSHEET_ID = "standin-roundtrip"
+
+
+def timed(label, fn):
+    start = time.perf_counter()
+    result = fn()
+    print(f"{label:<32} {time.perf_counter() - start:8.3f}s")
+    return result
+
+
+def check(condition, message):
+    if not condition:
+        raise SystemExit(f"FAILED: {message}")
+    print(f"ok  {message}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--latency", type=float, default=0.1, help="seconds slept per request")
+    parser.add_argument("--chunk-rows", type=int, default=10_000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--read-quota", type=int, default=0, help="read requests per minute (0 = unlimited)")
+    args = parser.parse_args()
+
+    server = SheetsServer(latency=args.latency, read_quota=args.read_quota).start()
+    server.add_frame(SPREADSHEET_ID, mock_sheet_frame(args.rows, seed=args.rows), exact_grid=True)
+    try:
+        worksheet = server.client().open_by_key(SPREADSHEET_ID).sheet1
+
+        header, columns, fingerprints = timed(
+            f"fetch ({args.workers} workers)", lambda: fetch_sheet_values(worksheet, args.chunk_rows, args.workers)
+        )
+        check(len(fingerprints) == args.rows and all(len(col) == args.rows for col in columns), f"loaded {args.rows} rows")
+        print(f"    {server.requests['read']} read requests, peak {server.peak_in_flight} in flight")
+        try:
+            worksheet.batch_get([f"A{args.rows + 2}"])
+            check(False, "reads past the grid are rejected")
+        except gspread.exceptions.APIError as e:
+            check("exceeds grid limits" in str(e), "reads past the grid are rejected")
+
+        refresher = SheetRefresher(lambda: worksheet, SPREADSHEET_ID, DatasetCache(), interval=0)
+        timed("refresh (cold)", refresher.refresh)
+        check(refresher.current()[0] == 1, "first refresh publishes version 1")
+        timed("refresh (unchanged)", refresher.refresh)
+        check(refresher.current()[0] == 1, "unchanged sheet keeps version 1")
+        subject_col = [normalized_column_name(h) for h in header].index("subject")
+        server.values(SPREADSHEET_ID)[2][subject_col] = "Edited on the server"
+        server.touch(SPREADSHEET_ID)
+        timed("refresh (one cell edited)", refresher.refresh)
+        version, entry = refresher.current()
+        check(version == 2 and entry.df['subject'].iloc[1] == "Edited on the server", "edited cell publishes version 2")
+
+        # Stage against the sheet as it is now, i.e. after the edit above.
+        identities = sheet_row_identities(*fetch_sheet_values(worksheet)[:2])
+        writer = SheetWriteBuffer(lambda: worksheet)
+        rows = range(2, min(args.rows, 500) + 2)
+        writer.stage(header, [(row, identities[row - 2], 'draft', f"draft {row}") for row in rows])
+        server.quota_error_rate = 1.0
+        try:
+            writer.flush()
+            check(False, "flush fails while quota is exhausted")
+        except Exception:
+            check(writer.pending_count() == len(rows), "cells are requeued after a quota error")
+        server.quota_error_rate = 0.0
+        written = timed("write-back flush", writer.flush)
+        grid = server.values(SPREADSHEET_ID)
+        draft_col = grid[0].index("Draft")
+        check(written == len(rows) and all(grid[row - 1][draft_col] == f"draft {row}" for row in rows),
+              f"{len(rows)} draft cells written in {writer.flushes} batch_update")
+        check(server.grid(SPREADSHEET_ID).col_count == len(header) + 1, "grid widened for the new Draft column")
+
+        # Someone inserts a row above the loaded data: staged rows are found again by identity.
+        grid.insert(1, ["Inserted Sender"] + [""] * (len(grid[0]) - 1))
+        server.grid(SPREADSHEET_ID).row_count += 1
+        server.touch(SPREADSHEET_ID)
+        writer.stage(header, [(2, identities[0], 'draft', "relocated")])
+        writer.flush()
+        check(grid[2][draft_col] == "relocated" and grid[1][draft_col] == "", "write follows a row moved by an insert")
+        print(f"    {server.requests['read']} reads, {server.requests['write']} writes, {server.throttled} throttled")
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,423 @@
+"""Local stand-in for the Google Sheets v4 API that gspread can be pointed at.
+
+Serves the spreadsheet metadata and values endpoints gspread uses (get,
+batchGet, batchUpdate, update, append), plus Drive file metadata, from
+in-memory grids. Each sheet has a grid size like the real API: reads and
+writes outside it fail with 400 "exceeds grid limits", while appends and
+resize requests grow it. ``latency`` is slept per request; ``read_quota`` /
+``write_quota`` cap requests per minute like the real per-user quotas;
+``quota_error_rate`` fails that fraction of requests with 429
+RESOURCE_EXHAUSTED; ``max_response_cells`` rejects reads larger than that.
+Point the app at it via ``.streamlit/secrets.toml``::
+
+    [sheets]
+    api_base_url = "http://127.0.0.1:8012"
+
+upload any JSON file as credentials, and start it from the repository root::
+
+    python -m benchmarks.sheets_server --port 8012 --rows 100000 --latency 0.2 --read-quota 300
+"""
+import argparse
+import http.server
+import json
+import random
+import re
+import threading
+import time
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import gspread
+import gspread.utils as gutils
+import pandas as pd
+
+from app import SHEET_ID, SheetsAPISession, iter_mock_chunks
+
+# Google's defaults for a new sheet's grid.
+MIN_GRID_ROWS = 1000
+MIN_GRID_COLS = 26
+_CELL = re.compile(r"^([A-Za-z]*)(\d*)$")
+_DRIVE_PATH = re.compile(r"^/drive/v3/files/([^/]+)$")
+_PATH = re.compile(r"^/v4/spreadsheets/([^/:]+)(?::(batchUpdate))?(?:/values(?::(batchGet|batchUpdate)|/([^:]+)(?::(append))?))?$")
+
+
+def _timestamp(seconds):
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(seconds)) + f".{int(seconds * 1000) % 1000:03d}Z"
+
+
+class APIError(Exception):
+    def __init__(self, code, status, message):
+        super().__init__(message)
+        self.code = code
+        self.status = status
+
+
+class QuotaWindow:
+    """Requests allowed per fixed minute window, as Sheets API quotas are counted."""
+
+    def __init__(self, per_minute):
+        self.per_minute = per_minute
+        self.window = None
+        self.used = 0
+
+    def take(self):
+        if not self.per_minute:
+            return True
+        window = int(time.time() // 60)
+        if window != self.window:
+            self.window, self.used = window, 0
+        if self.used >= self.per_minute:
+            return False
+        self.used += 1
+        return True
+
+
+class SheetGrid:
+    def __init__(self, title, values, sheet_id=0, row_count=None, col_count=None):
+        self.title = title
+        self.sheet_id = sheet_id
+        self.values = [list(row) for row in values]
+        self.row_count = row_count or max(len(self.values), MIN_GRID_ROWS)
+        self.col_count = col_count or max(self.width, MIN_GRID_COLS)
+        if len(self.values) > self.row_count or self.width > self.col_count:
+            raise ValueError(f"{len(self.values)}x{self.width} values do not fit a {self.row_count}x{self.col_count} grid")
+
+    @property
+    def width(self):
+        return max((len(row) for row in self.values), default=0)
+
+    def check_bounds(self, top, left, bottom, right):
+        if bottom > self.row_count or right > self.col_count:
+            a1 = f"{gutils.rowcol_to_a1(top, left)}:{gutils.rowcol_to_a1(bottom, right)}"
+            raise APIError(400, "INVALID_ARGUMENT", f"Range ('{self.title}'!{a1}) exceeds grid limits. "
+                                                    f"Max rows: {self.row_count}, max columns: {self.col_count}")
+
+    def properties(self, index):
+        return {
+            "sheetId": self.sheet_id,
+            "title": self.title,
+            "index": index,
+            "sheetType": "GRID",
+            "gridProperties": {
+                "rowCount": self.row_count,
+                "columnCount": self.col_count,
+            },
+        }
+
+    def bounds(self, cells):
+        """(top, left, bottom, right), 1-based and inclusive, for an A1 cell range on this sheet."""
+        parts = cells.split(":") if cells else ["", ""]
+        if len(parts) > 2 or not all(_CELL.match(p) for p in parts):
+            raise APIError(400, "INVALID_ARGUMENT", f"Unable to parse range: {self.title}!{cells}")
+        (left_col, top), (right_col, bottom) = (_CELL.match(p).groups() for p in (parts[0], parts[-1]))
+        col = lambda letters, default: gutils.a1_to_rowcol(f"{letters.upper()}1")[1] if letters else default
+        if len(parts) == 1:
+            bounds = int(top or 1), col(left_col, 1), int(top or self.row_count), col(left_col, self.col_count)
+        else:
+            bounds = int(top or 1), col(left_col, 1), int(bottom or self.row_count), col(right_col, self.col_count)
+        self.check_bounds(*bounds)
+        return bounds
+
+    def read(self, top, left, bottom, right, render):
+        rows = []
+        for row in self.values[top - 1:bottom]:
+            cells = ["" if v is None else (v if render == "UNFORMATTED_VALUE" else str(v)) for v in row[left - 1:right]]
+            while cells and cells[-1] == "":
+                cells.pop()
+            rows.append(cells)
+        # The API drops trailing blank rows, and the values key entirely when nothing is left.
+        while rows and not rows[-1]:
+            rows.pop()
+        return rows
+
+    def write(self, top, left, rows):
+        self.check_bounds(top, left, top + max(len(rows), 1) - 1, left + max((len(c) for c in rows), default=1) - 1)
+        for offset, cells in enumerate(rows):
+            while len(self.values) < top + offset:
+                self.values.append([])
+            row = self.values[top - 1 + offset]
+            row += [""] * (left - 1 + len(cells) - len(row))
+            row[left - 1:left - 1 + len(cells)] = cells
+        return len(rows), max((len(cells) for cells in rows), default=0)
+
+
+class _SheetsHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self, method):
+        server = self.server
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+        with server.lock:
+            server.in_flight += 1
+            server.peak_in_flight = max(server.peak_in_flight, server.in_flight)
+        try:
+            if server.latency:
+                time.sleep(server.latency)
+            drive = _DRIVE_PATH.match(url.path)
+            if drive and drive[1] in server.spreadsheets:
+                book = server.spreadsheets[drive[1]]
+                self._send_json(200, {"id": drive[1], "name": drive[1], "createdTime": server.created,
+                                      "modifiedTime": _timestamp(book["modified"])})
+                return
+            match = _PATH.match(url.path)
+            if not match:
+                raise APIError(404, "NOT_FOUND", f"Unknown path {url.path}")
+            spreadsheet_id, sheet_batch, values_batch, a1, append = match.groups()
+            kind = "write" if method != "GET" else "read"
+            with server.lock:
+                server.requests[kind] += 1
+                if random.random() < server.quota_error_rate or not server.quotas[kind].take():
+                    server.throttled += 1
+                    raise APIError(429, "RESOURCE_EXHAUSTED",
+                                   f"Quota exceeded for quota metric '{kind.title()} requests' and limit "
+                                   f"'{kind.title()} requests per minute per user' of service 'sheets.googleapis.com'")
+                book = server.spreadsheets.get(spreadsheet_id)
+                if book is None:
+                    raise APIError(404, "NOT_FOUND", "Requested entity was not found.")
+                if sheet_batch:
+                    for request in body.get("requests", []):
+                        server.resize(book, request)
+                    payload = {"spreadsheetId": spreadsheet_id, "replies": [{} for _ in body.get("requests", [])]}
+                elif values_batch == "batchGet":
+                    render = query.get("valueRenderOption", ["FORMATTED_VALUE"])[0]
+                    major = query.get("majorDimension", ["ROWS"])[0]
+                    payload = {"spreadsheetId": spreadsheet_id,
+                               "valueRanges": [server.read(book, r, render, major) for r in query.get("ranges", [])]}
+                elif values_batch == "batchUpdate":
+                    responses = [server.write(book, entry["range"], entry.get("values", [])) for entry in body.get("data", [])]
+                    payload = {
+                        "spreadsheetId": spreadsheet_id,
+                        "totalUpdatedRows": sum(r["updatedRows"] for r in responses),
+                        "totalUpdatedCells": sum(r["updatedCells"] for r in responses),
+                        "responses": responses,
+                    }
+                elif a1 and append:
+                    payload = {"spreadsheetId": spreadsheet_id, "updates": server.append(book, unquote(a1), body.get("values", []))}
+                elif a1 and method == "PUT":
+                    payload = server.write(book, unquote(a1), body.get("values", []))
+                elif a1:
+                    render = query.get("valueRenderOption", ["FORMATTED_VALUE"])[0]
+                    major = query.get("majorDimension", ["ROWS"])[0]
+                    payload = server.read(book, unquote(a1), render, major)
+                else:
+                    payload = {
+                        "spreadsheetId": spreadsheet_id,
+                        "properties": {"title": book["title"], "locale": "en_US", "timeZone": "Etc/GMT"},
+                        "sheets": [{"properties": grid.properties(i)} for i, grid in enumerate(book["sheets"])],
+                    }
+            self._send_json(200, payload)
+        except APIError as e:
+            self._send_json(e.code, {"error": {"code": e.code, "message": str(e), "status": e.status}})
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PUT(self):
+        self._handle("PUT")
+
+
+class SheetsServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, read_quota=0, write_quota=0,
+                 quota_error_rate=0.0, max_response_cells=0):
+        super().__init__((host, port), _SheetsHandler)
+        self.latency = latency
+        self.quotas = {"read": QuotaWindow(read_quota), "write": QuotaWindow(write_quota)}
+        self.quota_error_rate = quota_error_rate
+        self.max_response_cells = max_response_cells
+        self.lock = threading.Lock()
+        self.spreadsheets = {}
+        self.created = _timestamp(time.time())
+        self.requests = {"read": 0, "write": 0}
+        self.throttled = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    @property
+    def base_url(self):
+        return f"http://{self.server_address[0]}:{self.port}"
+
+    def add_spreadsheet(self, spreadsheet_id, values, title="Sheet1", exact_grid=False):
+        """Serve values (header row first) as the first worksheet of spreadsheet_id.
+
+        The grid is padded to Google's new-sheet size unless exact_grid, which
+        sizes it to the values as a sheet trimmed to its data would be.
+        """
+        values = [list(row) for row in values]
+        size = (len(values), max((len(row) for row in values), default=1)) if exact_grid else (None, None)
+        with self.lock:
+            self.spreadsheets[spreadsheet_id] = {"title": spreadsheet_id, "modified": time.time(),
+                                                 "sheets": [SheetGrid(title, values, 0, *size)]}
+        return self
+
+    def add_frame(self, spreadsheet_id, df, title="Sheet1", exact_grid=False):
+        header = [str(col) for col in df.columns]
+        return self.add_spreadsheet(spreadsheet_id, [header] + df.astype(str).values.tolist(), title, exact_grid)
+
+    def values(self, spreadsheet_id, index=0):
+        """The live grid of a worksheet, for checking what writes landed or editing cells in place."""
+        return self.spreadsheets[spreadsheet_id]["sheets"][index].values
+
+    def grid(self, spreadsheet_id, index=0):
+        return self.spreadsheets[spreadsheet_id]["sheets"][index]
+
+    def touch(self, spreadsheet_id):
+        """Advance the Drive modifiedTime, e.g. after editing values() directly."""
+        with self.lock:
+            self._modified(self.spreadsheets[spreadsheet_id])
+
+    @staticmethod
+    def _modified(book):
+        # Drive reports milliseconds; keep every change distinguishable.
+        book["modified"] = max(time.time(), book["modified"] + 0.001)
+
+    def client(self):
+        """A gspread client whose requests go to this server."""
+        return gspread.Client(None, session=SheetsAPISession(self.base_url))
+
+    def _locate(self, book, a1):
+        """(grid, bounds) for an A1 range: 'Title'!A1:B2, a bare sheet title, or cells on the first sheet."""
+        title, sep, cells = a1.rpartition("!")
+        if not sep:
+            title, cells = a1, ""
+        title = title[1:-1].replace("''", "'") if title.startswith("'") and title.endswith("'") else title
+        for grid in book["sheets"]:
+            if grid.title == title:
+                return grid, grid.bounds(cells)
+        if not sep:
+            grid = book["sheets"][0]
+            return grid, grid.bounds(a1)
+        raise APIError(400, "INVALID_ARGUMENT", f"Unable to parse range: {a1}")
+
+    def read(self, book, a1, render="FORMATTED_VALUE", major="ROWS"):
+        grid, (top, left, bottom, right) = self._locate(book, a1)
+        returned_rows = max(0, min(bottom, len(grid.values)) - top + 1)
+        if self.max_response_cells and returned_rows * (right - left + 1) > self.max_response_cells:
+            raise APIError(400, "INVALID_ARGUMENT", "Response too large. Request a smaller range.")
+        rows = grid.read(top, left, bottom, right, render)
+        reply = {"range": f"{grid.title}!{gutils.rowcol_to_a1(top, left)}:{gutils.rowcol_to_a1(bottom, right)}",
+                 "majorDimension": major}
+        if major == "COLUMNS":
+            width = max((len(row) for row in rows), default=0)
+            rows = [[row[j] if j < len(row) else "" for row in rows] for j in range(width)]
+            for col in rows:
+                while col and col[-1] == "":
+                    col.pop()
+        if rows:
+            reply["values"] = rows
+        return reply
+
+    def write(self, book, a1, rows):
+        grid, (top, left, _, _) = self._locate(book, a1)
+        updated_rows, updated_cols = grid.write(top, left, rows)
+        self._modified(book)
+        return {
+            "updatedRange": f"{grid.title}!{gutils.rowcol_to_a1(top, left)}",
+            "updatedRows": updated_rows,
+            "updatedColumns": updated_cols,
+            "updatedCells": sum(len(cells) for cells in rows),
+        }
+
+    def append(self, book, a1, rows):
+        grid, (_, left, _, _) = self._locate(book, a1)
+        top = len(grid.read(1, 1, len(grid.values), grid.width or 1, "UNFORMATTED_VALUE")) + 1
+        # Appending grows the grid rather than failing at its edge.
+        grid.row_count = max(grid.row_count, top + len(rows) - 1)
+        grid.col_count = max(grid.col_count, left + max((len(cells) for cells in rows), default=1) - 1)
+        grid.write(top, left, rows)
+        self._modified(book)
+        return {"updatedRange": f"{grid.title}!{gutils.rowcol_to_a1(top, left)}", "updatedRows": len(rows)}
+
+    def resize(self, book, request):
+        """Apply an appendDimension or updateSheetProperties gridProperties request (Worksheet.resize/add_cols)."""
+        if "appendDimension" in request:
+            change = request["appendDimension"]
+            sheet_id = change.get("sheetId", 0)
+        elif "updateSheetProperties" in request:
+            change = request["updateSheetProperties"]["properties"]
+            sheet_id = change.get("sheetId", 0)
+        else:
+            return
+        grid = next((g for g in book["sheets"] if g.sheet_id == sheet_id), None)
+        if grid is None:
+            raise APIError(400, "INVALID_ARGUMENT", f"No grid with id: {sheet_id}")
+        if "appendDimension" in request:
+            if change.get("dimension") == "COLUMNS":
+                grid.col_count += change["length"]
+            else:
+                grid.row_count += change["length"]
+        else:
+            sizes = change.get("gridProperties", {})
+            rows, cols = sizes.get("rowCount", grid.row_count), sizes.get("columnCount", grid.col_count)
+            if rows < len(grid.values) or cols < grid.width:
+                # The real API deletes the cut-off cells; nothing here shrinks a grid holding data.
+                raise APIError(400, "INVALID_ARGUMENT", "Resizing would drop cells that hold values.")
+            grid.row_count, grid.col_count = rows, cols
+        self._modified(book)
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def mock_sheet_frame(rows, seed=0):
+    """Mock inbox laid out with the sheet's column headers."""
+    from benchmarks.pipeline import SHEET_HEADERS
+
+    return pd.concat(list(iter_mock_chunks(rows, seed=seed))).rename(columns=SHEET_HEADERS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8012)
+    parser.add_argument("--spreadsheet-id", default=SHEET_ID)
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.1, help="seconds slept per request")
+    parser.add_argument("--read-quota", type=int, default=0, help="read requests per minute (0 = unlimited)")
+    parser.add_argument("--write-quota", type=int, default=0, help="write requests per minute (0 = unlimited)")
+    parser.add_argument("--quota-error-rate", type=float, default=0.0, help="fraction of requests failed with 429")
+    parser.add_argument("--max-response-cells", type=int, default=0, help="reject larger reads (0 = no limit)")
+    args = parser.parse_args()
+    server = SheetsServer(args.host, args.port, args.latency, args.read_quota, args.write_quota,
+                          args.quota_error_rate, args.max_response_cells)
+    server.add_frame(args.spreadsheet_id, mock_sheet_frame(args.rows, args.seed))
+    print(f"Sheets stand-in serving {args.rows} rows of {args.spreadsheet_id} on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
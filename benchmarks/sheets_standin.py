@@ -0,0 +1,122 @@
+"""In-process stand-in for a gspread Worksheet backed by a list of rows.
+
+Implements the calls the app makes (get_all_records, row_values, col_values,
+batch_get, batch_update, add_cols, fetch_sheet_metadata, get_lastUpdateTime)
+with gspread's own value handling, so loads, syncs and write-backs can be
+exercised without network access or credentials. The grid has as many rows as
+``values``, and reads or writes past it fail as they do against the API.
+``latency`` is slept once per call to model a request round trip.
+"""
+import re
+import time
+
+import gspread.utils as gutils
+
+_RANGE = re.compile(r"([A-Z]+)(\d+)(?::([A-Z]+)(\d+))?$")
+
+
+def _parse_range(a1):
+    match = _RANGE.match(a1)
+    first_col = gutils.a1_to_rowcol(f"{match[1]}1")[1]
+    last_col = gutils.a1_to_rowcol(f"{match[3]}1")[1] if match[3] else first_col
+    return int(match[2]), first_col, int(match[4] or match[2]), last_col
+
+
+def _trim(rows):
+    """Drop trailing blank cells and rows, as the values API does."""
+    rows = [list(row) for row in rows]
+    for row in rows:
+        while row and row[-1] == "":
+            row.pop()
+    while rows and not rows[-1]:
+        rows.pop()
+    return rows
+
+
+class WorksheetStandIn:
+    id = 0
+
+    def __init__(self, values, latency=0.0):
+        self.values = values
+        self.latency = latency
+        self.calls = []
+        self.col_count = max((len(row) for row in values), default=0)
+        # Bumped on every write; stands in for Drive's modifiedTime.
+        self.revision = 0
+
+    @classmethod
+    def from_frame(cls, df, latency=0.0):
+        """Sheet holding df's columns as the header row and every cell as displayed text."""
+        header = [str(col) for col in df.columns]
+        return cls([header] + df.astype(str).values.tolist(), latency)
+
+    def _call(self, name):
+        self.calls.append(name)
+        if self.latency:
+            time.sleep(self.latency)
+
+    @property
+    def row_count(self):
+        return len(self.values)
+
+    @property
+    def spreadsheet(self):
+        return self
+
+    def fetch_sheet_metadata(self):
+        self._call("fetch_sheet_metadata")
+        grid = {"rowCount": self.row_count, "columnCount": self.col_count}
+        return {"sheets": [{"properties": {"sheetId": self.id, "gridProperties": grid}}]}
+
+    def get_lastUpdateTime(self):
+        self._call("get_lastUpdateTime")
+        return f"revision-{self.revision}"
+
+    def get_all_records(self):
+        self._call("get_all_records")
+        header = self.values[0]
+        rows = [gutils.numericise_all(row + [""] * (len(header) - len(row))) for row in self.values[1:]]
+        return gutils.to_records(header, rows)
+
+    def row_values(self, row):
+        self._call("row_values")
+        if row > len(self.values):
+            return []
+        trimmed = _trim([self.values[row - 1]])
+        return trimmed[0] if trimmed else []
+
+    def col_values(self, col):
+        self._call("col_values")
+        return [row[col - 1] if len(row) >= col else "" for row in self.values]
+
+    def batch_get(self, ranges):
+        self._call("batch_get")
+        out = []
+        for a1 in ranges:
+            top, left, bottom, right = _parse_range(a1)
+            if bottom > self.row_count or right > self.col_count:
+                raise ValueError(f"Range ('Sheet1'!{a1}) exceeds grid limits. "
+                                 f"Max rows: {self.row_count}, max columns: {self.col_count}")
+            out.append(_trim(row[left - 1:right] for row in self.values[top - 1:bottom]))
+        return out
+
+    def add_cols(self, cols):
+        self._call("add_cols")
+        self.col_count += cols
+        self.revision += 1
+
+    def batch_update(self, data):
+        self._call("batch_update")
+        for entry in data:
+            top, left, bottom, right = _parse_range(entry["range"])
+            if bottom > self.row_count or right > self.col_count:
+                raise ValueError(f"Range ('Sheet1'!{entry['range']}) exceeds grid limits. "
+                                 f"Max rows: {self.row_count}, max columns: {self.col_count}")
+        self.revision += 1
+        for entry in data:
+            top, left, _, _ = _parse_range(entry["range"])
+            for offset, cells in enumerate(entry["values"]):
+                row = self.values[top - 1 + offset]
+                row += [""] * (left - 1 + len(cells) - len(row))
+                row[left - 1:left - 1 + len(cells)] = cells
+        return {}
@@ -0,0 +1,79 @@
+"""Minimal local SMTP stand-in for offline send benchmarks.
+
+Speaks just enough ESMTP (EHLO/HELO, AUTH, MAIL, RCPT, DATA, RSET, NOOP, QUIT)
+for smtplib. ``greeting_latency`` is slept once per new connection to model
+the TLS handshake and login that a real provider charges per session.
+"""
+import socketserver
+import threading
+import time
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def _reply(self, line):
+        self.wfile.write((line + "\r\n").encode("ascii"))
+
+    def handle(self):
+        server = self.server
+        time.sleep(server.greeting_latency)
+        with server.lock:
+            server.connections += 1
+        self._reply("220 localhost InboxKeep SMTP stand-in")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("utf-8", "replace").strip()
+            verb = command.split(" ", 1)[0].upper()
+            if verb == "EHLO":
+                self._reply("250-localhost")
+                self._reply("250-AUTH PLAIN LOGIN")
+                self._reply("250 8BITMIME")
+            elif verb == "HELO":
+                self._reply("250 localhost")
+            elif verb == "AUTH":
+                self._reply("235 2.7.0 Authentication successful")
+            elif verb in ("MAIL", "RCPT", "RSET", "NOOP"):
+                self._reply("250 OK")
+            elif verb == "DATA":
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                size = 0
+                while True:
+                    data = self.rfile.readline()
+                    if not data or data in (b".\r\n", b".\n"):
+                        break
+                    size += len(data)
+                with server.lock:
+                    server.messages += 1
+                    server.bytes_received += size
+                self._reply("250 OK queued")
+            elif verb == "QUIT":
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("502 Command not implemented")
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", port=0, greeting_latency=0.0):
+        super().__init__((host, port), _SMTPHandler)
+        self.greeting_latency = greeting_latency
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.messages = 0
+        self.bytes_received = 0
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,60 @@
+"""Compare one SMTP connection per message against the pooled sender.
+
+Run from the repository root::
+
+    python -m benchmarks.smtp_throughput --messages 200 --latency 0.05
+"""
+import argparse
+import smtplib
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app import SMTP_MAX_CONNECTIONS, SMTPPool
+from benchmarks.smtp_standin import SMTPStandIn
+
+MESSAGE = "From: bench@localhost\nTo: inbox@localhost\nSubject: throughput\n\nHello from the benchmark."
+
+
+def send_unpooled(port, count):
+    for _ in range(count):
+        with smtplib.SMTP("127.0.0.1", port) as server:
+            server.login("bench", "secret")
+            server.sendmail("bench@localhost", ["inbox@localhost"], MESSAGE)
+
+
+def send_pooled(port, count, workers):
+    pool = SMTPPool("127.0.0.1", port, "bench", "secret", max_connections=workers)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(lambda _: pool.sendmail("bench@localhost", ["inbox@localhost"], MESSAGE), range(count)))
+    pool.close_all()
+
+
+def run(label, fn, server, count):
+    server.connections = server.messages = 0
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed
+    print(f"{label:<28} {count:>6} msgs  {elapsed:8.3f}s  {rate:9.1f} msg/s  {server.connections:>5} connections")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05, help="simulated handshake+login cost per connection (s)")
+    parser.add_argument("--workers", type=int, default=SMTP_MAX_CONNECTIONS)
+    args = parser.parse_args()
+
+    server = SMTPStandIn(greeting_latency=args.latency).start()
+    try:
+        baseline = run("connection per message", lambda: send_unpooled(server.port, args.messages), server, args.messages)
+        serial = run("pooled, 1 connection", lambda: send_pooled(server.port, args.messages, 1), server, args.messages)
+        parallel = run(f"pooled, {args.workers} connections", lambda: send_pooled(server.port, args.messages, args.workers), server, args.messages)
+    finally:
+        server.stop()
+    print(f"speedup: {serial / baseline:.1f}x (1 connection), {parallel / baseline:.1f}x ({args.workers} connections)")
+
+
+if __name__ == "__main__":
+    main()
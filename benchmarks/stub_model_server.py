@@ -0,0 +1,111 @@
+"""Local stand-in for an OpenAI-compatible chat completions endpoint.
+
+Answers ``POST /v1/chat/completions`` with a canned reply built from the
+prompt, after sleeping ``latency`` seconds to model model inference time.
+Point the app at it for offline work via ``.streamlit/secrets.toml``::
+
+    [openai]
+    api_key = "stub"
+    base_url = "http://127.0.0.1:8011/v1"
+
+and start it from the repository root::
+
+    python -m benchmarks.stub_model_server --port 8011 --latency 0.5
+"""
+import argparse
+import http.server
+import json
+import threading
+import time
+
+
+class _CompletionsHandler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+            return
+        with server.lock:
+            server.in_flight += 1
+            server.peak_in_flight = max(server.peak_in_flight, server.in_flight)
+        try:
+            time.sleep(server.latency)
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+                server.requests += 1
+        prompt = request.get("messages", [{}])[-1].get("content", "")
+        subject = next((line[len("Subject: "):] for line in prompt.splitlines() if line.startswith("Subject: ")), "your email")
+        reply = f"<p>Thank you for your message regarding {subject}.</p><p>I will follow up shortly.</p>"
+        self._send_json(200, {
+            "id": f"chatcmpl-stub-{server.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": reply},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        })
+
+
+class StubModelServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0):
+        super().__init__((host, port), _CompletionsHandler)
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    @property
+    def base_url(self):
+        return f"http://{self.server_address[0]}:{self.port}/v1"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8011)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds slept per completion")
+    args = parser.parse_args()
+    server = StubModelServer(args.host, args.port, args.latency)
+    print(f"Stub model server listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# app.py reads st.secrets at import time, and Streamlit looks for them under the
+# working directory; run from an empty one so a developer's secrets never leak in.
+_workdir = tempfile.mkdtemp(prefix="inboxkeep-tests-")
+os.makedirs(os.path.join(_workdir, ".streamlit"))
+open(os.path.join(_workdir, ".streamlit", "secrets.toml"), "w").close()
+os.chdir(_workdir)
@@ -0,0 +1,30 @@
+import pandas as pd
+import pytest
+
+import app
+
+
+@pytest.fixture(autouse=True)
+def store(tmp_path, monkeypatch):
+    store = app.get_mail_store(str(tmp_path / "mailstore.db"))
+    monkeypatch.setattr(app, "get_mail_store", lambda: store)
+    return store
+
+
+def test_only_stored_replies_count_as_generated(monkeypatch):
+    answers = {"Budget": "Approved.", "Lunch": "", "Outage": RuntimeError("rate limited")}
+
+    def reply(client, model, sender, subject, summary):
+        answer = answers[subject]
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+    monkeypatch.setattr(app, "request_ai_reply", reply)
+    df = pd.DataFrame({'subject': list(answers), 'summary': '', 'sender email': 'a@example.com', 'has_ai_reply': False})
+
+    replies, stats = app.generate_ai_replies(df, client=None, max_workers=2)
+    assert replies.to_dict() == {0: "Approved."}
+    assert stats == {'missing': 3, 'cached': 0, 'generated': 1, 'failed': 2}
+
+    replies, stats = app.generate_ai_replies(df, client=None, max_workers=2)
+    assert stats == {'missing': 3, 'cached': 1, 'generated': 0, 'failed': 2}
@@ -0,0 +1,49 @@
+import os
+
+from app import ArchiveStore
+
+
+def test_decisions_persist_across_instances(tmp_path):
+    path = str(tmp_path / "archive_sheet.json")
+    ArchiveStore(path).update(["a", "b"], True)
+    ArchiveStore(path).update(["b"], False)
+    assert ArchiveStore(path).decisions == {"a": True, "b": False}
+
+
+def test_decision_overrides_the_sheet_column_by_identity(tmp_path):
+    store = ArchiveStore(str(tmp_path / "archive_sheet.json"))
+    store.update(["a"], True)
+    store.update(["b"], False)
+    # Rows moved since the decisions were made: identities, not positions, decide.
+    mask, settled = store.mask(["c", "b", "a"], [False, True, True])
+    assert mask.tolist() == [False, False, True]
+    assert settled == {"a"}
+
+
+def test_settled_decisions_hand_back_to_the_sheet(tmp_path):
+    path = str(tmp_path / "archive_sheet.json")
+    store = ArchiveStore(path)
+    store.update(["a", "b"], True)
+    revision = store.revision
+    store.settle({"a"})
+    assert ArchiveStore(path).decisions == {"b": True}
+    assert store.revision == revision
+    # Someone unarchives "a" in the sheet later; that now wins.
+    assert store.mask(["a"], [False])[0].tolist() == [False]
+
+
+def test_in_memory_store_writes_nothing(tmp_path):
+    store = ArchiveStore()
+    store.update(["a"], True)
+    assert store.mask(["a", "b"], [False, False])[0].tolist() == [True, False]
+    assert os.listdir(tmp_path) == []
+
+
+def test_identical_rows_share_a_decision():
+    store = ArchiveStore()
+    store.update(["dup"], True)
+    mask, settled = store.mask(["dup", "x", "dup"], [True, False, False])
+    assert mask.tolist() == [True, False, True]
+    # The sheet still shows one copy unarchived, so the decision stays.
+    assert settled == set()
+    assert store.mask(["dup", "dup"], [True, True])[1] == {"dup"}
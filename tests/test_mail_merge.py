@@ -0,0 +1,51 @@
+import threading
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+import app
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = app.get_mail_store(str(tmp_path / "mailstore.db"))
+    monkeypatch.setattr(app, "get_mail_store", lambda: store)
+    monkeypatch.setattr(app, "GMAIL_EMAIL", "me@example.com")
+    monkeypatch.setattr(app, "GMAIL_PASSWORD", "secret")
+    return store
+
+
+def batch():
+    df = pd.DataFrame({'sender email': ['a@example.com', 'b@example.com', ''], 'subject': ['One', 'Two', 'Three']})
+    return app.merge_batch(df, "Re: {{subject}}", "Hello", "Plain Text")
+
+
+def count(store, table):
+    return store[0].execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def test_batch_is_logged_and_queued_together(store, monkeypatch):
+    outbox = SimpleNamespace(wakeup=threading.Event())
+    monkeypatch.setattr(app, "get_outbox", lambda: outbox)
+    assert app.send_merge_batch(batch()) == 2
+    assert count(store, app.SENT_TABLE) == count(store, app.OUTBOX_TABLE) == 2
+    assert outbox.wakeup.is_set()
+
+
+def test_failed_queueing_rolls_back_the_sent_log(store, monkeypatch):
+    def refuse(conn, account, jobs):
+        raise RuntimeError("outbox unavailable")
+    monkeypatch.setattr(app.Outbox, "insert_jobs", staticmethod(refuse))
+    with pytest.raises(RuntimeError):
+        app.send_merge_batch(batch())
+    assert count(store, app.SENT_TABLE) == count(store, app.OUTBOX_TABLE) == 0
+
+
+def test_batch_key_ignores_timestamps_but_not_content():
+    first, second = batch(), batch()
+    for record in second:
+        record['timestamp'] = "later"
+    assert app.merge_batch_key(first) == app.merge_batch_key(second)
+    second[0]['body'] = "Goodbye"
+    assert app.merge_batch_key(first) != app.merge_batch_key(second)
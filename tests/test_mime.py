@@ -0,0 +1,43 @@
+import email
+from email import policy
+from io import BytesIO
+
+from app import build_mime_message
+
+
+class Upload(BytesIO):
+    """Stands in for a Streamlit UploadedFile."""
+
+    def __init__(self, name, data, type=None):
+        super().__init__(data)
+        self.name = name
+        self.type = type
+
+
+def parse(raw):
+    return email.message_from_bytes(bytes(raw), policy=policy.default)
+
+
+def test_html_body_and_attachments_round_trip():
+    report = bytes(range(256)) * 301  # not a multiple of 3, and many base64 lines long
+    raw = build_mime_message(
+        "me@example.com", "you@example.com", "Quarterly report", "<p>Hello <b>there</b></p>", "HTML",
+        "boss@example.com", [Upload("report.pdf", report, "application/pdf"), Upload("notes.txt", b"plain notes\n")],
+    )
+    msg = parse(raw)
+    assert (msg["From"], msg["To"], msg["Cc"], msg["Subject"]) == (
+        "me@example.com", "you@example.com", "boss@example.com", "Quarterly report")
+    assert msg.get_body(("plain",)).get_content().strip() == "Hello there"
+    assert msg.get_body(("html",)).get_content().strip() == "<p>Hello <b>there</b></p>"
+    attachments = {part.get_filename(): part for part in msg.iter_attachments()}
+    assert attachments["report.pdf"].get_content_type() == "application/pdf"
+    assert attachments["report.pdf"].get_payload(decode=True) == report
+    assert attachments["notes.txt"].get_content_type() == "text/plain"
+    assert attachments["notes.txt"].get_payload(decode=True) == b"plain notes\n"
+
+
+def test_plain_text_without_attachments():
+    msg = parse(build_mime_message("me@example.com", "you@example.com", "Hi", "Just text"))
+    assert msg.get_content_type() == "text/plain"
+    assert msg.get_content().strip() == "Just text"
+    assert msg["Cc"] is None
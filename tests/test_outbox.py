@@ -0,0 +1,23 @@
+import smtplib
+import socket
+
+import pytest
+
+from app import _is_transient_smtp_error
+
+
+@pytest.mark.parametrize("error, transient", [
+    (smtplib.SMTPServerDisconnected("Connection unexpectedly closed"), True),
+    (smtplib.SMTPResponseException(421, b"Service not available"), True),
+    (smtplib.SMTPDataError(451, b"Try again later"), True),
+    (smtplib.SMTPAuthenticationError(535, b"Username and Password not accepted"), False),
+    (smtplib.SMTPSenderRefused(550, b"Sender rejected", "me@example.com"), False),
+    (smtplib.SMTPRecipientsRefused({"a@example.com": (450, b"Mailbox busy")}), True),
+    (smtplib.SMTPRecipientsRefused({"a@example.com": (450, b"Mailbox busy"), "b@example.com": (550, b"No such user")}), False),
+    (smtplib.SMTPNotSupportedError("SMTPUTF8 not supported"), False),
+    (ConnectionRefusedError(), True),
+    (socket.timeout("timed out"), True),
+    (ValueError("bad message"), False),
+])
+def test_retry_classification(error, transient):
+    assert _is_transient_smtp_error(error) is transient
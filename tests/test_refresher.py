@@ -0,0 +1,25 @@
+import pandas as pd
+
+import app
+from benchmarks.pipeline import SHEET_HEADERS
+from benchmarks.sheets_standin import WorksheetStandIn
+
+
+def test_unmodified_sheet_is_neither_read_nor_snapshotted(monkeypatch):
+    snapshots = []
+    monkeypatch.setattr(app, "save_snapshot", lambda df, sync_state, sheet_id: snapshots.append(len(df)))
+    frame = pd.concat(list(app.iter_mock_chunks(30, seed=3))).rename(columns=SHEET_HEADERS)
+    sheet = WorksheetStandIn.from_frame(frame)
+    refresher = app.SheetRefresher(lambda: sheet, "sheet", app.DatasetCache(), interval=0)
+
+    assert refresher.refresh()
+    sheet.calls.clear()
+    assert not refresher.refresh()
+    assert sheet.calls == ["get_lastUpdateTime"]
+    assert snapshots == [30]
+
+    sheet.values[1][0] = "Someone else"
+    sheet.revision += 1
+    assert refresher.refresh()
+    assert snapshots == [30, 30]
+    assert refresher.current()[1].df['sender name'].iloc[0] == "Someone else"
@@ -0,0 +1,76 @@
+import pandas as pd
+
+from app import DatasetCache, SearchIndex, ensure_search_index, start_search_index
+
+
+def inbox(*rows):
+    return pd.DataFrame([
+        {'subject': subject, 'summary': summary, 'aireply': '', 'sender name': 'Ann', 'sender email': 'ann@example.com'}
+        for subject, summary in rows
+    ])
+
+
+def built(df):
+    index = SearchIndex()
+    index.sync(df)
+    return index
+
+
+def test_ranks_by_bm25_with_prefix_on_the_last_term():
+    df = inbox(("Budget approval", "Please approve the budget budget"),
+               ("Lunch", "budget for lunch"),
+               ("Report", "quarterly numbers"))
+    index = built(df)
+    assert index.search("budget").tolist() == [0, 1]
+    assert index.search("quart").tolist() == [2]
+    assert index.search("lunch budg").tolist()[0] == 1
+    assert index.search("nothing").tolist() == []
+
+
+def test_incremental_sync_matches_a_fresh_build():
+    df = inbox(("Budget approval", "Please approve the budget"), ("Lunch", "budget for lunch"), ("Report", "numbers"))
+    index = built(df)
+    changed = df.copy()
+    changed.loc[1, 'summary'] = "zebra sighting"
+    grown = pd.concat([changed, inbox(("Zebra", "more zebra news"))], ignore_index=True)
+    assert index.sync(grown) == 2
+    fresh = built(grown)
+    for query in ["budget", "zebra", "lunch", "numbers"]:
+        assert index.search(query).tolist() == fresh.search(query).tolist(), query
+    assert index.search("budget").tolist() == [0]
+
+    assert index.sync(grown.iloc[:2]) == 0
+    assert index.search("zebra").tolist() == [1]
+
+
+def test_copy_syncs_without_touching_the_original():
+    df = inbox(("Budget", "numbers"), ("Lunch", "friday"))
+    index = built(df)
+    clone = index.copy()
+    changed = df.copy()
+    changed.loc[0, 'summary'] = "giraffes everywhere"
+    clone.sync(changed)
+    assert clone.search("giraffes").tolist() == [0]
+    assert index.search("giraffes").tolist() == []
+    assert index.search("numbers").tolist() == [0]
+
+
+def test_index_builds_in_the_background_and_serves_once_ready():
+    cache = DatasetCache()
+    df = inbox(("Budget", "numbers"), ("Lunch", "friday"))
+    entry = cache.acquire("scope", df).entry
+    start_search_index(entry)
+    assert ensure_search_index(entry).search("lunch").tolist() == [1]
+    assert entry.search_synced
+
+
+def test_acquire_does_not_wait_for_a_parent_still_indexing():
+    cache = DatasetCache()
+    df = inbox(("Budget", "numbers"), ("Lunch", "friday"))
+    parent = cache.acquire("scope", df).entry
+    changed = df.copy()
+    changed.loc[0, 'summary'] = "giraffes"
+    with parent.search_lock:
+        child = cache.acquire("scope", changed, parent=parent).entry
+    assert child.search_index is None
+    assert ensure_search_index(child).search("giraffes").tolist() == [0]
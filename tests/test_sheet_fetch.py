@@ -0,0 +1,43 @@
+import pytest
+
+from app import fetch_sheet_values
+from benchmarks.sheets_standin import WorksheetStandIn
+
+HEADER = ["Sender Name", "Subject"]
+
+
+def sheet(rows):
+    return WorksheetStandIn([list(HEADER)] + [list(row) for row in rows])
+
+
+def test_ranges_stay_inside_the_grid():
+    worksheet = sheet([[f"sender {i}", f"subject {i}"] for i in range(10)])
+    header, columns, _ = fetch_sheet_values(worksheet, chunk_rows=3, max_workers=2)
+    assert header == HEADER
+    assert list(columns[0]) == [f"sender {i}" for i in range(10)]
+    assert list(columns[1]) == [f"subject {i}" for i in range(10)]
+
+
+def test_no_reads_past_a_full_last_range():
+    worksheet = sheet([["a", "b"]] * 6)
+    fetch_sheet_values(worksheet, chunk_rows=3, max_workers=4)
+    assert worksheet.calls.count("batch_get") == 2
+
+
+def test_rows_added_after_the_handle_was_opened_are_read():
+    worksheet = sheet([["a", "b"]] * 4)
+    assert len(fetch_sheet_values(worksheet, chunk_rows=3)[2]) == 4
+    worksheet.values.extend([["c", "d"]] * 5)
+    assert len(fetch_sheet_values(worksheet, chunk_rows=3)[2]) == 9
+
+
+def test_trailing_blank_rows_are_dropped_and_inner_ones_kept():
+    worksheet = sheet([["a", "b"], ["", ""], ["c", "d"], ["", ""], ["", ""]])
+    _, columns, _ = fetch_sheet_values(worksheet, chunk_rows=2)
+    assert list(columns[0]) == ["a", "", "c"]
+
+
+def test_standin_rejects_reads_past_the_grid():
+    worksheet = sheet([["a", "b"]])
+    with pytest.raises(ValueError, match="exceeds grid limits"):
+        worksheet.batch_get(["A2:B3"])
@@ -0,0 +1,69 @@
+import pandas as pd
+import pytest
+
+import app
+from benchmarks.pipeline import SHEET_HEADERS
+from benchmarks.sheets_standin import WorksheetStandIn
+
+
+def sheet_frame(rows, seed):
+    return pd.concat(list(app.iter_mock_chunks(rows, seed=seed))).rename(columns=SHEET_HEADERS)
+
+
+def load(sheet):
+    return app.load_data_from_gsheet(None, worksheet=sheet)
+
+
+def assert_same_inbox(merged, full):
+    # set_dataset applies the schema to both before they are shown.
+    pd.testing.assert_frame_equal(app.apply_inbox_schema(merged)[0], app.apply_inbox_schema(full)[0])
+
+
+@pytest.fixture
+def sheet():
+    return WorksheetStandIn.from_frame(sheet_frame(40, seed=1))
+
+
+def test_merged_sync_matches_a_full_load(sheet):
+    df = load(sheet)
+    subject = sheet.values[0].index("Subject")
+    sheet.values[4][subject] = "Edited subject"
+    sheet.values.extend(WorksheetStandIn.from_frame(sheet_frame(5, seed=2)).values[1:])
+    sheet.revision += 1
+
+    merged, stats = app.sync_data_from_gsheet(None, df, worksheet=sheet)
+    assert stats == {'appended': 5, 'changed': 1}
+    assert_same_inbox(merged, load(sheet))
+
+
+def test_unmodified_sheet_is_not_read(sheet):
+    df = load(sheet)
+    sheet.calls.clear()
+    merged, stats = app.sync_data_from_gsheet(None, df, worksheet=sheet)
+    assert merged is df and stats['unmodified']
+    assert "batch_get" not in sheet.calls
+
+
+def test_removed_rows_reload_from_the_same_read(sheet):
+    df = load(sheet)
+    del sheet.values[10:15]
+    sheet.revision += 1
+    sheet.calls.clear()
+
+    merged, stats = app.sync_data_from_gsheet(None, df, worksheet=sheet)
+    assert stats['reloaded'] == 35
+    assert sheet.calls.count("row_values") == 1
+    assert_same_inbox(merged, load(sheet))
+
+
+def test_failed_sync_keeps_the_current_inbox(sheet, monkeypatch):
+    df = load(sheet)
+    sync_state = dict(app.st.session_state['sheet_sync'])
+    sheet.revision += 1
+
+    def unavailable(ranges):
+        raise ConnectionError("Sheets API unavailable")
+    monkeypatch.setattr(sheet, "batch_get", unavailable)
+    merged, stats = app.sync_data_from_gsheet(None, df, worksheet=sheet)
+    assert merged is df and stats is None
+    assert app.st.session_state['sheet_sync'] == sync_state
@@ -0,0 +1,22 @@
+import pandas as pd
+import pytest
+
+from app import compile_template, render_merge
+
+TEMPLATE = "Dear {{sender name|there}}, about {{ subject }}: {{priority|normal}} priority."
+
+
+def test_vectorized_merge_matches_the_compiled_template():
+    df = pd.DataFrame({
+        'sender name': ['Ann', '', None],
+        'subject': ['Budget', 'Lunch', 3.5],
+        'priority': ['high', None, ''],
+    })
+    render = compile_template(TEMPLATE)
+    assert render_merge(df, TEMPLATE).tolist() == [render(row) for row in df.to_dict('records')]
+    assert render_merge(df, TEMPLATE).iloc[1] == "Dear there, about Lunch: normal priority."
+
+
+def test_unknown_placeholder_is_rejected():
+    with pytest.raises(ValueError, match="missing"):
+        render_merge(pd.DataFrame({'subject': ['x']}), "{{missing}}")
@@ -0,0 +1,64 @@
+from app import SheetWriteBuffer, fetch_sheet_values, sheet_row_identities
+from benchmarks.sheets_standin import WorksheetStandIn
+
+HEADER = ["Sender Name", "Sender Email", "Subject", "Summary"]
+ANN_BUDGET = ["Ann", "ann@example.com", "Budget", "Q3 numbers"]
+ANN_LUNCH = ["Ann", "ann@example.com", "Lunch", "Friday?"]
+BOB_REPORT = ["Bob", "bob@example.com", "Report", "Attached"]
+
+
+def load(*rows):
+    worksheet = WorksheetStandIn([list(HEADER)] + [list(row) for row in rows])
+    header, columns, _ = fetch_sheet_values(worksheet)
+    return worksheet, header, sheet_row_identities(header, columns)
+
+
+def draft_of(worksheet, row):
+    col = worksheet.values[0].index("Draft")
+    cells = worksheet.values[row - 1]
+    return cells[col] if col < len(cells) else ""
+
+
+def test_writes_to_the_loaded_row_and_adds_the_column():
+    worksheet, header, identities = load(ANN_BUDGET, ANN_LUNCH)
+    writer = SheetWriteBuffer(lambda: worksheet)
+    writer.stage(header, [(3, identities[1], 'draft', "See you then")])
+    assert writer.flush() == 1
+    assert worksheet.values[0][len(HEADER)] == "Draft"
+    assert draft_of(worksheet, 3) == "See you then"
+    assert worksheet.col_count == len(HEADER) + 1
+
+
+def test_follows_a_row_moved_by_an_insert():
+    worksheet, header, identities = load(ANN_BUDGET, ANN_LUNCH)
+    worksheet.values.insert(1, ["Cat", "cat@example.com", "Hello", "New row"])
+    writer = SheetWriteBuffer(lambda: worksheet)
+    writer.stage(header, [(3, identities[1], 'draft', "See you then")])
+    assert writer.flush() == 1
+    assert draft_of(worksheet, 4) == "See you then"
+    assert draft_of(worksheet, 3) == ""
+    assert writer.conflicts == 0
+
+
+def test_same_sender_name_is_not_mistaken_for_the_row():
+    worksheet, header, identities = load(ANN_BUDGET, ANN_LUNCH)
+    del worksheet.values[1]
+    writer = SheetWriteBuffer(lambda: worksheet)
+    writer.stage(header, [(2, identities[0], 'draft', "Numbers attached")])
+    assert writer.flush() == 0
+    assert "Draft" not in worksheet.values[0]
+    assert writer.conflicts == 1
+    assert list(writer.dropped) == [(2, 'draft')]
+
+
+def test_ambiguous_relocation_is_dropped():
+    worksheet, header, identities = load(ANN_BUDGET, BOB_REPORT)
+    worksheet.values.insert(1, list(BOB_REPORT))
+    writer = SheetWriteBuffer(lambda: worksheet)
+    writer.stage(header, [(3, identities[1], 'draft', "Thanks")])
+    writer.stage(header, [(2, identities[0], 'draft', "Numbers attached")])
+    assert writer.flush() == 1
+    assert draft_of(worksheet, 3) == "Numbers attached"
+    assert writer.conflicts == 1
+    writer.clear_conflicts()
+    assert writer.conflicts == 0 and not writer.dropped